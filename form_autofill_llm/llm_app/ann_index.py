@@ -0,0 +1,319 @@
+# ann_index.py - Inverted-file (IVF) approximate nearest-neighbour index
+import logging
+import math
+from typing import AbstractSet, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from cow_dict import CowDict
+from quantization import Float32Quantizer
+
+logger = logging.getLogger(__name__)
+
+# (doc_id, chunk vectors, precomputed list per chunk or None)
+DocVectors = Tuple[str, np.ndarray, Optional[np.ndarray]]
+
+# Rows assigned to centroids per matrix product while adding or training
+ASSIGN_BATCH = 16384
+
+# Share of the lists a query scans unless nprobe is set
+PROBE_FRACTION = 0.1
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Nearest centroid (by inner product) of every row"""
+    lists = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), ASSIGN_BATCH):
+        block = vectors[start:start + ASSIGN_BATCH]
+        lists[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return lists
+
+
+def spherical_kmeans(vectors: np.ndarray, clusters: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """k-means on unit vectors with re-normalized centroids (cosine similarity)"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), clusters, replace=False)].copy()
+    for _ in range(iterations):
+        lists = _assign(vectors, centroids)
+        order = np.argsort(lists, kind='stable')
+        counts = np.bincount(lists, minlength=clusters)
+        filled = np.flatnonzero(counts)
+        sums = np.add.reduceat(vectors[order], np.concatenate([[0], np.cumsum(counts)[:-1]])[filled], axis=0)
+        centroids[filled] = sums
+        # Re-seed empty clusters with random points
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        centroids /= np.where(norms == 0, 1, norms)
+    return np.ascontiguousarray(centroids, dtype=np.float32)
+
+
+class IVFIndex:
+    """Approximate cosine search over unit vectors grouped by k-means centroid
+
+    Every vector lives in the inverted list of its nearest centroid, stored
+    contiguously with the (document, chunk position) it belongs to. A query
+    is compared with the centroids and scans only the nprobe closest
+    lists, so latency depends on nprobe rather than corpus size; raising
+    nprobe trades speed for recall. By default a query scans
+    PROBE_FRACTION of the lists; callers that measured recall (see
+    EmbeddingIndex) set nprobe and record the result in recall.
+
+    Documents are inserted and removed incrementally: an update rewrites
+    only the lists it touches, so copies made per generation keep sharing
+    every other list (and the per-document tables are CowDicts). Centroids
+    are retrained (see needs_training) once the corpus has grown or shrunk
+    well past the size they were trained on.
+
+    Lists hold the vectors encoded by quantizer (see quantization.py);
+    with a lossy one, scores are approximate and callers rescore.
+    """
+
+    def __init__(self, nprobe: Optional[int] = None, nlist: Optional[int] = None, iterations: int = 10,
+                 seed: int = 0, quantizer=None):
+        self.nprobe = nprobe
+        # recall@k against exact search at nprobe, if it was measured
+        self.recall: Optional[float] = None
+        self.nlist = nlist
+        self.iterations = iterations
+        self.seed = seed
+        self.quantizer = quantizer or Float32Quantizer()
+        self.centroids: Optional[np.ndarray] = None
+        self.trained_size = 0
+
+        # Per inverted list: document numbers, chunk positions and vector codes
+        self.list_docs: List[np.ndarray] = []
+        self.list_positions: List[np.ndarray] = []
+        self.list_vectors: List[np.ndarray] = []
+        self.list_scales: List[Optional[np.ndarray]] = []
+        # doc_id -> inverted list of each of its chunks
+        self.doc_lists: CowDict = CowDict()
+        self.doc_numbers: CowDict = CowDict()
+        # Append-only, so copies share it; numbers a copy never assigned are never read
+        self.doc_names: List[str] = []
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def copy(self) -> "IVFIndex":
+        """Copy that shares every inverted list until an update replaces it"""
+        clone = IVFIndex(self.nprobe, self.nlist, self.iterations, self.seed, self.quantizer)
+        clone.recall = self.recall
+        clone.centroids = self.centroids
+        clone.trained_size = self.trained_size
+        clone.list_docs = list(self.list_docs)
+        clone.list_positions = list(self.list_positions)
+        clone.list_vectors = list(self.list_vectors)
+        clone.list_scales = list(self.list_scales)
+        clone.doc_lists = self.doc_lists.copy()
+        clone.doc_numbers = self.doc_numbers.copy()
+        clone.doc_names = self.doc_names
+        clone.size = self.size
+        return clone
+
+    @staticmethod
+    def list_count(size: int) -> int:
+        """Default number of inverted lists: about sqrt(size)"""
+        return max(1, min(4096, int(math.sqrt(size))))
+
+    def probe_count(self) -> int:
+        """Lists scanned per query: nprobe, or PROBE_FRACTION of the lists"""
+        lists = len(self.centroids) if self.centroids is not None else 1
+        return max(1, min(self.nprobe or math.ceil(PROBE_FRACTION * lists), lists))
+
+    def training_size(self, size: int) -> int:
+        """How many sample vectors train() should get for a corpus of this size"""
+        return min(size, 40 * (self.nlist or self.list_count(size)))
+
+    def needs_training(self, size: int) -> bool:
+        """True before the first training and once size drifts 2x from it"""
+        return self.centroids is None or size > 2 * self.trained_size or size < self.trained_size // 2
+
+    def train(self, sample: np.ndarray, size: int):
+        """Fit centroids to a sample of unit vectors and empty every list"""
+        nlist = min(self.nlist or self.list_count(size), len(sample))
+        self.centroids = spherical_kmeans(sample, nlist, self.iterations, self.seed)
+        self.trained_size = size
+        self._clear()
+
+    def _clear(self):
+        nlist, dimension = self.centroids.shape
+        codes, scales = self.quantizer.encode(np.zeros((0, dimension), dtype=np.float32))
+        self.list_docs = [np.zeros(0, dtype=np.int32) for _ in range(nlist)]
+        self.list_positions = [np.zeros(0, dtype=np.int32) for _ in range(nlist)]
+        self.list_vectors = [codes] * nlist
+        self.list_scales = [scales] * nlist
+        self.doc_lists = CowDict()
+        self.doc_numbers = CowDict()
+        self.doc_names = []
+        self.size = 0
+
+    def nbytes(self) -> int:
+        """Memory held by the encoded vectors and their references"""
+        return sum(codes.nbytes + docs.nbytes + positions.nbytes + (scales.nbytes if scales is not None else 0)
+                   for codes, scales, docs, positions in zip(self.list_vectors, self.list_scales,
+                                                             self.list_docs, self.list_positions))
+
+    def _doc_number(self, doc_id: str) -> int:
+        number = self.doc_numbers.get(doc_id)
+        if number is None:
+            number = self.doc_numbers[doc_id] = len(self.doc_names)
+            self.doc_names.append(doc_id)
+        return number
+
+    def update(self, removed: Iterable[str] = (), added: Iterable[DocVectors] = ()):
+        """Remove documents, then insert documents' chunk vectors
+
+        added may be a generator; it is consumed in batches so a full build
+        never holds more than the finished lists plus one batch.
+        """
+        dropped: Dict[int, List[int]] = {}
+        for doc_id in removed:
+            lists = self.doc_lists.pop(doc_id, None)
+            if lists is None:
+                continue
+            self.size -= len(lists)
+            for list_id in np.unique(lists):
+                dropped.setdefault(int(list_id), []).append(self.doc_numbers[doc_id])
+
+        pieces: Dict[int, List[Tuple]] = {}
+        batch, rows = [], 0
+        for item in added:
+            batch.append(item)
+            rows += len(item[1])
+            if rows >= ASSIGN_BATCH:
+                self._add_batch(batch, pieces)
+                batch, rows = [], 0
+        if batch:
+            self._add_batch(batch, pieces)
+
+        for list_id in set(dropped) | set(pieces):
+            docs = [self.list_docs[list_id]]
+            positions = [self.list_positions[list_id]]
+            vectors = [self.list_vectors[list_id]]
+            scales = [self.list_scales[list_id]]
+            if list_id in dropped:
+                keep = ~np.isin(docs[0], dropped[list_id])
+                docs, positions, vectors = [docs[0][keep]], [positions[0][keep]], [vectors[0][keep]]
+                scales = [scales[0][keep] if scales[0] is not None else None]
+            for piece_docs, piece_positions, piece_vectors, piece_scales in pieces.get(list_id, ()):
+                docs.append(piece_docs)
+                positions.append(piece_positions)
+                vectors.append(piece_vectors)
+                scales.append(piece_scales)
+            self.list_docs[list_id] = np.concatenate(docs)
+            self.list_positions[list_id] = np.concatenate(positions)
+            self.list_vectors[list_id] = np.ascontiguousarray(np.concatenate(vectors))
+            self.list_scales[list_id] = np.concatenate(scales) if scales[0] is not None else None
+
+    def _add_batch(self, batch: List[DocVectors], pieces: Dict[int, List]):
+        """Assign a batch of documents' vectors and queue them per list"""
+        vectors = np.vstack([doc_vectors for _, doc_vectors, _ in batch]).astype(np.float32, copy=False)
+        if all(lists is not None for _, _, lists in batch):
+            lists = np.concatenate([lists for _, _, lists in batch]).astype(np.int32)
+        else:
+            lists = _assign(vectors, self.centroids)
+
+        numbers, positions, offset = [], [], 0
+        for doc_id, doc_vectors, _ in batch:
+            count = len(doc_vectors)
+            self.doc_lists[doc_id] = lists[offset:offset + count]
+            numbers.append(np.full(count, self._doc_number(doc_id), dtype=np.int32))
+            positions.append(np.arange(count, dtype=np.int32))
+            offset += count
+        self.size += offset
+        numbers = np.concatenate(numbers)
+        positions = np.concatenate(positions)
+
+        codes, scales = self.quantizer.encode(vectors)
+        order = np.argsort(lists, kind='stable')
+        sorted_lists = lists[order]
+        starts = np.flatnonzero(np.r_[True, sorted_lists[1:] != sorted_lists[:-1]])
+        ends = np.r_[starts[1:], len(order)]
+        for start, end in zip(starts, ends):
+            rows = order[start:end]
+            pieces.setdefault(int(sorted_lists[start]), []).append(
+                (numbers[rows], positions[rows], codes[rows], scales[rows] if scales is not None else None)
+            )
+
+    def search_many(self, queries: np.ndarray, top_k: int, nprobe: Optional[int] = None,
+                    doc_ids: Optional[AbstractSet[str]] = None) -> List[List[Tuple[float, str, int]]]:
+        """Approximate (score, doc_id, chunk position) top_k for unit query vectors
+
+        Queries probing the same list are scored together with one matrix
+        product. With doc_ids, chunks of other documents are skipped, so a
+        narrow scope can return fewer than top_k hits. Scores come from the
+        quantizer, so they are only comparable with each other.
+        """
+        results: List[List[Tuple[float, str, int]]] = [[] for _ in range(len(queries))]
+        if self.centroids is None or not self.size or top_k <= 0 or not len(queries):
+            return results
+
+        allowed = None
+        if doc_ids is not None:
+            allowed = np.array([self.doc_numbers[doc_id] for doc_id in doc_ids
+                                if doc_id in self.doc_lists], dtype=np.int32)
+            if not len(allowed):
+                return results
+
+        nprobe = max(1, min(nprobe or self.probe_count(), len(self.centroids)))
+        coarse = queries @ self.centroids.T
+        probes = np.argpartition(-coarse, nprobe - 1, axis=1)[:, :nprobe]
+        by_list: Dict[int, List[int]] = {}
+        for query, lists in enumerate(probes.tolist()):
+            for list_id in lists:
+                by_list.setdefault(list_id, []).append(query)
+
+        candidates: List[List[Tuple[np.ndarray, int, np.ndarray]]] = [[] for _ in range(len(queries))]
+        for list_id, members in by_list.items():
+            vectors = self.list_vectors[list_id]
+            if not len(vectors):
+                continue
+            scores = self.quantizer.scores(vectors, self.list_scales[list_id], queries[members])
+            rows = np.arange(len(vectors))
+            if allowed is not None:
+                mask = np.isin(self.list_docs[list_id], allowed)
+                if not mask.any():
+                    continue
+                scores, rows = scores[mask], rows[mask]
+            # Only each list's own top_k can make a query's overall top_k
+            top = np.argpartition(-scores, top_k - 1, axis=0)[:top_k] if top_k < len(rows) else None
+            for column, query in enumerate(members):
+                picked = slice(None) if top is None else top[:, column]
+                candidates[query].append((scores[picked, column], list_id, rows[picked]))
+
+        for query, found in enumerate(candidates):
+            if not found:
+                continue
+            scores = np.concatenate([piece[0] for piece in found])
+            lists = np.concatenate([np.full(len(piece[0]), piece[1], dtype=np.int32) for piece in found])
+            rows = np.concatenate([piece[2] for piece in found])
+            best = np.argsort(-scores, kind='stable')[:top_k]
+            results[query] = [
+                (float(scores[i]),
+                 self.doc_names[self.list_docs[lists[i]][rows[i]]],
+                 int(self.list_positions[lists[i]][rows[i]]))
+                for i in best
+            ]
+        return results
+
+    def export(self) -> Dict:
+        """Centroids and per-document list assignments; vectors are saved separately"""
+        return {
+            'centroids': self.centroids,
+            'trained_size': self.trained_size,
+            'nprobe': self.nprobe,
+            'recall': self.recall,
+            'doc_lists': dict(self.doc_lists.items())
+        }
+
+    def restore(self, state: Dict, documents: Iterable[DocVectors]):
+        """Rebuild the lists from saved assignments without re-running k-means"""
+        self.centroids = np.asarray(state['centroids'], dtype=np.float32)
+        self.trained_size = state['trained_size']
+        self.nprobe = state['nprobe']
+        self.recall = state['recall']
+        self._clear()
+        self.update(added=documents)
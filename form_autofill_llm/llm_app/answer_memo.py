@@ -0,0 +1,127 @@
+# answer_memo.py - Per-field memo of accepted LLM answers shared across forms
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+
+from text_utils import TOKEN_PATTERN
+
+# Confidence of an LLM answer found verbatim in the context it was given
+GROUNDED_CONFIDENCE = 1.0
+# Confidence of an answer the LLM inferred (yes/no, rephrased, invented)
+INFERRED_CONFIDENCE = 0.5
+# Added each time a later, independent LLM call gives the same answer
+AGREEMENT_CONFIDENCE = 0.25
+
+
+def memo_key(label: str) -> str:
+    """Every word of a label in order; punctuation and required markers ("*", ":") are dropped
+
+    Unlike the index terms, stopwords are kept: "Do you require
+    sponsorship?" and "Do you not require sponsorship?" must not share
+    an answer.
+    """
+    return " ".join(TOKEN_PATTERN.findall(label.lower()))
+
+
+def is_grounded(value: Any, context: str) -> bool:
+    """Whether every word of value appears, in order and adjacent, in context
+
+    Punctuation and case are ignored, so "555-0100" is found in
+    "Phone: (555) 0100" but "Yes" is not found in "I hold a green card".
+    """
+    words = TOKEN_PATTERN.findall(str(value).lower())
+    if not words or not context:
+        return False
+    return f" {' '.join(words)} " in f" {' '.join(TOKEN_PATTERN.findall(context.lower()))} "
+
+
+class FieldAnswerMemo:
+    """Normalized field label -> last LLM answer and how far it can be trusted
+
+    Each answer remembers the corpus hash and model it was derived from
+    and is only served for exactly those, so a document change or model
+    switch sends the field back to the LLM. Long free-text answers (cover
+    letters, "why this company") are usually specific to one form and are
+    not memoized. Bounded LRU; entries of an older corpus are dropped when
+    RAGManager publishes a new one.
+
+    Every entry records its source and a confidence, and lookup() only
+    serves entries of at least min_confidence. An answer found in the
+    documents the LLM was shown starts fully trusted. An inferred answer
+    starts below the bar and is only served once later LLM calls have
+    given the same answer again, so one bad guess is never replayed
+    into every later form. A different answer replaces the entry and
+    starts over.
+    """
+
+    def __init__(self, max_entries: int = 2048, max_value_chars: int = 200,
+                 min_confidence: float = 0.75):
+        self.max_entries = max_entries
+        self.max_value_chars = max_value_chars
+        self.min_confidence = min_confidence
+        self.entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.unconfirmed = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def lookup(self, fields, corpus_hash: str, model: str) -> Dict[str, Any]:
+        """Memoized answers for whichever of the fields have one"""
+        answers = {}
+        for name in fields:
+            key = memo_key(name)
+            entry = self.entries.get(key)
+            if entry is None or entry['corpus_hash'] != corpus_hash or entry['model'] != model:
+                continue
+            if entry['confidence'] < self.min_confidence:
+                self.unconfirmed += 1
+                continue
+            self.entries.move_to_end(key)
+            answers[name] = entry['value']
+        self.hits += len(answers)
+        self.misses += len(fields) - len(answers)
+        return answers
+
+    def remember(self, answers: Dict[str, Any], corpus_hash: str, model: str,
+                 grounded: Optional[Iterable[str]] = None, source: str = "llm"):
+        """Record LLM answers; grounded names the fields whose answer was found in the context
+
+        Empty and long free-text answers are skipped.
+        """
+        if self.max_entries <= 0:
+            return
+        grounded = set(grounded or ())
+        for name, value in answers.items():
+            key = memo_key(name)
+            if not key or value in (None, "") or len(str(value)) > self.max_value_chars:
+                continue
+            confidence = GROUNDED_CONFIDENCE if name in grounded else INFERRED_CONFIDENCE
+            entry = self.entries.get(key)
+            if (entry is not None and entry['value'] == value
+                    and entry['corpus_hash'] == corpus_hash and entry['model'] == model):
+                # The same answer again from an independent call
+                confidence = max(confidence, min(1.0, entry['confidence'] + AGREEMENT_CONFIDENCE))
+            self.entries[key] = {'value': value, 'corpus_hash': corpus_hash, 'model': model,
+                                 'source': source, 'confidence': confidence}
+            self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def on_publish(self, generation):
+        """RAGManager publish listener: forget answers derived from an older corpus"""
+        corpus_hash = generation.corpus_hash()
+        for key in [key for key, entry in self.entries.items() if entry['corpus_hash'] != corpus_hash]:
+            del self.entries[key]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'max_entries': self.max_entries,
+            'field_hits': self.hits,
+            'field_misses': self.misses,
+            'unconfirmed_skips': self.unconfirmed,
+            'min_confidence': self.min_confidence,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+        }
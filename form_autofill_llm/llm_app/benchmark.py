@@ -0,0 +1,354 @@
+# benchmark.py - Retrieval benchmark over synthetic markdown corpora
+"""
+Generates synthetic profile/docs corpora and times the RAG pipeline on them:
+cold indexing, warm restart from the snapshot, incremental reload, chunking
+throughput and query latency (p50/p99), plus recall of planted facts and,
+for embedding retrieval, recall of the vector search against exact search.
+
+Usage:
+    python benchmark.py                          # 10, 1k and 100k chunks
+    python benchmark.py --sizes 10,1000,100000,1000000 --output bench.json
+    python benchmark.py --retrieval embedding    # hashing embedder, no Ollama
+    python benchmark.py --retrieval embedding --nprobe 32   # IVF recall/latency trade-off
+    python benchmark.py --retrieval embedding --recall-tolerance 0.1
+    python benchmark.py --retrieval embedding --quantization int8
+
+Results are printed (or written to --output) as JSON, one entry per size.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from rag_manager import RAGManager
+from text_utils import tokenize
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIZES = [10, 1000, 100000]
+
+# Every section sits under its own heading, so it becomes exactly one chunk
+SECTIONS_PER_FILE = 20
+FILES_PER_DIR = 500
+WORDS_PER_SECTION = 40
+
+FILLER_WORDS = (
+    "project team design build deploy service client data model review test "
+    "python javascript api cloud pipeline analysis report research support "
+    "customer schedule budget training safety quality process system network "
+    "database security field survey trail maintenance community volunteer"
+).split()
+
+PROFILE_FACTS = [
+    ("Full Name", "Jordan Rivera"),
+    ("Email", "jordan.rivera@example.com"),
+    ("Phone", "555-010-2030"),
+    ("Zip Code", "32119"),
+    ("LinkedIn", "https://www.linkedin.com/in/jordan-rivera"),
+]
+
+
+def _random_word(rng: random.Random, length: int = 8) -> str:
+    return "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(length))
+
+
+def _section(rng: random.Random, title: str, fact: Optional[Tuple[str, str]] = None) -> str:
+    words = " ".join(rng.choice(FILLER_WORDS) for _ in range(WORDS_PER_SECTION))
+    lines = [f"## {title}", words]
+    if fact:
+        lines.append(f"- **{fact[0]}**: {fact[1]}")
+    return "\n".join(lines) + "\n"
+
+
+def generate_corpus(root: Path, chunks: int, facts: int, seed: int = 0) -> Dict[str, Any]:
+    """Write a synthetic corpus of about `chunks` chunks under root
+
+    One profile document carries the usual personal details; the rest are
+    docs files spread over nested directories. `facts` unique key/value
+    facts are planted in random sections and returned as the ground truth
+    for recall.
+    """
+    rng = random.Random(seed)
+    root.mkdir(parents=True, exist_ok=True)
+
+    profile = ["# User Information\n", "## Personal Details"]
+    profile.extend(f"- **{key}**: {value}" for key, value in PROFILE_FACTS)
+    (root / "profile.md").write_text("\n".join(profile) + "\n", encoding="utf-8")
+
+    sections = max(chunks - 1, 0)
+    facts = min(facts, sections)
+    planted_at = dict(zip(rng.sample(range(sections), facts), range(facts)))
+    planted = []
+
+    files = []
+    for file_no, start in enumerate(range(0, sections, SECTIONS_PER_FILE)):
+        parts = [f"# Document {file_no}\n"]
+        for section_no in range(start, min(start + SECTIONS_PER_FILE, sections)):
+            fact = None
+            if section_no in planted_at:
+                key = f"{_random_word(rng)} {_random_word(rng)} code"
+                value = f"PV-{planted_at[section_no]:06d}"
+                fact = (key, value)
+                planted.append({'key': key, 'value': value})
+            parts.append(_section(rng, f"Section {section_no}", fact))
+
+        path = root / f"dir{file_no // FILES_PER_DIR:04d}" / f"doc{file_no:06d}.md"
+        path.parent.mkdir(exist_ok=True)
+        path.write_text("\n".join(parts), encoding="utf-8")
+        files.append(path)
+
+    return {'files': files, 'planted': planted}
+
+
+def hashing_embedder(dimension: int = 256):
+    """Deterministic bag-of-words embedder, so embedding retrieval can be
+    benchmarked without a model server"""
+    import numpy as np
+
+    async def embed(texts: List[str]) -> List[List[float]]:
+        matrix = np.zeros((len(texts), dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for term in tokenize(text):
+                matrix[row, zlib.crc32(term.encode()) % dimension] += 1.0
+        return matrix.tolist()
+
+    return embed
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of values"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def _latency_summary(samples: List[float]) -> Dict[str, float]:
+    ms = [sample * 1000 for sample in samples]
+    return {
+        'count': len(ms),
+        'p50_ms': round(percentile(ms, 50), 3),
+        'p99_ms': round(percentile(ms, 99), 3),
+        'mean_ms': round(statistics.fmean(ms), 3) if ms else 0.0,
+        'max_ms': round(max(ms), 3) if ms else 0.0
+    }
+
+
+def _peak_rss_mb() -> float:
+    if resource is None:
+        return 0.0
+    # ru_maxrss is kilobytes on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def _make_manager(docs: Path, index_path: Path, args) -> RAGManager:
+    embedder = hashing_embedder() if args.retrieval == "embedding" else None
+    return RAGManager(
+        docs_path=str(docs),
+        retrieval_mode=args.retrieval,
+        embedder=embedder,
+        index_path=str(index_path),
+        chunk_tokens=args.chunk_tokens,
+        ann_threshold=args.ann_threshold or None,
+        ann_nprobe=args.nprobe,
+        ann_recall_tolerance=args.recall_tolerance,
+        quantization=args.quantization
+    )
+
+
+async def _vector_recall(manager: RAGManager, generation, queries: List[str], top_k: int) -> Dict[str, Any]:
+    """recall@top_k of the vector search (ANN or quantized codes) against exact search"""
+    from embedding_index import recall_at_k
+
+    embeddings = generation.embeddings
+    vectors = await manager.embedder(queries)
+    found = embeddings.search_many(vectors, top_k=top_k)
+    exact = embeddings.search_exact(vectors, top_k)
+    return {
+        'mode': 'ivf' if embeddings.ann is not None else 'exact',
+        'nprobe': embeddings.ann.probe_count() if embeddings.ann is not None else None,
+        'top_k': top_k,
+        'recall_vs_exact': round(recall_at_k(found, exact), 4)
+    }
+
+
+async def run_size(chunks: int, workdir: Path, args) -> Dict[str, Any]:
+    """Benchmark one corpus size and return its result entry"""
+    docs = workdir / f"corpus_{chunks}"
+    index_path = workdir / f"index_{chunks}"
+    result: Dict[str, Any] = {'target_chunks': chunks, 'retrieval': args.retrieval}
+
+    started = time.perf_counter()
+    corpus = generate_corpus(docs, chunks, args.facts, seed=args.seed)
+    result['generate_seconds'] = round(time.perf_counter() - started, 3)
+    result['files'] = len(corpus['files']) + 1
+
+    # Cold start: every file is read, chunked and indexed
+    manager = _make_manager(docs, index_path, args)
+    started = time.perf_counter()
+    await manager.initialize()
+    result['index_seconds'] = round(time.perf_counter() - started, 3)
+    result['documents'] = len(manager.documents)
+    result['chunks'] = len(manager.index)
+    if manager.embeddings is not None:
+        result['vector_search'] = manager.pin().status()['vector_search']
+
+    # Full reload of an unchanged tree (stat-only)
+    started = time.perf_counter()
+    await manager.reload_documents()
+    result['noop_reload_seconds'] = round(time.perf_counter() - started, 3)
+
+    # Incremental reload of a few edited files
+    rng = random.Random(args.seed + 1)
+    edited = rng.sample(corpus['files'], min(args.edit_files, len(corpus['files'])))
+    for path in edited:
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(_section(rng, "Appended Section"))
+    started = time.perf_counter()
+    await manager.reload_paths([str(path) for path in edited])
+    result['incremental_reload'] = {
+        'files': len(edited),
+        'seconds': round(time.perf_counter() - started, 3)
+    }
+
+    # Chunking throughput on a sample of documents
+    sample = manager.documents[:args.chunk_sample]
+    started = time.perf_counter()
+    chunked = sum(len(manager._chunk_document(doc.content)) for doc in sample)
+    elapsed = time.perf_counter() - started
+    result['chunking'] = {
+        'documents': len(sample),
+        'chunks': chunked,
+        'chunks_per_second': round(chunked / elapsed) if elapsed else 0
+    }
+
+    # Query latency and recall against the planted facts
+    generation = manager.pin()
+    planted = corpus['planted']
+    latencies = []
+    hits = 0
+    for fact in planted:
+        query = f"What is the {fact['key']}?"
+        started = time.perf_counter()
+        context = await manager.get_relevant_context(query, top_k=args.top_k, generation=generation)
+        latencies.append(time.perf_counter() - started)
+        hits += fact['value'] in context
+    result['query_latency'] = _latency_summary(latencies)
+
+    batch = [f"What is the {fact['key']}?" for fact in planted]
+    started = time.perf_counter()
+    await manager.search_many(batch, top_k=args.top_k, generation=generation)
+    result['batched_query_seconds'] = round(time.perf_counter() - started, 3)
+
+    fact_hits = sum(
+        (manager.lookup_fact(fact['key'], generation) or {}).get('value') == fact['value']
+        for fact in planted
+    )
+    result['recall'] = {
+        'planted': len(planted),
+        'top_k': args.top_k,
+        'retrieval_recall': round(hits / len(planted), 4) if planted else None,
+        'fact_table_recall': round(fact_hits / len(planted), 4) if planted else None
+    }
+    if generation.embeddings is not None and planted:
+        result['vector_recall'] = await _vector_recall(manager, generation, batch, args.top_k)
+
+    # Warm restart: a fresh manager restores the snapshot and only stats files
+    await manager.flush_snapshot()
+    restarted = _make_manager(docs, index_path, args)
+    started = time.perf_counter()
+    await restarted.initialize()
+    result['warm_restart_seconds'] = round(time.perf_counter() - started, 3)
+
+    result['peak_rss_mb'] = _peak_rss_mb()
+    return result
+
+
+async def run(args) -> Dict[str, Any]:
+    workdir = Path(args.workdir) if args.workdir else Path(tempfile.mkdtemp(prefix="rag_bench_"))
+    workdir.mkdir(parents=True, exist_ok=True)
+    report = {
+        'python': sys.version.split()[0],
+        'started_at': time.time(),
+        'settings': {
+            'facts': args.facts,
+            'top_k': args.top_k,
+            'chunk_tokens': args.chunk_tokens,
+            'ann_threshold': args.ann_threshold,
+            'nprobe': args.nprobe,
+            'recall_tolerance': args.recall_tolerance,
+            'quantization': args.quantization,
+            'sections_per_file': SECTIONS_PER_FILE,
+            'seed': args.seed
+        },
+        'results': []
+    }
+    try:
+        for size in args.sizes:
+            logger.warning(f"Benchmarking {size} chunks...")
+            report['results'].append(await run_size(size, workdir, args))
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark RAG indexing and retrieval")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES),
+                        help="comma-separated corpus sizes in chunks (e.g. 10,1000,100000,1000000)")
+    parser.add_argument("--retrieval", choices=["keyword", "embedding"], default="keyword")
+    parser.add_argument("--facts", type=int, default=200, help="planted facts per corpus")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--chunk-tokens", type=int, default=256)
+    parser.add_argument("--edit-files", type=int, default=10,
+                        help="files modified before the incremental reload")
+    parser.add_argument("--chunk-sample", type=int, default=500,
+                        help="documents re-chunked for the chunking throughput figure")
+    parser.add_argument("--ann-threshold", type=int, default=50000,
+                        help="chunks from which embedding search uses the IVF index (0: always exact)")
+    parser.add_argument("--nprobe", type=int,
+                        help="IVF lists scanned per query (default: about 10%% of the lists, raised to meet "
+                             "--recall-tolerance)")
+    parser.add_argument("--recall-tolerance", type=float, default=0.05,
+                        help="how far IVF recall@10 may fall below exact search before search stays exact")
+    parser.add_argument("--quantization", choices=["int8", "binary"],
+                        help="compact embedding codes, rescored at full precision")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="where corpora are generated (default: a temp dir)")
+    parser.add_argument("--keep", action="store_true", help="keep generated corpora and indexes")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+    args.sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(message)s')
+    report = asyncio.run(run(args))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n", encoding="utf-8")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
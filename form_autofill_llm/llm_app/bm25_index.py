@@ -0,0 +1,168 @@
+# bm25_index.py - Inverted index with BM25 scoring over document chunks
+import heapq
+import math
+from collections import Counter
+from typing import AbstractSet, Dict, List, Optional, Tuple
+
+from cow_dict import CowDict
+from text_utils import tokenize
+
+# Consecutive chunk ids per bucket of the per-chunk tables and posting lists
+CHUNK_BLOCK = 128
+
+
+class BM25Index:
+    """Tokenized inverted index that can be updated one document at a time
+
+    Every table is a CowDict, and so is each term's posting list, with
+    chunk ids grouped in blocks. A copy shares all of them; changing a
+    document then copies only the blocks holding its chunks in the
+    posting lists of its own terms, so the cost of an update does not
+    grow with the corpus.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        # term -> {chunk_id: term frequency}
+        self.postings: CowDict = CowDict()
+        # chunk_id -> (doc_id, position of the chunk within the document)
+        self.chunk_refs: CowDict = CowDict(block=CHUNK_BLOCK)
+        self.chunk_lengths: CowDict = CowDict(block=CHUNK_BLOCK)
+        self.chunk_terms: CowDict = CowDict(block=CHUNK_BLOCK)
+        self.doc_chunks: CowDict = CowDict()
+        self.total_length = 0
+        self._next_chunk_id = 0
+        # Terms whose posting list this instance may mutate (copy-on-write)
+        self._owned_terms = None
+
+    def __len__(self) -> int:
+        return len(self.chunk_lengths)
+
+    def copy(self) -> "BM25Index":
+        """Cheap copy that shares every table and posting list until one side modifies it"""
+        clone = BM25Index(self.k1, self.b)
+        clone.postings = self.postings.copy()
+        clone.chunk_refs = self.chunk_refs.copy()
+        clone.chunk_lengths = self.chunk_lengths.copy()
+        clone.chunk_terms = self.chunk_terms.copy()
+        clone.doc_chunks = self.doc_chunks.copy()
+        clone.total_length = self.total_length
+        clone._next_chunk_id = self._next_chunk_id
+        clone._owned_terms = set()
+        # The shared posting lists now belong to neither side
+        self._owned_terms = set()
+        return clone
+
+    def _writable_postings(self, term: str) -> CowDict:
+        """Return a posting list for term that is safe to mutate"""
+        postings = self.postings.get(term)
+        if postings is None:
+            postings = self.postings[term] = CowDict(block=CHUNK_BLOCK)
+            if self._owned_terms is not None:
+                self._owned_terms.add(term)
+        elif self._owned_terms is not None and term not in self._owned_terms:
+            # Shares the blocks; only those this update writes get copied
+            postings = self.postings[term] = postings.copy()
+            self._owned_terms.add(term)
+        return postings
+
+    def add_document(self, doc_id: str, chunks: Optional[List[str]], term_counts: Optional[List[Counter]] = None):
+        """Index the chunks of a document, replacing any previous version
+
+        term_counts may carry pre-tokenized chunks (e.g. from a worker
+        process) so the caller does not tokenize again.
+        """
+        if doc_id in self.doc_chunks:
+            self.remove_document(doc_id)
+
+        if term_counts is None:
+            term_counts = [Counter(tokenize(chunk)) for chunk in chunks]
+
+        chunk_ids = []
+        for position, counts in enumerate(term_counts):
+            chunk_id = self._next_chunk_id
+            self._next_chunk_id += 1
+
+            for term, count in counts.items():
+                self._writable_postings(term)[chunk_id] = count
+
+            length = sum(counts.values())
+            self.chunk_refs[chunk_id] = (doc_id, position)
+            self.chunk_lengths[chunk_id] = length
+            self.chunk_terms[chunk_id] = tuple(counts)
+            self.total_length += length
+            chunk_ids.append(chunk_id)
+
+        self.doc_chunks[doc_id] = chunk_ids
+
+    def remove_document(self, doc_id: str):
+        """Drop every chunk of a document from the index"""
+        for chunk_id in self.doc_chunks.pop(doc_id, []):
+            for term in self.chunk_terms.pop(chunk_id, ()):
+                if term not in self.postings:
+                    continue
+                postings = self._writable_postings(term)
+                postings.pop(chunk_id, None)
+                if not postings:
+                    del self.postings[term]
+
+            self.total_length -= self.chunk_lengths.pop(chunk_id, 0)
+            self.chunk_refs.pop(chunk_id, None)
+
+    def search(self, query: str, top_k: int = 5,
+               chunk_ids: Optional[AbstractSet[int]] = None) -> List[Tuple[float, str, int]]:
+        """Return (score, doc_id, chunk position) for the best matching chunks"""
+        return self.search_many([query], top_k=top_k, chunk_ids=chunk_ids)[0]
+
+    def search_many(self, queries: List[str], top_k: int = 5,
+                    chunk_ids: Optional[AbstractSet[int]] = None) -> List[List[Tuple[float, str, int]]]:
+        """Rank chunks for several queries in one pass over the postings
+
+        Each posting list is visited once no matter how many queries share
+        the term; its BM25 weight is then added to every such query. With
+        chunk_ids, only those chunks are scored (corpus statistics stay
+        global), walking whichever of the posting list and the scope is
+        smaller.
+        """
+        results: List[List[Tuple[float, str, int]]] = [[] for _ in queries]
+        chunk_count = len(self.chunk_lengths)
+        if not chunk_count or top_k <= 0:
+            return results
+
+        # term -> indexes of the queries that contain it
+        term_queries: Dict[str, List[int]] = {}
+        for i, query in enumerate(queries):
+            for term in set(tokenize(query)):
+                term_queries.setdefault(term, []).append(i)
+
+        avg_length = self.total_length / chunk_count or 1.0
+        k1 = self.k1
+        b = self.b
+        lengths = self.chunk_lengths
+
+        scores: List[Dict[int, float]] = [{} for _ in queries]
+        for term, query_ids in term_queries.items():
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+
+            df = len(postings)
+            idf = math.log(1 + (chunk_count - df + 0.5) / (df + 0.5))
+            if chunk_ids is None:
+                matches = postings.items()
+            elif len(chunk_ids) < df:
+                matches = [(chunk_id, postings[chunk_id]) for chunk_id in chunk_ids if chunk_id in postings]
+            else:
+                matches = [(chunk_id, tf) for chunk_id, tf in postings.items() if chunk_id in chunk_ids]
+            for chunk_id, tf in matches:
+                norm = k1 * (1 - b + b * lengths[chunk_id] / avg_length)
+                weight = idf * tf * (k1 + 1) / (tf + norm)
+                for i in query_ids:
+                    query_scores = scores[i]
+                    query_scores[chunk_id] = query_scores.get(chunk_id, 0.0) + weight
+
+        for i, query_scores in enumerate(scores):
+            best = heapq.nlargest(top_k, query_scores.items(), key=lambda item: item[1])
+            results[i] = [(score, *self.chunk_refs[chunk_id]) for chunk_id, score in best]
+        return results
@@ -0,0 +1,127 @@
+# context_packer.py - Packs ranked chunks into a token-budgeted LLM context
+import hashlib
+import logging
+from typing import Any, Dict, List, Tuple
+
+from text_utils import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+SEPARATOR = "\n\n"
+
+
+def format_chunk(filename: str, chunk: Dict[str, Any]) -> str:
+    """Render a chunk with its source file and section for the LLM prompt"""
+    if chunk.get('heading_path'):
+        return f"From {filename} ({chunk['heading_path']}):\n{chunk['text']}"
+    return f"From {filename}:\n{chunk['text']}"
+
+
+def _text_key(text: str) -> str:
+    """Whitespace- and case-insensitive fingerprint for exact duplicates"""
+    return hashlib.md5(" ".join(text.lower().split()).encode()).hexdigest()
+
+
+def _hit_key(hit: Dict[str, Any]) -> Tuple[str, int, str]:
+    chunk = hit['chunk']
+    return hit['filename'], chunk.get('start', -1), chunk['text'][:64]
+
+
+def merge_field_hits(per_field_hits: List[List[Dict[str, Any]]], min_per_field: int = 2) -> List[Dict[str, Any]]:
+    """Union ranked hit lists from several field queries into one ranking
+
+    Every field first gets its best min_per_field hits, taken round-robin so
+    no single field can crowd out the others; the remaining hits follow by
+    score. A chunk retrieved by several fields appears once.
+    """
+    merged = []
+    seen = set()
+
+    def take(hit):
+        key = _hit_key(hit)
+        if key not in seen:
+            seen.add(key)
+            merged.append(hit)
+
+    for rank in range(min_per_field):
+        for hits in per_field_hits:
+            if rank < len(hits):
+                take(hits[rank])
+
+    rest = [hit for hits in per_field_hits for hit in hits[min_per_field:]]
+    rest.sort(key=lambda hit: hit.get('score') or 0.0, reverse=True)
+    for hit in rest:
+        take(hit)
+
+    return merged
+
+
+def pack_context(hits: List[Dict[str, Any]], token_budget: int) -> Tuple[str, Dict[str, Any]]:
+    """Greedily pack ranked hits into at most token_budget tokens
+
+    hits are dicts with 'filename' and 'chunk' (plus an optional 'score'),
+    best first. Chunks whose text duplicates or whose span overlaps an
+    already selected chunk are skipped, as are chunks that no longer fit;
+    smaller, lower-ranked chunks may still fill the remaining budget.
+
+    Returns the context string and a report of what was kept and dropped.
+    """
+    selected = []
+    included = []
+    dropped = []
+    seen_text = set()
+    spans: Dict[str, List[Tuple[int, int]]] = {}
+    separator_tokens = estimate_tokens(SEPARATOR)
+    used = 0
+
+    for hit in hits:
+        filename = hit['filename']
+        chunk = hit['chunk']
+        entry = {
+            'filename': filename,
+            'heading_path': chunk.get('heading_path', ''),
+            'score': hit.get('score')
+        }
+
+        key = _text_key(chunk['text'])
+        if key in seen_text:
+            dropped.append(dict(entry, reason='duplicate'))
+            continue
+
+        start, end = chunk.get('start'), chunk.get('end')
+        if start is not None and any(start < other_end and other_start < end
+                                     for other_start, other_end in spans.get(filename, ())):
+            dropped.append(dict(entry, reason='overlap'))
+            continue
+
+        text = format_chunk(filename, chunk)
+        cost = estimate_tokens(text) + (separator_tokens if selected else 0)
+        if used + cost > token_budget:
+            dropped.append(dict(entry, reason='budget', tokens=cost))
+            continue
+
+        used += cost
+        seen_text.add(key)
+        if start is not None:
+            spans.setdefault(filename, []).append((start, end))
+        selected.append(text)
+        included.append(dict(entry, tokens=cost))
+
+    report = {
+        'token_budget': token_budget,
+        'tokens_used': used,
+        'included': included,
+        'dropped': dropped
+    }
+    return SEPARATOR.join(selected), report
+
+
+def combine_reports(reports: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """One pack_context report for several packed contexts, e.g. the shards of a form"""
+    return {
+        'token_budget': sum(report['token_budget'] for report in reports),
+        'tokens_used': sum(report['tokens_used'] for report in reports),
+        'included': [entry for report in reports for entry in report['included']],
+        'dropped': [entry for report in reports for entry in report['dropped']],
+        'contexts': len(reports)
+    }
@@ -0,0 +1,133 @@
+# cow_dict.py - Bucketed copy-on-write dict shared between index generations
+from collections.abc import MutableMapping
+from itertools import chain
+from typing import Any, Dict, Iterable, Iterator, Optional, Set, Tuple
+
+# Target number of entries per bucket in hashed mode
+BUCKET_SIZE = 64
+
+
+class CowDict(MutableMapping):
+    """Dict whose copies share storage until one side writes to it
+
+    Entries live in many small buckets. copy() only copies the table of
+    bucket references; the first write to a bucket after a copy replaces
+    that bucket with a private copy, like BM25Index does per term. So
+    deriving a generation costs O(buckets) and changing one document
+    costs O(entries it touches * bucket size), however big the corpus.
+
+    Keys are spread by hash, with the bucket count doubling as the dict
+    grows. With block set, integer keys are grouped into ranges of block
+    consecutive values instead, so keys allocated together (the chunk ids
+    of one document) share a bucket and a new document only touches the
+    last one. Iteration order is by bucket, not by insertion.
+    """
+
+    __slots__ = ('_buckets', '_owned', '_size', '_block', '_mask')
+
+    def __init__(self, items: Iterable[Tuple[Any, Any]] = (), block: Optional[int] = None):
+        self._buckets: Dict[int, Dict] = {}
+        self._owned: Set[int] = set()
+        self._size = 0
+        self._block = block
+        self._mask = 0
+        self.update(items)
+
+    def _index(self, key) -> int:
+        if self._block is not None:
+            return key // self._block
+        return hash(key) & self._mask
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getitem__(self, key):
+        bucket = self._buckets.get(self._index(key))
+        if bucket is None:
+            raise KeyError(key)
+        return bucket[key]
+
+    def get(self, key, default=None):
+        bucket = self._buckets.get(self._index(key))
+        return default if bucket is None else bucket.get(key, default)
+
+    def __contains__(self, key) -> bool:
+        bucket = self._buckets.get(self._index(key))
+        return bucket is not None and key in bucket
+
+    def __iter__(self) -> Iterator:
+        return chain.from_iterable(list(self._buckets.values()))
+
+    def values(self):
+        return chain.from_iterable([bucket.values() for bucket in self._buckets.values()])
+
+    def items(self):
+        return chain.from_iterable([bucket.items() for bucket in self._buckets.values()])
+
+    def _writable(self, index: int) -> Dict:
+        """The bucket at index, copied first if a copy of this dict may share it"""
+        bucket = self._buckets.get(index)
+        if bucket is None:
+            bucket = self._buckets[index] = {}
+            self._owned.add(index)
+        elif index not in self._owned:
+            bucket = self._buckets[index] = dict(bucket)
+            self._owned.add(index)
+        return bucket
+
+    def __setitem__(self, key, value):
+        bucket = self._writable(self._index(key))
+        if key not in bucket:
+            self._size += 1
+        bucket[key] = value
+        if self._block is None and self._size > 2 * BUCKET_SIZE * (self._mask + 1):
+            self._grow()
+
+    def __delitem__(self, key):
+        index = self._index(key)
+        bucket = self._buckets.get(index)
+        if bucket is None or key not in bucket:
+            raise KeyError(key)
+        bucket = self._writable(index)
+        del bucket[key]
+        self._size -= 1
+        if not bucket:
+            del self._buckets[index]
+            self._owned.discard(index)
+
+    def pop(self, key, *default):
+        if key not in self:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        value = self[key]
+        del self[key]
+        return value
+
+    def _grow(self):
+        """Double the bucket count; every bucket is new, so nothing is shared any more"""
+        self._mask = 2 * (self._mask + 1) - 1
+        buckets: Dict[int, Dict] = {}
+        for key, value in self.items():
+            buckets.setdefault(hash(key) & self._mask, {})[key] = value
+        self._buckets = buckets
+        self._owned = set(buckets)
+
+    def copy(self) -> "CowDict":
+        """O(buckets) copy; buckets are shared until either side writes to them"""
+        clone = CowDict.__new__(CowDict)
+        clone._buckets = dict(self._buckets)
+        clone._owned = set()
+        clone._size = self._size
+        clone._block = self._block
+        clone._mask = self._mask
+        # The shared buckets now belong to neither side
+        self._owned = set()
+        return clone
+
+    def __reduce__(self):
+        # Hashes of str differ between processes, so pickle plain items
+        return CowDict, (list(self.items()), self._block)
+
+    def __repr__(self) -> str:
+        return f"CowDict({dict(self.items())!r})"
@@ -0,0 +1,114 @@
+# doc_loader.py - Worker-side file loading, kept import-light for process pools
+import hashlib
+import os
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from document_record import DocumentRecord
+from extractors import ExtractionCache, Extractors, extractor_for
+from fact_table import extract_facts
+from front_matter import document_scope, parse_front_matter
+from markdown_chunker import chunk_markdown
+from near_duplicates import minhash_signatures
+from text_utils import tokenize
+
+# (path, document key, known mtime, known size, known content hash)
+LoadItem = Tuple[str, str, Optional[float], Optional[int], Optional[str]]
+
+
+def extract_content(path: str, data: bytes, content_hash: str, extractors: Extractors,
+                    cache: Optional[ExtractionCache]) -> str:
+    """Markdown text of a source file, from the extraction cache when possible"""
+    extractor = extractor_for(path, extractors)
+    if extractor is None:
+        raise ValueError(f"No extractor for {os.path.splitext(path)[1] or path}")
+    extract, cached = extractor
+    if not cached or cache is None:
+        return extract(data, path)
+
+    cache_key = cache.key(content_hash, extract)
+    content = cache.get(cache_key)
+    if content is None:
+        content = extract(data, path)
+        cache.put(cache_key, content)
+    return content
+
+
+def load_document(item: LoadItem, max_tokens: int, extractors: Extractors,
+                  cache: Optional[ExtractionCache] = None) -> Dict[str, Any]:
+    """Stat, read, hash, extract and chunk one file, skipping work for unchanged files
+
+    Returns a result dict whose status is 'unchanged' (same mtime and size),
+    'touched' (new stat, same content) or 'loaded' (new or changed document,
+    including chunks, per-chunk term counts ready for the BM25 index and
+    MinHash signatures for near-duplicate detection). The content hash is
+    taken over the raw bytes, so an unchanged file is never extracted.
+    """
+    path, key, known_mtime, known_size, known_hash = item
+    stat = os.stat(path)
+    if known_mtime == stat.st_mtime and known_size == stat.st_size:
+        return {'key': key, 'status': 'unchanged'}
+
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    content_hash = hashlib.md5(data).hexdigest()
+    if content_hash == known_hash:
+        return {
+            'key': key,
+            'status': 'touched',
+            'last_modified': stat.st_mtime,
+            'file_size': stat.st_size
+        }
+
+    content = extract_content(path, data, content_hash, extractors, cache)
+
+    # Front matter is metadata only: chunk and mine facts from the body
+    metadata, body_start = parse_front_matter(content)
+    body = content[body_start:]
+    chunks = chunk_markdown(body, max_tokens=max_tokens)
+    for chunk in chunks:
+        chunk['start'] += body_start
+        chunk['end'] += body_start
+    category, tags = document_scope(metadata)
+
+    doc = DocumentRecord(
+        filename=key,
+        content=content,
+        chunks=chunks,
+        facts=extract_facts(body),
+        last_modified=stat.st_mtime,
+        file_size=stat.st_size,
+        category=category,
+        tags=tags
+    )
+    # Tokenize each chunk once for both BM25 (heading path + text) and MinHash (text)
+    heading_tokens = {path: tokenize(path) for path in doc.heading_paths}
+    text_tokens = [tokenize(doc.chunk_text(i)) for i in range(doc.chunk_count)]
+    term_counts = []
+    for i, tokens in enumerate(text_tokens):
+        counts = Counter(heading_tokens[doc.heading_path(i)])
+        counts.update(tokens)
+        term_counts.append(counts)
+
+    return {
+        'key': key,
+        'status': 'loaded',
+        'hash': content_hash,
+        'term_counts': term_counts,
+        'signatures': minhash_signatures(text_tokens),
+        'doc': doc
+    }
+
+
+def load_document_batch(items: List[LoadItem], max_tokens: int, extractors: Extractors,
+                        cache_path: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Load a batch of files; errors are reported per file instead of raised"""
+    cache = ExtractionCache(cache_path) if cache_path else None
+    results = []
+    for item in items:
+        try:
+            results.append(load_document(item, max_tokens, extractors, cache))
+        except Exception as e:
+            results.append({'key': item[1], 'status': 'error', 'error': str(e)})
+    return results
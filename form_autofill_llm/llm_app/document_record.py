@@ -0,0 +1,83 @@
+# document_record.py - Compact, offset-based storage for a loaded document
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class DocumentRecord:
+    """One document's text plus its chunk boundaries
+
+    The text is stored once; chunks are (start, end) offsets into it held in
+    typed arrays, and each chunk refers to its heading path by index into a
+    per-document tuple of distinct paths. Chunk text is only sliced out when
+    a chunk is actually used for a context. The category and tags come
+    from front matter (see front_matter.py) and define retrieval scopes.
+    """
+
+    __slots__ = ('filename', 'content', 'chunk_starts', 'chunk_ends', 'chunk_paths',
+                 'heading_paths', 'facts', 'last_modified', 'file_size', 'category', 'tags')
+
+    def __init__(self,
+                 filename: str,
+                 content: str,
+                 chunks: List[Dict[str, Any]],
+                 facts: Optional[List[Dict[str, str]]] = None,
+                 last_modified: Optional[float] = None,
+                 file_size: Optional[int] = None,
+                 category: Optional[str] = None,
+                 tags: Tuple[str, ...] = ()):
+        self.filename = filename
+        self.content = content
+        self.facts = facts or []
+        self.last_modified = last_modified
+        self.file_size = file_size
+        self.category = category
+        self.tags = tuple(tags)
+
+        path_ids: Dict[str, int] = {}
+        self.chunk_starts = array('I')
+        self.chunk_ends = array('I')
+        self.chunk_paths = array('I')
+        for chunk in chunks:
+            self.chunk_starts.append(chunk['start'])
+            self.chunk_ends.append(chunk['end'])
+            self.chunk_paths.append(path_ids.setdefault(chunk['heading_path'], len(path_ids)))
+        self.heading_paths = tuple(path_ids)
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    @property
+    def chunk_count(self) -> int:
+        return len(self.chunk_starts)
+
+    def chunk_text(self, position: int) -> str:
+        return self.content[self.chunk_starts[position]:self.chunk_ends[position]]
+
+    def heading_path(self, position: int) -> str:
+        return self.heading_paths[self.chunk_paths[position]]
+
+    def chunk(self, position: int) -> Dict[str, Any]:
+        """Materialize one chunk as a dict (text, heading_path, start, end)"""
+        return {
+            'text': self.chunk_text(position),
+            'heading_path': self.heading_path(position),
+            'start': self.chunk_starts[position],
+            'end': self.chunk_ends[position]
+        }
+
+    def search_texts(self) -> List[str]:
+        """Chunk texts prefixed with their heading path, as indexed for search"""
+        return [f"{self.heading_path(i)}\n{self.chunk_text(i)}" for i in range(self.chunk_count)]
+
+    def with_stat(self, last_modified: float, file_size: int) -> "DocumentRecord":
+        """Copy sharing text and chunk arrays, with a new file stat"""
+        clone = DocumentRecord.__new__(DocumentRecord)
+        for name in self.__slots__:
+            setattr(clone, name, getattr(self, name))
+        clone.last_modified = last_modified
+        clone.file_size = file_size
+        return clone
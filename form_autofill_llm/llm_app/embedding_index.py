@@ -0,0 +1,634 @@
+# embedding_index.py - Dense vector index for semantic chunk retrieval
+import hashlib
+import logging
+import time
+from typing import AbstractSet, Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+from ann_index import IVFIndex
+from cow_dict import CowDict
+from quantization import codes_nbytes, create_quantizer
+from vector_store import VectorStore
+
+logger = logging.getLogger(__name__)
+
+# Dead rows tolerated (beyond the live ones) before the code matrix or the store is compacted
+COMPACT_MIN_ROWS = 4096
+
+# Recall of a freshly trained ANN index is measured as recall@RECALL_K
+# against exact search, over RECALL_QUERIES synthetic queries that each
+# blend QUERY_BLEND random stored vectors
+RECALL_K = 10
+RECALL_QUERIES = 64
+QUERY_BLEND = 8
+
+
+def chunk_hash(text: str) -> str:
+    """Content hash used to embed each distinct chunk only once"""
+    return hashlib.md5(text.encode()).hexdigest()
+
+
+def recall_at_k(found: List[List[Tuple[float, str, int]]], truth: List[List[Tuple[float, str, int]]]) -> float:
+    """Mean share of each query's exact top hits that were found
+
+    found must carry exact scores. A hit scoring at least the last exact
+    hit counts too, since chunks tied with it are equally correct.
+    """
+    shares = []
+    for hits, expected in zip(found, truth):
+        if expected:
+            wanted = {(doc_id, position) for _, doc_id, position in expected}
+            floor = expected[-1][0] - 1e-6
+            correct = sum((doc_id, position) in wanted or score >= floor for score, doc_id, position in hits)
+            shares.append(min(correct, len(expected)) / len(expected))
+    return sum(shares) / len(shares) if shares else 1.0
+
+
+class EmbeddingIndex:
+    """Searches chunk embeddings through compact in-memory codes
+
+    Full-precision vectors are written once per distinct chunk (by content
+    hash) to a VectorStore file - under store_path, or a temporary file -
+    so editing a document only embeds the chunks whose text changed, and
+    memory holds only what search scans.
+
+    Small corpora are searched exactly over a code matrix with one row per
+    chunk. Rows of a changed document are appended and its old rows marked
+    dead, so an update costs only that document; the matrix is compacted
+    once dead rows outnumber live ones. From ann_threshold chunks on, an
+    IVF index (see ann_index.py) replaces the matrix and scans only nprobe
+    inverted lists per query - by default about 10% of them. Each time
+    the IVF index is trained its recall against exact search is measured
+    and nprobe raised until recall is within recall_tolerance of exact;
+    if that takes more than half the lists, search stays exact.
+
+    With quantization ("int8" or "binary") the codes are compact (see
+    quantization.py) and a query ranks top_k * rescore_factor candidates
+    (default per quantizer), then rescores that shortlist with vectors
+    read back from the store.
+
+    Like the other indexes it is copied per generation: the tables are
+    CowDicts, and the store and code matrix are append-only, so copies
+    share them and each only reads the rows it knows about.
+    """
+
+    def __init__(self, ann_threshold: Optional[int] = 50000, nprobe: Optional[int] = None,
+                 quantization: Optional[str] = None, rescore_factor: Optional[int] = None,
+                 store_path: Optional[str] = None, recall_tolerance: float = 0.05):
+        # Full-precision vectors: chunk hash -> store row, and doc_id -> chunk hashes
+        self.store_path = store_path
+        self.store: Optional[VectorStore] = None
+        self.rows: CowDict = CowDict()
+        self.doc_hashes: CowDict = CowDict()
+        self.refcounts: CowDict = CowDict()
+        self.chunk_count = 0
+        self.dimension = None
+        # Hashes no document used any more; their rows are released on the next rebuild
+        self._unreferenced: Set[str] = set()
+        self._dead_vectors = 0
+        # What this copy added to its parent, for the snapshot journal
+        self._new_keys: List[str] = []
+        self._attached: Set[str] = set()
+        self._relocated = False
+
+        # Compact codes for the search structures, rescored at full precision
+        self.quantization = quantization
+        self.quantizer = create_quantizer(quantization)
+        self.rescore_factor = rescore_factor or self.quantizer.rescore_factor
+
+        # Approximate search for large corpora (None disables it)
+        self.ann_threshold = ann_threshold
+        self.nprobe = nprobe
+        self.recall_tolerance = recall_tolerance
+        self.ann: Optional[IVFIndex] = None
+        # Corpus size at which a trained index missed the recall target
+        self._ann_rejected: Optional[int] = None
+        # Documents set or removed since the search structure was last updated
+        self._changed: Set[str] = set()
+        # Saved list assignments, applied on the next rebuild
+        self._ann_state = None
+
+        # Exact search: codes (and per-row scales) with room to append, shared
+        # between generations; each generation uses the first _size rows
+        self._codes = None
+        self._scales = None
+        self._row_refs: List[Tuple[str, int]] = []
+        self._alive = np.zeros(0, dtype=bool)
+        self._size = 0
+        self._live = 0
+        # doc_id -> (first row, end row) in the code matrix
+        self._doc_rows: CowDict = CowDict()
+        self._dirty = True
+
+    def __len__(self) -> int:
+        return self.chunk_count
+
+    def copy(self) -> "EmbeddingIndex":
+        """Copy that shares the store, tables and code matrix until it changes"""
+        clone = EmbeddingIndex(self.ann_threshold, self.nprobe, self.quantization, self.rescore_factor,
+                               self.store_path, self.recall_tolerance)
+        clone.store = self.store
+        clone.rows = self.rows.copy()
+        clone.doc_hashes = self.doc_hashes.copy()
+        clone.refcounts = self.refcounts.copy()
+        clone.chunk_count = self.chunk_count
+        clone.dimension = self.dimension
+        clone._unreferenced = set(self._unreferenced)
+        clone._dead_vectors = self._dead_vectors
+        clone.ann = self.ann.copy() if self.ann is not None else None
+        clone._ann_rejected = self._ann_rejected
+        clone._changed = set(self._changed)
+        clone._ann_state = self._ann_state
+        clone._codes = self._codes
+        clone._scales = self._scales
+        clone._row_refs = self._row_refs
+        clone._alive = self._alive
+        clone._size = self._size
+        clone._live = self._live
+        clone._doc_rows = self._doc_rows.copy()
+        clone._dirty = self._dirty
+        return clone
+
+    def prepare(self):
+        """Update the search structure now instead of on the first query"""
+        if self._dirty:
+            self._rebuild()
+
+    def missing(self, chunks: List[str]) -> Dict[str, str]:
+        """Return {hash: text} for chunks that have no stored embedding yet"""
+        pending = {}
+        for chunk in chunks:
+            key = chunk_hash(chunk)
+            if key not in self.rows:
+                pending[key] = chunk
+        return pending
+
+    def add_vectors(self, embeddings: Dict[str, List[float]]):
+        """Normalize raw embeddings keyed by chunk hash and append them to the store"""
+        keys = [key for key in embeddings if key not in self.rows]
+        if not keys:
+            return
+        matrix = np.asarray([embeddings[key] for key in keys], dtype=np.float32)
+        if self.dimension is None:
+            self.dimension = matrix.shape[1]
+        elif matrix.shape[1] != self.dimension:
+            raise ValueError(f"Embedding dimension {matrix.shape[1]} != {self.dimension}")
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms == 0, 1, norms)
+
+        if self.store is None:
+            self.store = VectorStore(self.dimension, self.store_path)
+        start = self.store.append(matrix)
+        for offset, key in enumerate(keys):
+            self.rows[key] = start + offset
+        self._new_keys.extend(keys)
+
+    def set_document(self, doc_id: str, chunks: List[str]) -> bool:
+        """Attach a document's chunks; returns False if any chunk is not embedded"""
+        hashes = [chunk_hash(chunk) for chunk in chunks]
+        if any(key not in self.rows for key in hashes):
+            return False
+        self.set_document_hashes(doc_id, hashes)
+        return True
+
+    def remove_document(self, doc_id: str):
+        if self._release(doc_id):
+            self._changed.add(doc_id)
+            self._dirty = True
+
+    def _release(self, doc_id: str) -> bool:
+        """Detach a document's chunks; vectors nobody uses are freed on the next rebuild"""
+        hashes = self.doc_hashes.pop(doc_id, None)
+        if hashes is None:
+            return False
+        self.chunk_count -= len(hashes)
+        for key in hashes:
+            count = self.refcounts[key] - 1
+            if count:
+                self.refcounts[key] = count
+            else:
+                del self.refcounts[key]
+                self._unreferenced.add(key)
+        return True
+
+    def _rebuild(self):
+        """Apply changed documents to the search structure: the code matrix, or the ANN index when large"""
+        # Forget vectors no document refers to any more (kept until now so a
+        # document that is removed and re-added is not embedded again)
+        for key in self._unreferenced:
+            if key not in self.refcounts and self.rows.pop(key, None) is not None:
+                self._dead_vectors += 1
+        self._unreferenced = set()
+        if self._dead_vectors > max(COMPACT_MIN_ROWS, len(self.rows)):
+            self._compact_store()
+
+        if self.ann_threshold is not None and len(self) >= self.ann_threshold and self._update_ann():
+            self._codes = self._scales = None
+            self._row_refs = []
+            self._alive = np.zeros(0, dtype=bool)
+            self._size = self._live = 0
+            self._doc_rows = CowDict()
+        else:
+            if self.ann is not None or self._codes is None:
+                # Fresh matrix, e.g. after the corpus shrank below ann_threshold
+                self.ann = None
+                self._codes = self._scales = None
+                self._row_refs = []
+                self._alive = np.zeros(0, dtype=bool)
+                self._size = self._live = 0
+                self._doc_rows = CowDict()
+                self._changed = set(self.doc_hashes)
+            self._update_matrix()
+        self._changed = set()
+        self._dirty = False
+
+    def _compact_store(self):
+        """Copy live vectors into a new store; generations using the old one keep reading it"""
+        started = time.perf_counter()
+        keys = list(self.rows)
+        store = VectorStore(self.dimension, self.store_path)
+        for start in range(0, len(keys), COMPACT_MIN_ROWS):
+            block = keys[start:start + COMPACT_MIN_ROWS]
+            store.append(self.store.read([self.rows[key] for key in block]))
+        self.rows = CowDict((key, row) for row, key in enumerate(keys))
+        self.store = store
+        self._dead_vectors = 0
+        self._relocated = True
+        logger.info(f"Compacted vector store to {len(keys)} vectors ({time.perf_counter() - started:.1f}s)")
+
+    def _update_matrix(self):
+        """Mark rows of changed documents dead and append their new codes"""
+        alive = self._alive[:self._size].copy()
+        doc_rows = self._doc_rows
+        live = self._live
+        for doc_id in self._changed:
+            span = doc_rows.pop(doc_id, None)
+            if span is not None:
+                alive[span[0]:span[1]] = False
+                live -= span[1] - span[0]
+        added = sorted(doc_id for doc_id in self._changed if doc_id in self.doc_hashes)
+
+        if self._size - live > max(COMPACT_MIN_ROWS, live):
+            alive, doc_rows = self._compact_matrix(alive, doc_rows)
+
+        pieces = []
+        size = self._size
+        for doc_id in added:
+            count = len(self.doc_hashes[doc_id])
+            doc_rows[doc_id] = (size, size + count)
+            pieces.append(self._doc_matrix(doc_id))
+            size += count
+        if pieces:
+            codes, scales = self.quantizer.encode(np.vstack(pieces))
+            self._append_codes(codes, scales, [(doc_id, position) for doc_id in added
+                                               for position in range(len(self.doc_hashes[doc_id]))])
+            alive = np.concatenate([alive, np.ones(len(codes), dtype=bool)])
+            live += len(codes)
+        self._alive = alive
+        self._live = live
+        self._doc_rows = doc_rows
+
+    def _append_codes(self, codes: np.ndarray, scales: Optional[np.ndarray], refs: List[Tuple[str, int]]):
+        """Write codes after this generation's rows, growing the shared arrays when full
+
+        Rows past _size belong to no published generation, so writing them
+        in place is invisible to generations that share the arrays.
+        """
+        end = self._size + len(codes)
+        if self._codes is None or end > len(self._codes):
+            capacity = max(end, 2 * self._size, 256)
+            grown = np.empty((capacity,) + codes.shape[1:], dtype=codes.dtype)
+            grown[:self._size] = self._codes[:self._size] if self._codes is not None else grown[:0]
+            self._codes = grown
+            if scales is not None:
+                grown_scales = np.empty(capacity, dtype=scales.dtype)
+                grown_scales[:self._size] = self._scales[:self._size] if self._scales is not None else []
+                self._scales = grown_scales
+        self._codes[self._size:end] = codes
+        if scales is not None:
+            self._scales[self._size:end] = scales
+        del self._row_refs[self._size:]
+        self._row_refs.extend(refs)
+        self._size = end
+
+    def _compact_matrix(self, alive: np.ndarray, doc_rows: CowDict):
+        """New arrays holding only live rows; the old ones stay with older generations"""
+        keep = np.flatnonzero(alive)
+        remap = np.full(self._size + 1, -1, dtype=np.int64)
+        remap[keep] = np.arange(len(keep))
+        self._codes = self._codes[keep]
+        self._scales = self._scales[keep] if self._scales is not None else None
+        self._row_refs = [self._row_refs[row] for row in keep.tolist()]
+        self._size = len(keep)
+        compacted = CowDict((doc_id, (int(remap[start]), int(remap[start]) + end - start))
+                            for doc_id, (start, end) in doc_rows.items())
+        return np.ones(len(keep), dtype=bool), compacted
+
+    def _doc_matrix(self, doc_id: str) -> np.ndarray:
+        return self.store.read([self.rows[key] for key in self.doc_hashes[doc_id]])
+
+    def _documents(self, doc_ids) -> Iterator[Tuple[str, np.ndarray, None]]:
+        for doc_id in doc_ids:
+            if doc_id in self.doc_hashes:
+                yield doc_id, self._doc_matrix(doc_id), None
+
+    def _sample(self, count: int, seed: int = 0) -> np.ndarray:
+        """count distinct chunk vectors drawn uniformly across all documents"""
+        names = list(self.doc_hashes)
+        lengths = [len(self.doc_hashes[name]) for name in names]
+        ends = np.cumsum(lengths)
+        picked = np.sort(np.random.default_rng(seed).choice(int(ends[-1]), count, replace=False))
+        owners = np.searchsorted(ends, picked, side='right')
+        starts = ends - lengths
+        return self.store.read(self.rows[self.doc_hashes[names[owner]][row - starts[owner]]]
+                               for row, owner in zip(picked.tolist(), owners.tolist()))
+
+    def _update_ann(self) -> bool:
+        """Apply changed documents to the ANN index, (re)training it when needed
+
+        Returns False if search should stay exact because a trained index
+        missed the recall target (retried once the corpus size doubles or
+        halves).
+        """
+        size = len(self)
+        rejected = self._ann_rejected
+        if self.ann is None and rejected is not None and rejected // 2 <= size <= 2 * rejected:
+            return False
+        state, self._ann_state = self._ann_state, None
+        if state is not None and self.ann is None:
+            # Lists from the snapshot; documents changed since then are re-added below
+            ann = IVFIndex(nprobe=self.nprobe, quantizer=self.quantizer)
+            saved = state['doc_lists']
+            ann.restore(state, ((doc_id, self._doc_matrix(doc_id), saved[doc_id])
+                                for doc_id, hashes in self.doc_hashes.items()
+                                if doc_id in saved and doc_id not in self._changed
+                                and len(saved[doc_id]) == len(hashes)))
+            self._changed.update(set(self.doc_hashes).symmetric_difference(ann.doc_lists))
+            self.ann = ann
+
+        if self.ann is None or self.ann.needs_training(size):
+            started = time.perf_counter()
+            ann = IVFIndex(nprobe=self.nprobe, quantizer=self.quantizer)
+            ann.train(self._sample(ann.training_size(size)), size)
+            ann.update(added=self._documents(self.doc_hashes))
+            target = 1 - self.recall_tolerance
+            if self._tune_ann(ann) < target:
+                logger.warning(f"ANN index reaches recall {ann.recall:.3f} < {target:.3f} at nprobe {ann.nprobe} "
+                               f"of {len(ann.centroids)} lists; keeping exact search for {size} vectors")
+                self.ann = None
+                self._ann_rejected = size
+                return False
+            self.ann = ann
+            self._ann_rejected = None
+            logger.info(f"Trained ANN index: {size} vectors in {len(ann.centroids)} lists, nprobe {ann.nprobe}, "
+                        f"recall@{RECALL_K} {ann.recall:.3f} ({time.perf_counter() - started:.1f}s)")
+        elif self._changed:
+            self.ann.update(self._changed, self._documents(self._changed))
+        return True
+
+    def _tune_ann(self, ann: IVFIndex) -> float:
+        """Raise ann.nprobe from its default until recall against exact search meets the target
+
+        Queries blend several random stored vectors. Short field-label
+        queries sit far from any one chunk, and blends recall like them
+        (pairs or single chunks overstate recall); see benchmark.py for
+        recall on real queries. Past half the lists, probing costs about
+        as much as exact search, so the search stops there. Returns the
+        recall reached.
+        """
+        count = min(RECALL_QUERIES, len(self) // QUERY_BLEND)
+        sample = self._sample(QUERY_BLEND * count, seed=1)
+        queries = sample.reshape(QUERY_BLEND, count, -1).sum(axis=0)
+        queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        truth = self.search_exact(queries, RECALL_K)
+
+        limit = max(1, len(ann.centroids) // 2)
+        nprobe = min(ann.probe_count(), limit)
+        while True:
+            found = ann.search_many(queries, RECALL_K if self.quantizer.exact else RECALL_K * self.rescore_factor,
+                                    nprobe=nprobe)
+            if not self.quantizer.exact:
+                found = self._rescore(queries, found, RECALL_K)
+            ann.nprobe, ann.recall = nprobe, recall_at_k(found, truth)
+            if ann.recall >= 1 - self.recall_tolerance or nprobe >= limit:
+                return ann.recall
+            nprobe = min(2 * nprobe, limit)
+
+    def export(self) -> Dict[str, Any]:
+        """Persistable state; the vectors themselves stay in the store file"""
+        if self._dirty:
+            self._rebuild()
+        rows = dict(self.rows.items())
+        if self.store is not None:
+            self.store.flush()
+        return {
+            'dimension': self.dimension,
+            'vector_file': self.store.name if self.store is not None else None,
+            'vector_rows': max(rows.values()) + 1 if rows else 0,
+            'rows': rows,
+            'doc_hashes': dict(self.doc_hashes.items()),
+            'ann': self.ann.export() if self.ann is not None else None,
+            'ann_rejected': self._ann_rejected
+        }
+
+    def changes(self) -> Optional[Dict[str, Any]]:
+        """What this copy added since it was made: new store rows and attached documents
+
+        Detached documents are not listed; replaying the generation's
+        removals and loads detaches them. None after the store was
+        compacted, since then every row moved.
+        """
+        if self._relocated:
+            return None
+        return {
+            'dimension': self.dimension,
+            'vector_file': self.store.name if self.store is not None else None,
+            'rows': {key: self.rows[key] for key in self._new_keys if key in self.rows},
+            'doc_hashes': {doc_id: self.doc_hashes[doc_id] for doc_id in self._attached
+                           if doc_id in self.doc_hashes}
+        }
+
+    def restore(self, state: Dict[str, Any]) -> bool:
+        """Reopen the saved store and tables; False (and empty) if the store is unusable
+
+        With saved ANN assignments, the next rebuild refills the lists from
+        them instead of training new centroids.
+        """
+        if not state.get('rows'):
+            return False
+        if self.store_path is None or state.get('vector_file') is None:
+            return False
+        try:
+            store = VectorStore(state['dimension'], self.store_path, state['vector_file'], state['vector_rows'])
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unusable vector store: {str(e)}")
+            return False
+
+        self.store = store
+        self.dimension = state['dimension']
+        self.rows = CowDict(state['rows'].items())
+        self.doc_hashes = CowDict()
+        self.refcounts = CowDict()
+        self.chunk_count = 0
+        for doc_id, hashes in state['doc_hashes'].items():
+            if all(key in self.rows for key in hashes):
+                self.set_document_hashes(doc_id, hashes)
+        self.ann = None
+        self._changed = set()
+        self._ann_state = state.get('ann')
+        self._ann_rejected = state.get('ann_rejected')
+        self._codes = None
+        self._dirty = True
+        return True
+
+    def set_document_hashes(self, doc_id: str, hashes: List[str]):
+        """Attach a document's already embedded chunks by hash"""
+        for key in hashes:
+            self.refcounts[key] = self.refcounts.get(key, 0) + 1
+        self._release(doc_id)
+        self.doc_hashes[doc_id] = list(hashes)
+        self.chunk_count += len(hashes)
+        self._attached.add(doc_id)
+        self._changed.add(doc_id)
+        self._dirty = True
+
+    def nbytes(self) -> int:
+        """Memory of the search structure: the code matrix or the ANN lists
+
+        Full-precision vectors are not held in memory (see store_nbytes).
+        """
+        if self.ann is not None:
+            return self.ann.nbytes()
+        if self._codes is None:
+            return 0
+        return codes_nbytes(self._codes, self._scales) + self._alive.nbytes
+
+    def store_nbytes(self) -> int:
+        """Size of the full-precision vectors on disk"""
+        return self.store.nbytes() if self.store is not None else 0
+
+    def search(self, query_vector: List[float], top_k: int = 5,
+               doc_ids: Optional[AbstractSet[str]] = None) -> List[Tuple[float, str, int]]:
+        """Return (cosine score, doc_id, chunk position) for the nearest chunks"""
+        return self.search_many([query_vector], top_k=top_k, doc_ids=doc_ids)[0]
+
+    def search_exact(self, query_vectors, top_k: int = 5) -> List[List[Tuple[float, str, int]]]:
+        """Brute-force top_k over the full-precision vectors in the store
+
+        The reference the approximate paths are measured against. It reads
+        the whole store, so it is for tuning and benchmarks, not requests.
+        """
+        queries = np.asarray(query_vectors, dtype=np.float32)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms == 0, 1, norms)
+        refs = [(doc_id, position) for doc_id, hashes in self.doc_hashes.items() for position in range(len(hashes))]
+        rows = [self.rows[key] for hashes in self.doc_hashes.values() for key in hashes]
+        best: List[List[Tuple[float, str, int]]] = [[] for _ in range(len(queries))]
+        for start in range(0, len(rows), COMPACT_MIN_ROWS):
+            scores = self.store.read(rows[start:start + COMPACT_MIN_ROWS]) @ queries.T
+            block = self._top(scores, refs[start:start + COMPACT_MIN_ROWS], top_k)
+            best = [sorted(old + new, key=lambda hit: -hit[0])[:top_k] for old, new in zip(best, block)]
+        return best
+
+    def _scope_rows(self, doc_ids: AbstractSet[str]) -> np.ndarray:
+        """Matrix rows belonging to the given documents"""
+        ranges = [self._doc_rows[doc_id] for doc_id in doc_ids if doc_id in self._doc_rows]
+        if not ranges:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate([np.arange(start, end) for start, end in sorted(ranges)])
+
+    def search_many(self, query_vectors: List[List[float]], top_k: int = 5,
+                    doc_ids: Optional[AbstractSet[str]] = None,
+                    nprobe: Optional[int] = None) -> List[List[Tuple[float, str, int]]]:
+        """Rank chunks for a batch of queries with one matrix-matrix product
+
+        With doc_ids, only the rows of those documents are multiplied. Once
+        the ANN index is active, nprobe overrides its recall/speed setting.
+        Quantized scores are replaced by exact ones for the returned hits.
+        """
+        if self._dirty:
+            self._rebuild()
+        if (not self._live and self.ann is None) or top_k <= 0 or not query_vectors:
+            return [[] for _ in query_vectors]
+
+        queries = np.asarray(query_vectors, dtype=np.float32)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms == 0, 1, norms)
+
+        # Lossy codes rank a longer shortlist that is rescored exactly
+        shortlist = top_k if self.quantizer.exact else top_k * self.rescore_factor
+        if self.ann is not None:
+            results = self._search_ann(queries, shortlist, doc_ids, nprobe)
+        else:
+            results = self._search_matrix(queries, shortlist, doc_ids)
+
+        if self.quantizer.exact:
+            return results
+        return self._rescore(queries, results, top_k)
+
+    def _search_matrix(self, queries: np.ndarray, top_k: int,
+                       doc_ids: Optional[AbstractSet[str]]) -> List[List[Tuple[float, str, int]]]:
+        codes, scales = self._codes[:self._size], None if self._scales is None else self._scales[:self._size]
+        if doc_ids is not None:
+            row_ids = self._scope_rows(doc_ids)
+            if not len(row_ids):
+                return [[] for _ in queries]
+            scores = self.quantizer.scores(codes[row_ids], scales[row_ids] if scales is not None else None,
+                                           queries)
+            return self._top(scores, self._row_refs, top_k, row_ids)
+
+        scores = self.quantizer.scores(codes, scales, queries)
+        if self._live < self._size:
+            scores[~self._alive] = -np.inf
+        return self._top(scores, self._row_refs, min(top_k, self._live))
+
+    def _rescore(self, queries: np.ndarray, shortlists: List[List[Tuple[float, str, int]]],
+                 top_k: int) -> List[List[Tuple[float, str, int]]]:
+        """Re-rank each query's shortlist by full-precision cosine similarity"""
+        wanted = [self.rows[self.doc_hashes[doc_id][position]]
+                  for shortlist in shortlists for _, doc_id, position in shortlist]
+        vectors = self.store.read(wanted)
+        results = []
+        offset = 0
+        for query, shortlist in zip(queries, shortlists):
+            if not shortlist:
+                results.append([])
+                continue
+            scores = vectors[offset:offset + len(shortlist)] @ query
+            offset += len(shortlist)
+            best = np.argsort(-scores, kind='stable')[:top_k]
+            results.append([(float(scores[i]), shortlist[i][1], shortlist[i][2]) for i in best])
+        return results
+
+    def _search_ann(self, queries: np.ndarray, top_k: int, doc_ids: Optional[AbstractSet[str]],
+                    nprobe: Optional[int]) -> List[List[Tuple[float, str, int]]]:
+        results = self.ann.search_many(queries, top_k, nprobe=nprobe, doc_ids=doc_ids)
+        if doc_ids is None or all(len(result) >= top_k for result in results):
+            return results
+
+        # A scope too narrow to fill top_k from the probed lists is small
+        # enough to scan exactly
+        scoped = [doc_id for doc_id in doc_ids if doc_id in self.doc_hashes]
+        if not scoped:
+            return results
+        matrix = np.vstack([self._doc_matrix(doc_id) for doc_id in scoped])
+        refs = [(doc_id, position) for doc_id in scoped for position in range(len(self.doc_hashes[doc_id]))]
+        return self._top(matrix @ queries.T, refs, top_k)
+
+    @staticmethod
+    def _top(scores: np.ndarray, refs: List[Tuple[str, int]], top_k: int,
+             row_ids: Optional[np.ndarray] = None) -> List[List[Tuple[float, str, int]]]:
+        """Best top_k of a (rows x queries) score matrix; row_ids maps a row subset to refs"""
+        k = min(top_k, scores.shape[0])
+        if k <= 0:
+            return [[] for _ in range(scores.shape[1])]
+        top = np.argpartition(-scores, k - 1, axis=0)[:k]
+
+        results = []
+        for column in range(scores.shape[1]):
+            rows = top[:, column]
+            rows = rows[np.argsort(-scores[rows, column])]
+            ids = rows if row_ids is None else row_ids[rows]
+            results.append([(float(scores[row, column]), *refs[ref]) for row, ref in zip(rows, ids)])
+        return results
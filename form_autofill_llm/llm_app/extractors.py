@@ -0,0 +1,218 @@
+# extractors.py - Turn source files of any supported format into markdown text
+import hashlib
+import io
+import json
+import os
+import re
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # .pdf files are skipped without pypdf
+    PdfReader = None
+
+try:
+    import docx
+except ImportError:  # .docx files are skipped without python-docx
+    docx = None
+
+# Bump whenever an extractor's output changes, so cached text is redone
+EXTRACTION_VERSION = 1
+
+# (raw bytes, path) -> markdown text; must be a module-level function so
+# it can be sent to worker processes
+ExtractFunction = Callable[[bytes, str], str]
+
+# extension -> (extract function, cache its output by content hash)
+Extractors = Dict[str, Tuple[ExtractFunction, bool]]
+
+# Formats that need an optional library: extension -> package to install
+OPTIONAL_FORMATS = {'.pdf': 'pypdf', '.docx': 'python-docx'}
+
+# Keys whose string value titles the object they are in
+TITLE_KEYS = ('formName', 'section', 'title')
+
+
+def decode_text(data: bytes) -> str:
+    """UTF-8 (with or without BOM) text with universal newlines"""
+    text = data.decode('utf-8-sig')
+    return text.replace('\r\n', '\n').replace('\r', '\n')
+
+
+def extract_markdown(data: bytes, path: str) -> str:
+    return decode_text(data)
+
+
+def extract_text(data: bytes, path: str) -> str:
+    return decode_text(data)
+
+
+def _scalar(value: Any) -> str:
+    if isinstance(value, list):
+        return ", ".join(_scalar(item) for item in value if item not in (None, ""))
+    if isinstance(value, bool):
+        return "Yes" if value else "No"
+    return "" if value is None else str(value).strip()
+
+
+def _is_scalar(value: Any) -> bool:
+    return not isinstance(value, (dict, list)) or \
+        (isinstance(value, list) and all(not isinstance(item, (dict, list)) for item in value))
+
+
+def _render_json(value: Any, lines: List[str], level: int, title: Optional[str] = None):
+    if isinstance(value, list):
+        for number, item in enumerate(value, 1):
+            _render_json(item, lines, level, f"{title} {number}" if title and len(value) > 1 else title)
+        return
+    if not isinstance(value, dict):
+        text = _scalar(value)
+        if text:
+            lines.append(f"- {text}")
+        return
+
+    # A form field sample: {"label": ..., "value": ...}
+    if 'label' in value and 'value' in value:
+        text = _scalar(value['value'])
+        if text:
+            lines.append(f"- **{_scalar(value['label'])}**: {text}")
+        return
+
+    title_key = next((key for key in TITLE_KEYS if isinstance(value.get(key), str)), None)
+    heading = value[title_key] if title_key else title
+    if heading:
+        lines.append(f"\n{'#' * min(level, 6)} {heading}\n")
+        level += 1
+    for key, item in value.items():
+        if key == title_key:
+            continue
+        if _is_scalar(item):
+            text = _scalar(item)
+            if text:
+                lines.append(f"- **{key}**: {text}")
+        else:
+            _render_json(item, lines, level, key)
+
+
+def extract_json(data: bytes, path: str) -> str:
+    """Nested objects become headings and scalar values become "- **key**: value" facts"""
+    lines: List[str] = []
+    _render_json(json.loads(decode_text(data)), lines, 1, None)
+    text = re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+    return f"# {Path(path).stem}\n\n{text}\n" if not text.startswith('#') else text + "\n"
+
+
+def extract_pdf(data: bytes, path: str) -> str:
+    """Page text in reading order; pages are separated by blank lines"""
+    reader = PdfReader(io.BytesIO(data))
+    pages = [(page.extract_text() or "").strip() for page in reader.pages]
+    return "\n\n".join(page for page in pages if page) + "\n"
+
+
+def extract_docx(data: bytes, path: str) -> str:
+    """Paragraphs with Word heading and list styles mapped to markdown, then tables"""
+    document = docx.Document(io.BytesIO(data))
+    lines = []
+    for paragraph in document.paragraphs:
+        text = paragraph.text.strip()
+        if not text:
+            continue
+        style = paragraph.style.name if paragraph.style is not None else ""
+        if style == "Title":
+            lines.append(f"\n# {text}\n")
+        elif style.startswith("Heading") and style[7:].strip().isdigit():
+            lines.append(f"\n{'#' * min(int(style[7:]), 6)} {text}\n")
+        elif style.startswith("List"):
+            lines.append(f"- {text}")
+        else:
+            lines.append(f"{text}\n")
+    for table in document.tables:
+        lines.append("")
+        for row in table.rows:
+            cells = [cell.text.strip() for cell in row.cells]
+            if len(cells) == 2 and cells[0] and cells[1]:
+                lines.append(f"- **{cells[0]}**: {cells[1]}")
+            elif any(cells):
+                lines.append("- " + " | ".join(cells))
+    return "\n".join(lines).strip() + "\n"
+
+
+def default_extractors() -> Extractors:
+    """Built-in extractors; formats whose optional library is missing are left out"""
+    extractors: Extractors = {
+        '.md': (extract_markdown, False),
+        '.markdown': (extract_markdown, False),
+        '.txt': (extract_text, False),
+        '.json': (extract_json, True),
+    }
+    if PdfReader is not None:
+        extractors['.pdf'] = (extract_pdf, True)
+    if docx is not None:
+        extractors['.docx'] = (extract_docx, True)
+    return extractors
+
+
+def missing_formats(extractors: Extractors) -> Dict[str, str]:
+    """Optional formats with no extractor: extension -> package that provides it"""
+    return {extension: package for extension, package in OPTIONAL_FORMATS.items() if extension not in extractors}
+
+
+def extractor_for(path: str, extractors: Extractors) -> Optional[Tuple[ExtractFunction, bool]]:
+    return extractors.get(os.path.splitext(path)[1].lower())
+
+
+class ExtractionCache:
+    """Extracted text on disk, keyed by source content hash and extractor
+
+    Workers in different processes share it through the filesystem; every
+    write goes through a temporary file and an atomic rename, so a reader
+    sees either nothing or a complete entry. Hits refresh the entry's
+    mtime, which prune() uses to drop the least recently used entries.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+
+    @staticmethod
+    def key(content_hash: str, extract: ExtractFunction) -> str:
+        name = f"{extract.__module__}.{extract.__qualname__}"
+        return hashlib.md5(f"{content_hash}\0{name}\0{EXTRACTION_VERSION}".encode()).hexdigest()
+
+    def _file(self, key: str) -> Path:
+        return self.path / key[:2] / f"{key}.md"
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._file(key)
+        try:
+            with open(entry, 'r', encoding='utf-8', newline='') as f:
+                text = f.read()
+        except (FileNotFoundError, UnicodeDecodeError):
+            return None
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+        return text
+
+    def put(self, key: str, text: str):
+        entry = self._file(key)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        tmp = entry.with_name(f"{entry.name}.{os.getpid()}.tmp")
+        with open(tmp, 'w', encoding='utf-8', newline='') as f:
+            f.write(text)
+        os.replace(tmp, entry)
+
+    def prune(self, max_entries: int) -> int:
+        """Delete all but the max_entries most recently used entries; returns how many"""
+        if not self.path.exists():
+            return 0
+        entries = sorted(self.path.glob("*/*.md"), key=lambda entry: entry.stat().st_mtime, reverse=True)
+        removed = 0
+        for entry in entries[max_entries:]:
+            try:
+                entry.unlink()
+                removed += 1
+            except OSError:
+                pass
+        return removed
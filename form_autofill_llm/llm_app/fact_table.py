@@ -0,0 +1,156 @@
+# fact_table.py - Deterministic key -> value facts extracted from profile markdown
+import re
+from typing import Any, Dict, FrozenSet, List, Optional
+
+from cow_dict import CowDict
+from markdown_chunker import HEADING_PATTERN
+from text_utils import tokenize
+
+# "- **Email**: jane@example.com" and "- **Email:** jane@example.com"
+FACT_PATTERN = re.compile(r"^\s*[-*+]\s+\*\*(.+?):?\*\*:?\s*(.+?)\s*$")
+LINK_PATTERN = re.compile(r"\[([^\]]*)\]\(([^)]+)\)")
+
+# Form labels that mean the same thing as a profile key
+ALIASES = {
+    'phone number': 'phone',
+    'mobile': 'phone',
+    'mobile number': 'phone',
+    'mobile phone': 'phone',
+    'cell phone': 'phone',
+    'telephone': 'phone',
+    'email address': 'email',
+    'mail': 'email',
+    'name': 'full name',
+    'legal name': 'full name',
+    'zip': 'zip code',
+    'postal code': 'zip code',
+    'street address': 'address',
+    'address line 1': 'address',
+    'linkedin profile': 'linkedin',
+    'linkedin url': 'linkedin',
+}
+
+EXACT_CONFIDENCE = 1.0
+ALIAS_CONFIDENCE = 0.95
+
+
+def label_key(label: str) -> FrozenSet[str]:
+    """Normalize a field label or fact key to its set of index terms"""
+    return frozenset(tokenize(label))
+
+
+ALIAS_KEYS = {label_key(alias): label_key(target) for alias, target in ALIASES.items()}
+
+
+def _clean_value(value: str) -> str:
+    """Strip markdown from a fact value; links become their URL"""
+    value = LINK_PATTERN.sub(lambda m: m.group(2), value)
+    return value.replace('**', '').replace('`', '').strip()
+
+
+def extract_facts(content: str) -> List[Dict[str, str]]:
+    """Collect "- **Key**: value" lines with the heading they appear under"""
+    facts = []
+    headings: List[str] = []
+    for line in content.splitlines():
+        heading_match = HEADING_PATTERN.match(line)
+        if heading_match:
+            level = len(heading_match.group(1))
+            headings = headings[:level - 1] + [heading_match.group(2).strip()]
+            continue
+
+        match = FACT_PATTERN.match(line)
+        if not match:
+            continue
+        value = _clean_value(match.group(2))
+        if value:
+            facts.append({
+                'key': match.group(1).strip(),
+                'value': value,
+                'heading_path': " > ".join(headings)
+            })
+
+    # First/last name are asked for far more often than the full name
+    for fact in list(facts):
+        if label_key(fact['key']) == label_key('full name'):
+            parts = fact['value'].split()
+            if len(parts) >= 2:
+                facts.append(dict(fact, key='First Name', value=parts[0]))
+                facts.append(dict(fact, key='Last Name', value=parts[-1]))
+    return facts
+
+
+class FactTable:
+    """Index of document facts by normalized key, updated per document"""
+
+    def __init__(self):
+        # doc_id -> facts, and normalized key -> facts of every document
+        self.doc_facts: CowDict = CowDict()
+        self.by_key: CowDict = CowDict()
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def copy(self) -> "FactTable":
+        """Copy-on-write copy; fact lists are replaced, never mutated, so they can be shared"""
+        clone = FactTable()
+        clone.doc_facts = self.doc_facts.copy()
+        clone.by_key = self.by_key.copy()
+        clone.size = self.size
+        return clone
+
+    def add_document(self, doc_id: str, facts: List[Dict[str, str]]):
+        self.remove_document(doc_id)
+        self.doc_facts[doc_id] = facts
+        self.size += len(facts)
+        for fact in facts:
+            key = label_key(fact['key'])
+            if key:
+                self.by_key[key] = self.by_key.get(key, []) + [dict(fact, filename=doc_id)]
+
+    def remove_document(self, doc_id: str):
+        facts = self.doc_facts.pop(doc_id, None)
+        if facts is None:
+            return
+        self.size -= len(facts)
+        for key in {label_key(fact['key']) for fact in facts}:
+            if key not in self.by_key:
+                continue
+            remaining = [fact for fact in self.by_key[key] if fact['filename'] != doc_id]
+            if remaining:
+                self.by_key[key] = remaining
+            else:
+                del self.by_key[key]
+
+    def lookup(self, label: str) -> Optional[Dict[str, Any]]:
+        """Return the fact answering a form label, with a confidence score
+
+        Only exact key matches (after dropping stopwords, so "What is your
+        email?" matches "Email") and known aliases qualify. Keys that map to
+        conflicting values in different places are treated as unknown.
+        """
+        key = label_key(label)
+        if not key:
+            return None
+
+        confidence = EXACT_CONFIDENCE
+        candidates = self.by_key.get(key)
+        if not candidates and key in ALIAS_KEYS:
+            confidence = ALIAS_CONFIDENCE
+            candidates = self.by_key.get(ALIAS_KEYS[key])
+        if not candidates:
+            return None
+
+        values = {fact['value'] for fact in candidates}
+        if len(values) != 1:
+            return None
+
+        fact = candidates[0]
+        return {
+            'value': fact['value'],
+            'confidence': confidence,
+            'key': fact['key'],
+            'filename': fact['filename'],
+            'heading_path': fact['heading_path']
+        }
@@ -0,0 +1,226 @@
+# fill_cache.py - Two-tier (memory LRU + SQLite) cache of filled forms
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Bump when the prompt or post-processing changes, so old answers are not served
+FILL_CACHE_VERSION = 1
+
+
+def normalize_field_name(name: str) -> str:
+    """Field identity for caching: whitespace-collapsed, case-insensitive"""
+    return " ".join(name.split()).casefold()
+
+
+def fill_key(field_names: Iterable[str], corpus_hash: str, model: str, temperature: float) -> str:
+    """Cache key of a form: its normalized field set, the corpus and the sampling setup"""
+    fields = sorted({normalize_field_name(name) for name in field_names})
+    payload = json.dumps([FILL_CACHE_VERSION, fields, corpus_hash, model, temperature])
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+class FormFillCache:
+    """Filled forms keyed by field set, corpus hash, model and temperature
+
+    The memory tier is a small LRU; the SQLite tier survives restarts and
+    is shared by every form with the same field set, whatever its URL.
+    Values are stored under normalized field names and mapped back to the
+    caller's exact names on a hit. Because the corpus hash is part of the
+    key a stale answer can never be served; invalidate() additionally
+    drops entries for any other corpus once RAGManager publishes a
+    changed one. If the database cannot be opened the cache keeps working
+    in memory only.
+
+    SQLite is never touched on the event loop. Memory hits are answered
+    directly. Disk reads are awaited on the cache's own database thread.
+    Writes and invalidations update memory immediately and queue the disk
+    work on that same thread, so it is applied in order.
+    """
+
+    def __init__(self,
+                 path: Optional[str] = "./.rag_index/form_fills.sqlite3",
+                 max_memory_entries: int = 256,
+                 max_disk_entries: int = 5000):
+        self.path = Path(path) if path else None
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.corpus_hashes: Dict[str, str] = {}
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._disk_entries: Optional[int] = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.invalidated = 0
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        if self._db is None and self.path is not None:
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                db = sqlite3.connect(str(self.path), check_same_thread=False)
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute("PRAGMA synchronous=NORMAL")
+                db.execute("""CREATE TABLE IF NOT EXISTS fills (
+                                  key TEXT PRIMARY KEY,
+                                  corpus_hash TEXT NOT NULL,
+                                  fields TEXT NOT NULL,
+                                  last_used REAL NOT NULL)""")
+                db.execute("CREATE INDEX IF NOT EXISTS fills_last_used ON fills (last_used)")
+                db.commit()
+                self._disk_entries = db.execute("SELECT COUNT(*) FROM fills").fetchone()[0]
+                self._db = db
+            except sqlite3.Error as e:
+                logger.warning(f"Form fill cache database unavailable, using memory only: {str(e)}")
+                self.path = None
+        return self._db
+
+    async def get(self, key: str, field_names: Iterable[str]) -> Optional[Dict[str, Any]]:
+        """Cached values for exactly these field names, or None"""
+        values = self.entries.get(key)
+        if values is not None:
+            self.entries.move_to_end(key)
+            self.memory_hits += 1
+            return self._for_fields(values, field_names)
+
+        row = None
+        if self.path is not None:
+            loop = asyncio.get_running_loop()
+            row = await loop.run_in_executor(self._executor, self._read, key)
+        if row is None:
+            self.misses += 1
+            return None
+
+        values = json.loads(row[1])
+        self._remember(key, row[0], values)
+        self.disk_hits += 1
+        return self._for_fields(values, field_names)
+
+    def put(self, key: str, corpus_hash: str, filled: Dict[str, Any]):
+        """Remember a filled form now; it is written to disk in the background"""
+        values = {normalize_field_name(name): value for name, value in filled.items()}
+        self._remember(key, corpus_hash, values)
+        if self.path is not None:
+            self._executor.submit(self._write, key, corpus_hash, json.dumps(values))
+
+    def invalidate(self, corpus_hash: str) -> int:
+        """Drop every entry computed for a corpus other than corpus_hash
+
+        Memory is cleared at once and stale rows are deleted from disk in
+        the background. Returns how many entries were dropped from memory.
+        """
+        stale = [key for key, entry_hash in self.corpus_hashes.items() if entry_hash != corpus_hash]
+        for key in stale:
+            self.entries.pop(key, None)
+            del self.corpus_hashes[key]
+        if self.path is not None:
+            self._executor.submit(self._delete_stale, corpus_hash, len(stale))
+        elif stale:
+            self._count_invalidated(len(stale))
+        return len(stale)
+
+    def on_publish(self, generation):
+        """RAGManager publish listener: forget fills of the previous corpus"""
+        self.invalidate(generation.corpus_hash())
+
+    def flush(self):
+        """Block until queued disk writes are done (for shutdown and tests)"""
+        self._executor.submit(lambda: None).result()
+
+    def close(self):
+        """Finish queued writes and close the database"""
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    # Database work, run on the cache's single database thread
+
+    def _read(self, key: str):
+        with self._lock:
+            db = self._connection()
+            if db is None:
+                return None
+            try:
+                row = db.execute("SELECT corpus_hash, fields FROM fills WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    db.execute("UPDATE fills SET last_used = ? WHERE key = ?", (time.time(), key))
+                    db.commit()
+                return row
+            except sqlite3.Error as e:
+                logger.warning(f"Form fill cache read failed: {str(e)}")
+                return None
+
+    def _write(self, key: str, corpus_hash: str, fields: str):
+        with self._lock:
+            db = self._connection()
+            if db is None:
+                return
+            try:
+                db.execute("INSERT OR REPLACE INTO fills (key, corpus_hash, fields, last_used) VALUES (?, ?, ?, ?)",
+                           (key, corpus_hash, fields, time.time()))
+                # Keep the most recently used max_disk_entries
+                db.execute("""DELETE FROM fills WHERE key IN (
+                                  SELECT key FROM fills ORDER BY last_used DESC LIMIT -1 OFFSET ?)""",
+                           (self.max_disk_entries,))
+                db.commit()
+                self._disk_entries = db.execute("SELECT COUNT(*) FROM fills").fetchone()[0]
+            except sqlite3.Error as e:
+                logger.warning(f"Form fill cache write failed: {str(e)}")
+
+    def _delete_stale(self, corpus_hash: str, removed: int):
+        with self._lock:
+            db = self._connection()
+            if db is not None:
+                try:
+                    cursor = db.execute("DELETE FROM fills WHERE corpus_hash != ?", (corpus_hash,))
+                    db.commit()
+                    removed = max(removed, cursor.rowcount)
+                    self._disk_entries = db.execute("SELECT COUNT(*) FROM fills").fetchone()[0]
+                except sqlite3.Error as e:
+                    logger.warning(f"Form fill cache invalidation failed: {str(e)}")
+        if removed:
+            self._count_invalidated(removed)
+
+    def _count_invalidated(self, removed: int):
+        self.invalidated += removed
+        logger.info(f"Invalidated {removed} cached form fills after a document change")
+
+    def _remember(self, key: str, corpus_hash: str, values: Dict[str, Any]):
+        if self.max_memory_entries <= 0:
+            return
+        self.entries[key] = values
+        self.entries.move_to_end(key)
+        self.corpus_hashes[key] = corpus_hash
+        while len(self.entries) > self.max_memory_entries:
+            evicted, _ = self.entries.popitem(last=False)
+            del self.corpus_hashes[evicted]
+
+    @staticmethod
+    def _for_fields(values: Dict[str, Any], field_names: Iterable[str]) -> Dict[str, Any]:
+        return {name: values.get(normalize_field_name(name), "") for name in field_names}
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters only; disk_entries is as of the last database write"""
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            'memory_entries': len(self.entries),
+            'disk_entries': self._disk_entries,
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'invalidated': self.invalidated,
+            'hit_rate': round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0
+        }
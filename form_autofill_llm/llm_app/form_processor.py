@@ -1,18 +1,81 @@
 # form_processor.py - Orchestrates form field processing
+import asyncio
 import logging
-from typing import Dict, Any, Optional
+import math
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
 from llm_service import LLMService
 from rag_manager import RAGManager
+from context_packer import combine_reports, merge_field_hits, pack_context
+from answer_memo import is_grounded
+from fill_cache import fill_key
+from text_utils import tokenize
 
 logger = logging.getLogger(__name__)
 
+# Field label terms that route a field's retrieval to one document category.
+# The first matching route wins, so routes go from most to least specific:
+# a concrete profile value ("Contact phone") beats a broad preference word
+# ("contact") in the same label. A category may appear more than once.
+# Scoping is opt-in per document: a Markdown file declares its category in
+# front matter ("---\ncategory: profile\ntags: [contact]\n---", as the
+# bundled md_docs do). Files without it match every route, and a route
+# whose category no document declares searches all documents
+SCOPE_ROUTES = [
+    ('profile', {
+        'email', 'phone', 'mobile', 'address', 'city', 'zip', 'postal', 'country', 'linkedin', 'github',
+        'website', 'portfolio', 'school', 'university', 'degree', 'gpa', 'graduation', 'major'
+    }),
+    ('preferences', {
+        'salary', 'compensation', 'relocate', 'relocation', 'notice', 'sponsorship', 'sponsor',
+        'authorization', 'authorized', 'veteran', 'disability', 'gender', 'race', 'ethnicity', 'hispanic',
+        'latino', 'orientation', 'pronouns', 'clearance'
+    }),
+    ('profile', {
+        'name', 'first', 'last', 'state', 'employer', 'company', 'title', 'experience', 'skills',
+        'certifications', 'education'
+    }),
+    ('preferences', {
+        'contact', 'text', 'marketing', 'travel', 'remote', 'start', 'availability', 'available', 'pay', 'rate'
+    }),
+]
+
 
 class FormProcessor:
     """Processes form fields using LLM and RAG"""
     
-    def __init__(self, llm_service: LLMService, rag_manager: RAGManager):
+    def __init__(self,
+                 llm_service: LLMService,
+                 rag_manager: RAGManager,
+                 context_token_budget: int = 3000,
+                 per_field_top_k: int = 4,
+                 min_per_field: int = 2,
+                 fact_confidence: float = 0.9,
+                 scope_routes=None,
+                 digest=None,
+                 fill_cache=None,
+                 answer_memo=None,
+                 shard_size: int = 12,
+                 max_parallel_shards: int = 4):
         self.llm_service = llm_service
         self.rag_manager = rag_manager
+        self.context_token_budget = context_token_budget
+        self.per_field_top_k = per_field_top_k
+        self.min_per_field = min_per_field
+        self.fact_confidence = fact_confidence
+        self.scope_routes = SCOPE_ROUTES if scope_routes is None else scope_routes
+        # Optional ProfileDigest; its compact context is preferred when current
+        self.digest = digest
+        # Optional FormFillCache; repeat fills of a form skip retrieval and the LLM
+        self.fill_cache = fill_cache
+        # Optional FieldAnswerMemo; recurring labels are answered without the LLM
+        self.answer_memo = answer_memo
+        # Large forms are split into shards of about shard_size fields, each
+        # with its own context; at most max_parallel_shards LLM calls run at once
+        self.shard_size = shard_size
+        self.max_parallel_shards = max(1, max_parallel_shards)
+        self._shard_slots = asyncio.Semaphore(self.max_parallel_shards)
+        # Context packing report of the most recent form, combined over its shards
+        self.last_context_report = None
         
     async def process_form(self,
                           fields: Dict[str, str],
@@ -26,45 +89,358 @@ class FormProcessor:
         
         logger.info(f"Processing {len(fields)} form fields")
         
-        # Get relevant context from RAG
-        context = await self._get_context_for_fields(fields)
+        # Pin one index generation so a concurrent reload cannot mix versions
+        generation = self.rag_manager.pin()
         
-        if not context:
-            logger.warning("No context available from documents")
-            context = "No user information available."
+        cache_key = self._fill_cache_key(fields, generation)
+        if cache_key is not None:
+            cached = await self.fill_cache.get(cache_key, fields.keys())
+            if cached is not None:
+                logger.info(f"Served {len(cached)} fields from the form fill cache")
+                return cached
         
-        logger.debug(f"Context length: {len(context)} characters")
+        # Answer known profile fields from the fact table, then recurring labels from the memo
+        facts = self._resolve_from_facts(fields, generation)
+        memo = self._resolve_from_memo(fields, facts, generation)
+        filled_fields = {**facts, **memo}
+        remaining = {name: value for name, value in fields.items() if name not in filled_fields}
+        logger.info(f"Resolved {len(facts)} fields from facts and {len(memo)} from the answer memo, "
+                    f"{len(remaining)} left for the LLM")
         
-        # Use LLM to fill fields
-        filled_fields = await self.llm_service.fill_form_fields(
-            fields=fields,
-            context=context,
-            url=url,
-            title=title
-        )
+        llm_fields = {}
+        evidence = {}
+        reports = []
+        llm_answered = False
+        if remaining:
+            # Use LLM to fill fields
+            llm_fields = await self._fill_with_llm(remaining, generation, url, title, evidence, reports)
+            filled_fields.update(llm_fields)
+            llm_answered = any(value not in (None, "") for value in llm_fields.values())
+            self.last_context_report = combine_reports(reports)
         
         # Post-process the filled fields
         filled_fields = self._post_process_fields(filled_fields, fields)
         
+        grounded = [name for name, value in llm_fields.items() if is_grounded(value, evidence.get(name, ""))]
+        self._remember_answers({name: filled_fields[name] for name in llm_fields}, generation, grounded)
+        if cache_key is not None and llm_answered:
+            self.fill_cache.put(cache_key, generation.corpus_hash(), filled_fields)
+        
         return filled_fields
     
-    async def _get_context_for_fields(self, fields: Dict[str, str]) -> str:
-        """Get relevant context for the form fields"""
+    async def stream_form(self,
+                          fields: Dict[str, str],
+                          url: Optional[str] = None,
+                          title: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Yield {"field", "value", "source"} for each field as soon as it is filled
+        
+        Fact-table and answer-memo answers come first, then LLM answers in
+        the order the model closes them. Values are post-processed exactly as in
+        process_form, and every field is yielded once. A cached fill is
+        replayed at once, and a streamed fill is cached like process_form's.
+        """
+        if not fields:
+            logger.warning("No fields provided")
+            return
+        
+        logger.info(f"Streaming {len(fields)} form fields")
+        generation = self.rag_manager.pin()
+        
+        cache_key = self._fill_cache_key(fields, generation)
+        if cache_key is not None:
+            cached = await self.fill_cache.get(cache_key, fields.keys())
+            if cached is not None:
+                logger.info(f"Served {len(cached)} fields from the form fill cache")
+                for name, value in cached.items():
+                    yield {"field": name, "value": value, "source": "cache"}
+                return
+        
+        facts = self._resolve_from_facts(fields, generation)
+        filled_fields = {}
+        for name, value in facts.items():
+            filled_fields[name] = self._post_process_value(name, value)
+            yield {"field": name, "value": filled_fields[name], "source": "facts"}
+        memo = self._resolve_from_memo(fields, facts, generation)
+        for name, value in memo.items():
+            filled_fields[name] = self._post_process_value(name, value)
+            yield {"field": name, "value": filled_fields[name], "source": "memo"}
+        remaining = {name: value for name, value in fields.items() if name not in filled_fields}
+        if not remaining:
+            return
+        
+        llm_fields = {}
+        evidence = {}
+        reports = []
+        grounded = []
+        llm_answered = False
+        async for name, value in self._stream_with_llm(remaining, generation, url, title, evidence, reports):
+            llm_answered = llm_answered or value not in (None, "")
+            if is_grounded(value, evidence.get(name, "")):
+                grounded.append(name)
+            filled_fields[name] = llm_fields[name] = self._post_process_value(name, value)
+            yield {"field": name, "value": filled_fields[name], "source": "llm"}
+        
+        self.last_context_report = combine_reports(reports)
+        self._remember_answers(llm_fields, generation, grounded)
+        if cache_key is not None and llm_answered:
+            self.fill_cache.put(cache_key, generation.corpus_hash(), filled_fields)
+    
+    def _shard_fields(self, fields: Dict[str, str], generation) -> List[Dict[str, str]]:
+        """Split fields into balanced shards of at most shard_size, keeping routed categories together"""
+        if self.shard_size <= 0 or len(fields) <= self.shard_size:
+            return [fields]
+        
+        # Fields searched in the same category share a shard, so each shard's
+        # retrieved context stays focused
+        groups = {}
+        for name, value in fields.items():
+            groups.setdefault(self._field_scope(name, generation.category_counts), []).append((name, value))
+        ordered = [item for group in groups.values() for item in group]
+        
+        size = math.ceil(len(ordered) / math.ceil(len(ordered) / self.shard_size))
+        return [dict(ordered[i:i + size]) for i in range(0, len(ordered), size)]
+    
+    async def _fill_with_llm(self, fields: Dict[str, str], generation,
+                             url: Optional[str], title: Optional[str],
+                             evidence: Optional[Dict[str, str]] = None,
+                             reports: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """LLM answers for the fields, one concurrent call per shard
+        
+        A failed shard only leaves its own fields empty. If evidence is
+        given it receives the source evidence each field was answered from,
+        and reports receives each shard's context packing report.
+        """
+        shards = self._shard_fields(fields, generation)
+        if len(shards) > 1:
+            logger.info(f"Filling {len(fields)} fields in {len(shards)} shards "
+                        f"(up to {self.max_parallel_shards} at once)")
+        
+        async def fill_shard(shard: Dict[str, str]) -> Dict[str, Any]:
+            try:
+                context, sources = await self._context_for(shard, generation, reports)
+                if evidence is not None:
+                    evidence.update(dict.fromkeys(shard, sources))
+                async with self._shard_slots:
+                    return await self.llm_service.fill_form_fields(
+                        fields=shard,
+                        context=context,
+                        url=url,
+                        title=title
+                    )
+            except Exception as e:
+                logger.error(f"LLM shard of {len(shard)} fields failed: {str(e)}")
+                return {}
+        
+        results = await asyncio.gather(*(fill_shard(shard) for shard in shards))
+        merged = {}
+        for shard, result in zip(shards, results):
+            merged.update({name: value for name, value in result.items() if name in shard})
+        return merged
+    
+    async def _stream_with_llm(self, fields: Dict[str, str], generation,
+                               url: Optional[str], title: Optional[str],
+                               evidence: Optional[Dict[str, str]] = None,
+                               reports: Optional[List[Dict[str, Any]]] = None) -> AsyncIterator[Tuple[str, Any]]:
+        """Streaming counterpart of _fill_with_llm: (field, value) pairs from all shards as they close"""
+        shards = self._shard_fields(fields, generation)
+        if len(shards) > 1:
+            logger.info(f"Streaming {len(fields)} fields in {len(shards)} shards "
+                        f"(up to {self.max_parallel_shards} at once)")
+        queue: asyncio.Queue = asyncio.Queue()
+        
+        async def stream_shard(shard: Dict[str, str]):
+            try:
+                context, sources = await self._context_for(shard, generation, reports)
+                if evidence is not None:
+                    evidence.update(dict.fromkeys(shard, sources))
+                async with self._shard_slots:
+                    async for item in self.llm_service.stream_form_fields(
+                            fields=shard,
+                            context=context,
+                            url=url,
+                            title=title):
+                        queue.put_nowait(item)
+            except Exception as e:
+                logger.error(f"LLM shard of {len(shard)} fields failed: {str(e)}")
+            finally:
+                queue.put_nowait(None)
+        
+        tasks = [asyncio.create_task(stream_shard(shard)) for shard in shards]
+        emitted = set()
+        try:
+            running = len(tasks)
+            while running:
+                item = await queue.get()
+                if item is None:
+                    running -= 1
+                elif item[0] in fields and item[0] not in emitted:
+                    emitted.add(item[0])
+                    yield item
+        finally:
+            # Stop shards still generating if the consumer went away
+            for task in tasks:
+                task.cancel()
+        
+        # Fields of a shard that failed outright
+        for name in fields:
+            if name not in emitted:
+                yield name, ""
+    
+    def _resolve_from_memo(self, fields: Dict[str, str], resolved: Dict[str, Any], generation) -> Dict[str, Any]:
+        """Memoized answers for the fields not already resolved"""
+        if self.answer_memo is None:
+            return {}
+        unresolved = [name for name in fields if name not in resolved]
+        return self.answer_memo.lookup(unresolved, generation.corpus_hash(), self.llm_service.model)
+    
+    def _remember_answers(self, answers: Dict[str, Any], generation, grounded: List[str]):
+        """Memoize the LLM's post-processed answers for later forms
+        
+        Only the grounded ones (found in the source evidence the LLM was
+        given) are trusted straight away; the memo holds back the rest until
+        repeated.
+        """
+        if self.answer_memo is not None and answers:
+            self.answer_memo.remember(answers, generation.corpus_hash(), self.llm_service.model,
+                                      grounded=grounded)
+    
+    def _fill_cache_key(self, fields: Dict[str, str], generation) -> Optional[str]:
+        """Form fill cache key for these fields on this generation, if caching is enabled"""
+        if self.fill_cache is None:
+            return None
+        return fill_key(fields.keys(), generation.corpus_hash(),
+                        self.llm_service.model, self.llm_service.temperature)
+    
+    async def _context_for(self, fields: Dict[str, str], generation,
+                           reports: Optional[List[Dict[str, Any]]] = None) -> Tuple[str, str]:
+        """Context for the fields the LLM has to fill, and the source evidence in it
         
-        # For comprehensive forms, get all context
-        if len(fields) > 10:
-            logger.info("Large form detected, using all context")
-            return self.rag_manager.get_all_context()
+        A current profile digest leads the context and the rest of the token
+        budget goes to retrieval for these fields, so questions the digest
+        does not cover still get their evidence. The evidence is the
+        retrieved document text plus the digest's fact-table values; the
+        rest of the digest is itself LLM output, so an answer copied from it
+        is not grounded.
+        """
+        parts = []
+        sources = []
+        token_budget = self.context_token_budget
+        digest = self.digest.digest_for(generation) if self.digest is not None else None
+        if digest is not None:
+            parts.append(digest['text'])
+            token_budget -= digest['tokens']
+            sources.extend(str(value) for value in digest['facts'].values())
+            logger.info(f"Using profile digest as context prefix ({digest['tokens']} tokens, "
+                        f"{max(token_budget, 0)} left for retrieval)")
         
-        # For smaller forms, get targeted context
-        query_parts = []
+        if token_budget > 0:
+            # Get relevant context from RAG
+            retrieved = await self._get_context_for_fields(fields, generation, token_budget, reports)
+            if retrieved:
+                sources.append(retrieved)
+                parts.append(f"DOCUMENT EXCERPTS:\n{retrieved}" if parts else retrieved)
+        context = "\n\n".join(parts)
+        
+        if not context:
+            logger.warning("No context available from documents")
+            context = "No user information available."
+        
+        logger.debug(f"Context length: {len(context)} characters")
+        return context, "\n".join(sources)
+    
+    def _resolve_from_facts(self, fields: Dict[str, str], generation=None) -> Dict[str, Any]:
+        """Fill fields whose label matches a profile fact with high confidence"""
+        resolved = {}
         for field_name in fields.keys():
-            query_parts.append(field_name)
+            fact = self.rag_manager.lookup_fact(field_name, generation=generation)
+            if fact is not None and fact['confidence'] >= self.fact_confidence:
+                resolved[field_name] = fact['value']
+                logger.debug(f"Fact match for {field_name!r}: {fact['key']} ({fact['filename']})")
+        return resolved
+    
+    async def _get_context_for_fields(self, fields: Dict[str, str], generation=None,
+                                      token_budget: Optional[int] = None,
+                                      reports: Optional[List[Dict[str, Any]]] = None) -> str:
+        """Retrieve evidence per field and pack it into token_budget (default context_token_budget)
         
-        query = " ".join(query_parts)
-        relevant_context = self.rag_manager.get_relevant_context(query, top_k=5)
+        The packing report is appended to reports, if given; concurrent
+        shards each pass their call's list instead of sharing an attribute.
+        """
         
-        return relevant_context
+        # Labels with the same index terms ("Email", "E-mail:") share one query
+        clusters = {}
+        for field_name in fields.keys():
+            key = frozenset(tokenize(field_name))
+            if key:
+                clusters.setdefault(key, field_name)
+        
+        queries = list(clusters.values())
+        if not queries:
+            return await self.rag_manager.get_relevant_context(" ".join(fields.keys()), top_k=5,
+                                                               generation=generation)
+        
+        per_field_hits = await self._search_scoped(queries, generation)
+        hits = merge_field_hits(per_field_hits, min_per_field=self.min_per_field)
+        if not hits:
+            return await self.rag_manager.get_relevant_context(" ".join(queries), top_k=5,
+                                                               generation=generation)
+        
+        if token_budget is None:
+            token_budget = self.context_token_budget
+        context, report = pack_context(hits, token_budget)
+        if reports is not None:
+            reports.append(report)
+        
+        logger.info(f"Retrieved context for {len(queries)} field queries: "
+                    f"packed {len(report['included'])} chunks "
+                    f"({report['tokens_used']}/{report['token_budget']} tokens), "
+                    f"dropped {len(report['dropped'])}")
+        for entry in report['dropped']:
+            logger.debug(f"Dropped {entry['filename']} ({entry['heading_path']}): {entry['reason']}")
+        
+        return context
+    
+    def _field_scope(self, label: str, categories) -> Optional[str]:
+        """Document category a field should be searched in, if one applies
+
+        The most specific matching route decides; if no document has its
+        category the field is searched everywhere rather than routed on.
+        """
+        terms = set(tokenize(label))
+        for category, route_terms in self.scope_routes:
+            if terms & route_terms:
+                return category if category in categories else None
+        return None
+    
+    async def _search_scoped(self, queries, generation=None):
+        """Search each query in its routed category, falling back to all documents"""
+        generation = generation or self.rag_manager.pin()
+        groups = {}
+        for i, query in enumerate(queries):
+            scope = self._field_scope(query, generation.category_counts)
+            groups.setdefault(scope, []).append(i)
+        
+        per_field_hits = [[] for _ in queries]
+        for scope, indexes in groups.items():
+            filters = {'category': scope} if scope else None
+            results = await self.rag_manager.search_many([queries[i] for i in indexes],
+                                                         top_k=self.per_field_top_k,
+                                                         generation=generation, filters=filters)
+            for i, hits in zip(indexes, results):
+                per_field_hits[i] = hits
+        
+        # Routed fields with nothing in their category get a corpus-wide search
+        retry = [i for scope, indexes in groups.items() if scope
+                 for i in indexes if not per_field_hits[i]]
+        if retry:
+            results = await self.rag_manager.search_many([queries[i] for i in retry],
+                                                         top_k=self.per_field_top_k,
+                                                         generation=generation)
+            for i, hits in zip(retry, results):
+                per_field_hits[i] = hits
+        
+        logger.debug(f"Field scopes: { {scope: len(indexes) for scope, indexes in groups.items()} }")
+        return per_field_hits
     
     def _post_process_fields(self, 
                             filled_fields: Dict[str, Any],
@@ -76,40 +452,7 @@ class FormProcessor:
         for field_name, value in filled_fields.items():
             if field_name not in original_fields:
                 continue
-                
-            # Ensure value is a string if not None
-            if value is None:
-                processed[field_name] = ""
-                continue
-            
-            # Handle boolean values
-            if isinstance(value, bool):
-                processed[field_name] = "Yes" if value else "No"
-                continue
-            
-            # Convert to string and clean
-            str_value = str(value).strip()
-            
-            # Handle common patterns
-            field_lower = field_name.lower()
-            
-            # Email validation
-            if 'email' in field_lower and '@' not in str_value and str_value:
-                logger.warning(f"Invalid email format for {field_name}: {str_value}")
-            
-            # Phone number cleaning
-            if 'phone' in field_lower or 'tel' in field_lower:
-                str_value = self._clean_phone_number(str_value)
-            
-            # Date validation
-            if 'date' in field_lower or 'when' in field_lower:
-                str_value = self._normalize_date(str_value)
-            
-            # Yes/No normalization
-            if any(keyword in field_lower for keyword in ['willing', 'able', 'have you', 'do you', 'are you']):
-                str_value = self._normalize_yes_no(str_value)
-            
-            processed[field_name] = str_value
+            processed[field_name] = self._post_process_value(field_name, value)
         
         # Ensure all original fields are present
         for field_name in original_fields.keys():
@@ -118,6 +461,40 @@ class FormProcessor:
         
         return processed
     
+    def _post_process_value(self, field_name: str, value: Any) -> str:
+        """Normalize one filled value for its field"""
+        # Ensure value is a string if not None
+        if value is None:
+            return ""
+        
+        # Handle boolean values
+        if isinstance(value, bool):
+            return "Yes" if value else "No"
+        
+        # Convert to string and clean
+        str_value = str(value).strip()
+        
+        # Handle common patterns
+        field_lower = field_name.lower()
+        
+        # Email validation
+        if 'email' in field_lower and '@' not in str_value and str_value:
+            logger.warning(f"Invalid email format for {field_name}: {str_value}")
+        
+        # Phone number cleaning
+        if 'phone' in field_lower or 'tel' in field_lower:
+            str_value = self._clean_phone_number(str_value)
+        
+        # Date validation
+        if 'date' in field_lower or 'when' in field_lower:
+            str_value = self._normalize_date(str_value)
+        
+        # Yes/No normalization
+        if any(keyword in field_lower for keyword in ['willing', 'able', 'have you', 'do you', 'are you']):
+            str_value = self._normalize_yes_no(str_value)
+        
+        return str_value
+    
     def _clean_phone_number(self, phone: str) -> str:
         """Clean and format phone number"""
         if not phone:
@@ -0,0 +1,86 @@
+# front_matter.py - YAML front matter and per-file categories for retrieval scopes
+import logging
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import yaml
+except ImportError:  # Fall back to simple "key: value" front matter
+    yaml = None
+
+logger = logging.getLogger(__name__)
+
+FRONT_MATTER_PATTERN = re.compile(r"\A---[ \t]*\r?\n(.*?)\r?\n---[ \t]*(?:\r?\n|\Z)", re.DOTALL)
+
+
+def _parse_simple(block: str) -> Dict[str, Any]:
+    """Minimal parser for flat "key: value" and "key: [a, b]" front matter"""
+    metadata: Dict[str, Any] = {}
+    for line in block.splitlines():
+        key, sep, value = line.partition(':')
+        if not sep or not key.strip() or line.startswith((' ', '\t', '#')):
+            continue
+        value = value.strip()
+        if value.startswith('[') and value.endswith(']'):
+            metadata[key.strip()] = [item.strip().strip('"\'') for item in value[1:-1].split(',') if item.strip()]
+        else:
+            metadata[key.strip()] = value.strip('"\'')
+    return metadata
+
+
+def parse_front_matter(content: str) -> Tuple[Dict[str, Any], int]:
+    """Return (metadata, offset where the markdown body starts)"""
+    match = FRONT_MATTER_PATTERN.match(content)
+    if not match:
+        return {}, 0
+
+    try:
+        metadata = yaml.safe_load(match.group(1)) if yaml is not None else _parse_simple(match.group(1))
+    except Exception as e:
+        logger.warning(f"Ignoring invalid front matter: {str(e)}")
+        return {}, match.end()
+    return (metadata if isinstance(metadata, dict) else {}), match.end()
+
+
+def _as_list(value: Any) -> List[str]:
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+    return [str(item).strip().lower() for item in value if str(item).strip()]
+
+
+def document_scope(metadata: Dict[str, Any]) -> Tuple[Optional[str], Tuple[str, ...]]:
+    """Return (category, tags) for a document from its front matter
+
+    A document without a category has no scope (None) rather than a
+    guessed one, and is searched whatever scope is asked for.
+    """
+    categories = _as_list(metadata.get('category'))
+    tags = tuple(dict.fromkeys(_as_list(metadata.get('tags'))))
+    return (categories[0] if categories else None), tags
+
+
+def normalize_filters(filters: Optional[Dict[str, Any]]) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    """Turn {'category': ..., 'tags': ...} filters into a hashable (categories, tags) key"""
+    if not filters:
+        return (), ()
+    categories = tuple(sorted(set(_as_list(filters.get('category')))))
+    tags = tuple(sorted(set(_as_list(filters.get('tags')))))
+    return categories, tags
+
+
+def matches_scope(category: Optional[str], tags: Tuple[str, ...],
+                  scope: Tuple[Tuple[str, ...], Tuple[str, ...]]) -> bool:
+    """A document is in scope if its category is listed and it carries any listed tag
+
+    Documents without front matter (no category or tags) are in every scope.
+    """
+    categories, wanted_tags = scope
+    if category is None and not tags:
+        return True
+    if categories and category not in categories:
+        return False
+    if wanted_tags and not set(wanted_tags).intersection(tags):
+        return False
+    return True
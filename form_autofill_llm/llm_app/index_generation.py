@@ -0,0 +1,203 @@
+# index_generation.py - Immutable snapshot of the document table and its indexes
+import hashlib
+import logging
+import time
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+from bm25_index import BM25Index
+from cow_dict import CowDict
+from document_record import DocumentRecord
+from fact_table import FactTable
+from front_matter import matches_scope
+from near_duplicates import DuplicateIndex
+
+logger = logging.getLogger(__name__)
+
+
+def _fingerprint(name: str, content_hash: str) -> int:
+    return int(hashlib.md5(f"{name}\0{content_hash}".encode()).hexdigest(), 16)
+
+
+class IndexGeneration:
+    """One published version of the documents and every index derived from them
+
+    A generation is built on a worker thread by deriving from the previous
+    one (copy-on-write, so only changed documents cost work) and is never
+    mutated after RAGManager publishes it. Requests pin a generation for
+    their whole lifetime, so a reload can never change what they see halfway.
+
+    Every table is a CowDict (see cow_dict.py) and per-corpus totals (category
+    counts, the corpus hash) are updated per document, so deriving and
+    applying a one-file change costs the same at 1k chunks as at 100k.
+    """
+
+    def __init__(self, number: int = 0, embeddings=None):
+        self.number = number
+        self.doc_map: CowDict = CowDict()
+        self.doc_hashes: CowDict = CowDict()
+        self.index = BM25Index()
+        self.facts = FactTable()
+        self.duplicates = DuplicateIndex()
+        self.embeddings = embeddings
+        self.embedding_pending = set()
+        self.built_at = time.time()
+        self.build_seconds = 0.0
+        self.changed = False
+        self.category_counts: Dict[str, int] = {}
+        # Memoized search scopes: (categories, tags) -> (doc ids, chunk ids)
+        self._scopes: Dict[Tuple, Tuple[FrozenSet[str], FrozenSet[int]]] = {}
+        self._documents: Optional[List[DocumentRecord]] = None
+        # Sum of per-document fingerprints mod 2^128 (None: not computed yet)
+        self._corpus_sum: Optional[int] = 0
+        self._corpus_hash = None
+
+    def derive(self) -> "IndexGeneration":
+        """Start the next generation, sharing unchanged data with this one"""
+        child = IndexGeneration(self.number + 1)
+        child.doc_map = self.doc_map.copy()
+        child.doc_hashes = self.doc_hashes.copy()
+        child.index = self.index.copy()
+        child.facts = self.facts.copy()
+        child.duplicates = self.duplicates.copy()
+        child.embeddings = self.embeddings.copy() if self.embeddings is not None else None
+        child.embedding_pending = set(self.embedding_pending)
+        child.category_counts = dict(self.category_counts)
+        child._corpus_sum = self._corpus_total()
+        return child
+
+    @property
+    def documents(self) -> List[DocumentRecord]:
+        """Every document, ordered by filename (built on first use)"""
+        documents = self._documents
+        if documents is None:
+            documents = self._documents = [self.doc_map[name] for name in sorted(self.doc_map)]
+        return documents
+
+    def _corpus_total(self) -> int:
+        if self._corpus_sum is None:
+            self._corpus_sum = sum(_fingerprint(name, content_hash)
+                                   for name, content_hash in self.doc_hashes.items()) % 2 ** 128
+        return self._corpus_sum
+
+    def _forget(self, key: str):
+        """Take a document out of the document table and the per-corpus totals"""
+        doc = self.doc_map.pop(key, None)
+        if doc is not None and doc.category is not None:
+            count = self.category_counts.get(doc.category, 0) - 1
+            if count > 0:
+                self.category_counts[doc.category] = count
+            else:
+                self.category_counts.pop(doc.category, None)
+        content_hash = self.doc_hashes.pop(key, None)
+        if content_hash is not None and self._corpus_sum is not None:
+            self._corpus_sum = (self._corpus_sum - _fingerprint(key, content_hash)) % 2 ** 128
+
+    def add_record(self, doc: DocumentRecord, content_hash: str):
+        """Put a document into the document table, fact table and per-corpus totals"""
+        key = doc.filename
+        self._forget(key)
+        self.doc_map[key] = doc
+        self.doc_hashes[key] = content_hash
+        if doc.category is not None:
+            self.category_counts[doc.category] = self.category_counts.get(doc.category, 0) + 1
+        if self._corpus_sum is not None:
+            self._corpus_sum = (self._corpus_sum + _fingerprint(key, content_hash)) % 2 ** 128
+        self.facts.add_document(key, doc.facts)
+
+    def apply_loaded(self, result: Dict[str, Any]) -> bool:
+        """Apply one doc_loader result; returns True if the document changed"""
+        key = result['key']
+        if result['status'] == 'unchanged':
+            return False
+
+        if result['status'] == 'touched':
+            # Same content, new stat: remember it so the file is skipped next time
+            self.doc_map[key] = self.doc_map[key].with_stat(result['last_modified'], result['file_size'])
+            self.changed = True
+            return False
+
+        # New or changed document
+        doc = result['doc']
+        self.add_record(doc, result['hash'])
+        self.index.add_document(key, None, term_counts=result['term_counts'])
+        self.duplicates.add_document(key, result['signatures'])
+        if self.embeddings is not None:
+            self.embeddings.remove_document(key)
+            self.embedding_pending.add(key)
+        self.changed = True
+        logger.debug(f"Loaded: {key} ({doc.chunk_count} chunks)")
+        return True
+
+    def remove_document(self, filename: str):
+        """Forget a document and its index entries"""
+        self._forget(filename)
+        self.index.remove_document(filename)
+        self.facts.remove_document(filename)
+        self.duplicates.remove_document(filename)
+        if self.embeddings is not None:
+            self.embeddings.remove_document(filename)
+            self.embedding_pending.discard(filename)
+        self.changed = True
+        logger.debug(f"Removed: {filename}")
+
+    def attach_embeddings(self, vectors: Optional[Dict[str, List[float]]]):
+        """Add freshly computed vectors and attach every pending document"""
+        if vectors:
+            self.embeddings.add_vectors(vectors)
+        for name in list(self.embedding_pending):
+            doc = self.doc_map.get(name)
+            if doc is None or self.embeddings.set_document(name, doc.search_texts()):
+                self.embedding_pending.discard(name)
+        self.changed = True
+
+    def finalize(self, started: float):
+        """Materialize derived structures so queries never rebuild them"""
+        self._documents = None
+        self._scopes = {}
+        self._corpus_hash = None
+        if self.embeddings is not None:
+            self.embeddings.prepare()
+        self.built_at = time.time()
+        self.build_seconds = round(time.perf_counter() - started, 3)
+
+    def corpus_hash(self) -> str:
+        """Fingerprint of every document's name and content
+
+        An order-independent sum of per-document fingerprints, kept up to
+        date as documents change instead of rehashing the whole corpus.
+        """
+        if self._corpus_hash is None:
+            self._corpus_hash = f"{self._corpus_total():032x}"
+        return self._corpus_hash
+
+    def scope(self, key: Tuple[Tuple[str, ...], Tuple[str, ...]]) -> Tuple[FrozenSet[str], FrozenSet[int]]:
+        """Documents and BM25 chunk ids inside a (categories, tags) scope"""
+        scope = self._scopes.get(key)
+        if scope is None:
+            doc_ids = frozenset(name for name, doc in self.doc_map.items()
+                                if matches_scope(doc.category, doc.tags, key))
+            chunk_ids = frozenset(chunk_id for name in doc_ids
+                                  for chunk_id in self.index.doc_chunks.get(name, ()))
+            scope = self._scopes[key] = (doc_ids, chunk_ids)
+        return scope
+
+    def status(self) -> Dict[str, Any]:
+        status = {
+            'number': self.number,
+            'built_at': self.built_at,
+            'build_seconds': self.build_seconds,
+            'documents': len(self.doc_map),
+            'categories': self.category_counts,
+            'chunks': len(self.index),
+            'near_duplicate_chunks': len(self.duplicates)
+        }
+        if self.embeddings is not None:
+            ann = self.embeddings.ann
+            status['vector_search'] = {'mode': 'exact'} if ann is None else {
+                'mode': 'ivf', 'vectors': len(ann), 'lists': len(ann.centroids), 'nprobe': ann.probe_count(),
+                'recall': round(ann.recall, 4) if ann.recall is not None else None
+            }
+            status['vector_search']['quantization'] = self.embeddings.quantizer.name
+            status['vector_search']['index_mb'] = round(self.embeddings.nbytes() / 2 ** 20, 2)
+            status['vector_search']['vectors_on_disk_mb'] = round(self.embeddings.store_nbytes() / 2 ** 20, 2)
+        return status
@@ -0,0 +1,144 @@
+# index_store.py - Versioned on-disk snapshot of the RAG index
+import logging
+import os
+import pickle
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the chunker or the layout of the saved state changes
+SNAPSHOT_VERSION = 13
+
+
+class IndexStore:
+    """Saves and restores the chunk table, hashes and derived indexes
+
+    A snapshot is a base plus a journal. The base is the pickled state of
+    one whole generation. Each later generation only appends what changed
+    (the loader results it applied, removed files, newly embedded chunks)
+    to the journal, so saving an edit costs the size of the edit rather
+    than of the corpus. load() returns the base with the journal entries
+    that continue it; save() writes a new base and drops the entries it
+    covers.
+
+    Entries carry the lineage of the base they continue, so a journal
+    left over from an unrelated index is never replayed. Embedding
+    vectors are not part of either file: they already live in a
+    VectorStore file in the same directory, which the state refers to by
+    name.
+    """
+
+    STATE_FILE = "state.pkl"
+    JOURNAL_FILE = "journal.pkl"
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def save(self, state: Dict[str, Any]):
+        """Atomically write a new base and drop the journal entries it covers"""
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        payload = dict(state, version=SNAPSHOT_VERSION)
+        tmp_state = self.path / (self.STATE_FILE + ".tmp")
+        with open(tmp_state, 'wb') as f:
+            pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        with self._lock:
+            os.replace(tmp_state, self.path / self.STATE_FILE)
+            # Entries appended while the base was written stay for the next load
+            keep = [entry for entry in self._read_journal()[0]
+                    if entry.get('lineage') == state.get('lineage')
+                    and entry.get('generation', 0) > state.get('generation', 0)]
+            tmp_journal = self.path / (self.JOURNAL_FILE + ".tmp")
+            with open(tmp_journal, 'wb') as f:
+                for entry in keep:
+                    pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_journal, self.path / self.JOURNAL_FILE)
+
+    def append(self, entry: Dict[str, Any]) -> int:
+        """Durably append one generation's changes; returns the journal size in bytes"""
+        self.path.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            with open(self.path / self.JOURNAL_FILE, 'ab') as f:
+                pickle.dump(dict(entry, version=SNAPSHOT_VERSION), f, protocol=pickle.HIGHEST_PROTOCOL)
+                f.flush()
+                os.fsync(f.fileno())
+                return f.tell()
+
+    def sizes(self) -> Tuple[int, int]:
+        """Bytes of the base and of the journal on disk"""
+        sizes = []
+        for name in (self.STATE_FILE, self.JOURNAL_FILE):
+            try:
+                sizes.append((self.path / name).stat().st_size)
+            except OSError:
+                sizes.append(0)
+        return sizes[0], sizes[1]
+
+    def _read_journal(self) -> Tuple[List[Dict[str, Any]], bool]:
+        """Entries up to the first unreadable one (a torn tail from a crash
+        mid-append), and whether the whole file was read
+        """
+        entries = []
+        try:
+            f = open(self.path / self.JOURNAL_FILE, 'rb')
+        except FileNotFoundError:
+            return entries, True
+        with f:
+            while True:
+                try:
+                    entries.append(pickle.load(f))
+                except EOFError:
+                    return entries, True
+                except Exception as e:
+                    logger.warning(f"Ignoring the rest of a damaged index journal: {str(e)}")
+                    return entries, False
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """Return the saved state, or None if missing, unreadable or outdated
+
+        state['journal'] holds the entries to replay on top of it, in order;
+        state['journal_complete'] is False if entries had to be dropped, in
+        which case new entries must not be appended to this journal.
+        """
+        state_file = self.path / self.STATE_FILE
+        if not state_file.exists():
+            return None
+
+        try:
+            with open(state_file, 'rb') as f:
+                state = pickle.load(f)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable index snapshot: {str(e)}")
+            return None
+
+        if state.get('version') != SNAPSHOT_VERSION:
+            logger.info(f"Index snapshot version {state.get('version')} is outdated, rebuilding")
+            return None
+
+        with self._lock:
+            entries, complete = self._read_journal()
+        journal = []
+        number = state.get('generation', 0)
+        for entry in entries:
+            if entry.get('version') != SNAPSHOT_VERSION or entry.get('lineage') != state.get('lineage'):
+                continue
+            if entry['generation'] <= number:
+                continue
+            if entry['generation'] != number + 1:
+                # A lost append; files changed after it are re-read on reload
+                logger.warning(f"Index journal skips from generation {number} to {entry['generation']}, "
+                               f"replaying up to {number}")
+                complete = False
+                break
+            journal.append(entry)
+            number += 1
+        state['journal'] = journal
+        state['journal_complete'] = complete
+        return state
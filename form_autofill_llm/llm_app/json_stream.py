@@ -0,0 +1,161 @@
+# json_stream.py - Incremental parser for a JSON object arriving in pieces
+import json
+from typing import Any, List, Optional, Tuple
+
+_WHITESPACE = " \t\r\n"
+
+
+class JSONObjectStream:
+    """Yields the members of a top-level JSON object as soon as each value closes
+
+    Text is fed in arbitrary pieces (LLM tokens). Anything before the first
+    '{' - prose, a ```json fence - is skipped, and the parser stops at the
+    object's closing brace. String, number and literal values are decoded
+    as they complete; nested objects and arrays are collected whole and
+    decoded at their closing bracket. A malformed member is dropped and
+    parsing resumes at the next top-level comma, so one bad value does
+    not lose the rest of the form.
+    """
+
+    def __init__(self):
+        self.done = False
+        self._started = False
+        self._state = 'key'        # key | colon | value | after
+        self._key: Optional[str] = None
+        self._buffer: List[str] = []
+        self._in_string = False
+        self._escaped = False
+        self._depth = 0            # bracket depth inside the current value
+        self._skipping = False     # discarding a malformed member
+
+    def feed(self, text: str) -> List[Tuple[str, Any]]:
+        """Consume more text; returns the (key, value) members completed by it"""
+        members = []
+        for char in text:
+            if self.done:
+                break
+            if not self._started:
+                self._started = char == '{'
+                continue
+            member = self._consume(char)
+            if member is not None:
+                members.append(member)
+        return members
+
+    def _consume(self, char: str) -> Optional[Tuple[str, Any]]:
+        # Strings (keys and values) are buffered verbatim, escapes included
+        if self._in_string:
+            self._buffer.append(char)
+            if self._escaped:
+                self._escaped = False
+            elif char == '\\':
+                self._escaped = True
+            elif char == '"':
+                self._in_string = False
+                if not self._skipping and self._depth == 0:
+                    return self._close_string()
+            return None
+
+        if self._skipping:
+            if char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self._depth += 1
+            elif char in '}]':
+                if self._depth == 0:
+                    self.done = char == '}'
+                else:
+                    self._depth -= 1
+            elif char == ',' and self._depth == 0:
+                self._reset()
+            return None
+
+        if self._state == 'key':
+            if char == '"':
+                self._in_string = True
+                self._buffer = ['"']
+            elif char == '}':
+                self.done = True
+            elif char not in _WHITESPACE + ',':
+                self._skip(char)
+        elif self._state == 'colon':
+            if char == ':':
+                self._state = 'value'
+            elif char not in _WHITESPACE:
+                self._skip(char)
+        elif self._state == 'value':
+            return self._consume_value(char)
+        elif self._state == 'after':
+            if char == ',':
+                self._reset()
+            elif char == '}':
+                self.done = True
+            elif char not in _WHITESPACE:
+                self._skip(char)
+        return None
+
+    def _consume_value(self, char: str) -> Optional[Tuple[str, Any]]:
+        if not self._buffer and char in _WHITESPACE:
+            return None
+        if char == '"':
+            self._in_string = True
+            self._buffer.append(char)
+            return None
+        if char in '{[':
+            self._depth += 1
+            self._buffer.append(char)
+            return None
+        if char in '}]' and self._depth > 0:
+            self._depth -= 1
+            self._buffer.append(char)
+            return self._decode_value() if self._depth == 0 else None
+        if self._depth == 0 and (char in ',}' or char in _WHITESPACE):
+            # End of a number or literal
+            member = self._decode_value()
+            if char == ',':
+                self._reset()
+            elif char == '}':
+                self.done = True
+            return member
+        self._buffer.append(char)
+        return None
+
+    def _close_string(self) -> Optional[Tuple[str, Any]]:
+        if self._state == 'key':
+            try:
+                self._key = json.loads("".join(self._buffer))
+            except json.JSONDecodeError:
+                self._skip()
+                return None
+            self._buffer = []
+            self._state = 'colon'
+            return None
+        return self._decode_value()
+
+    def _decode_value(self) -> Optional[Tuple[str, Any]]:
+        raw = "".join(self._buffer)
+        self._buffer = []
+        self._state = 'after'
+        try:
+            return self._key, json.loads(raw)
+        except json.JSONDecodeError:
+            return None
+
+    def _skip(self, char: str = ""):
+        """Discard the current member up to the next top-level comma
+
+        char is the unexpected character that started the skip; it may
+        open a string or bracket whose contents must not end the skip.
+        """
+        self._skipping = True
+        self._buffer = []
+        self._depth = 0
+        if char:
+            self._consume(char)
+
+    def _reset(self):
+        self._state = 'key'
+        self._key = None
+        self._buffer = []
+        self._depth = 0
+        self._skipping = False
@@ -2,44 +2,159 @@
 import aiohttp
 import json
 import logging
-from typing import Dict, Any, Optional
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
+from json_stream import JSONObjectStream
 
 logger = logging.getLogger(__name__)
 
 
 class LLMService:
-    """Service for interacting with Ollama LLM"""
+    """Service for interacting with Ollama LLM
+    
+    All requests share one pooled aiohttp session with keep-alive, so
+    concurrent form fills reuse warm connections to Ollama instead of
+    paying for a connector, DNS lookup and TCP handshake per call. The
+    session is opened by start() (FastAPI lifespan) and closed by close();
+    it is created on first use if start() was never called.
+    """
     
     def __init__(self, 
                  base_url: str = "http://localhost:11434",
                  model: str = "llama3:8b",
-                 temperature: float = 0.3):
+                 temperature: float = 0.3,
+                 embedding_model: str = "nomic-embed-text",
+                 max_connections: int = 32,
+                 max_connections_per_host: int = 8,
+                 keepalive_timeout: float = 60.0,
+                 request_timeout: float = 120.0):
         self.base_url = base_url
         self.model = model
         self.temperature = temperature
+        self.embedding_model = embedding_model
         self.is_initialized = False
         
+        # Connection pool settings
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.request_timeout = request_timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._stats = {
+            'requests': 0,
+            'errors': 0,
+            'in_flight': 0,
+            'max_in_flight': 0,
+            'connections_created': 0,
+            'connections_reused': 0,
+            'pool_waits': 0,
+            'request_seconds': 0.0
+        }
+        
+    async def start(self):
+        """Open the pooled session (idempotent)"""
+        if self._session is not None and not self._session.closed:
+            return
+        
+        # Count new vs. reused connections and waits for a free pool slot
+        trace = aiohttp.TraceConfig()
+        trace.on_connection_create_end.append(self._on_connection_created)
+        trace.on_connection_reuseconn.append(self._on_connection_reused)
+        trace.on_connection_queued_start.append(self._on_connection_queued)
+        
+        connector = aiohttp.TCPConnector(
+            limit=self.max_connections,
+            limit_per_host=self.max_connections_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=300
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.request_timeout),
+            trace_configs=[trace]
+        )
+        logger.info(f"LLM HTTP pool opened (limit {self.max_connections}, "
+                    f"{self.max_connections_per_host} per host)")
+        
+    async def close(self):
+        """Close the pooled session and its keep-alive connections"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            logger.info("LLM HTTP pool closed")
+        self._session = None
+        
+    async def _on_connection_created(self, session, context, params):
+        self._stats['connections_created'] += 1
+        
+    async def _on_connection_reused(self, session, context, params):
+        self._stats['connections_reused'] += 1
+        
+    async def _on_connection_queued(self, session, context, params):
+        self._stats['pool_waits'] += 1
+        
+    @asynccontextmanager
+    async def _tracked(self):
+        """Count one request against the pool stats; errors are counted on exceptions"""
+        if self._session is None or self._session.closed:
+            await self.start()
+        
+        stats = self._stats
+        stats['requests'] += 1
+        stats['in_flight'] += 1
+        stats['max_in_flight'] = max(stats['max_in_flight'], stats['in_flight'])
+        started = time.perf_counter()
+        try:
+            yield stats
+        except Exception:
+            stats['errors'] += 1
+            raise
+        finally:
+            stats['in_flight'] -= 1
+            stats['request_seconds'] += time.perf_counter() - started
+        
+    async def _post(self, path: str, payload: Dict[str, Any]) -> Tuple[int, Any]:
+        """POST JSON on the pooled session; returns (status, parsed JSON or error text)"""
+        async with self._tracked() as stats:
+            async with self._session.post(f"{self.base_url}{path}", json=payload) as response:
+                if response.status == 200:
+                    return response.status, await response.json()
+                stats['errors'] += 1
+                return response.status, await response.text()
+        
+    def pool_stats(self) -> Dict[str, Any]:
+        """Connection pool and request counters for monitoring"""
+        stats = dict(self._stats)
+        requests = stats.pop('request_seconds')
+        stats['avg_request_ms'] = round(requests / stats['requests'] * 1000, 1) if stats['requests'] else 0.0
+        stats['session_open'] = self._session is not None and not self._session.closed
+        stats['max_connections'] = self.max_connections
+        stats['max_connections_per_host'] = self.max_connections_per_host
+        stats['keepalive_timeout'] = self.keepalive_timeout
+        return stats
+        
     async def initialize(self):
         """Initialize and verify connection to Ollama"""
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(f"{self.base_url}/api/tags") as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        models = [m['name'] for m in data.get('models', [])]
-                        
-                        if self.model not in models:
-                            logger.warning(f"Model {self.model} not found. Available: {models}")
-                            if models:
-                                self.model = models[0]
-                                logger.info(f"Using {self.model} instead")
-                        
-                        self.is_initialized = True
-                        logger.info(f"LLM Service initialized with model: {self.model}")
-                        return True
-                    else:
-                        logger.error(f"Failed to connect to Ollama: {response.status}")
-                        return False
+            if self._session is None or self._session.closed:
+                await self.start()
+            async with self._session.get(f"{self.base_url}/api/tags") as response:
+                if response.status == 200:
+                    data = await response.json()
+                    models = [m['name'] for m in data.get('models', [])]
+                    
+                    if self.model not in models:
+                        logger.warning(f"Model {self.model} not found. Available: {models}")
+                        if models:
+                            self.model = models[0]
+                            logger.info(f"Using {self.model} instead")
+                    
+                    self.is_initialized = True
+                    logger.info(f"LLM Service initialized with model: {self.model}")
+                    return True
+                else:
+                    logger.error(f"Failed to connect to Ollama: {response.status}")
+                    return False
         except Exception as e:
             logger.error(f"Error initializing LLM service: {str(e)}")
             return False
@@ -61,19 +176,11 @@ class LLMService:
             if system_prompt:
                 payload["system"] = system_prompt
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"{self.base_url}/api/generate",
-                    json=payload,
-                    timeout=aiohttp.ClientTimeout(total=120)
-                ) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        return data.get('response', '')
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"LLM generation failed: {error_text}")
-                        return ""
+            status, data = await self._post("/api/generate", payload)
+            if status == 200:
+                return data.get('response', '')
+            logger.error(f"LLM generation failed: {data}")
+            return ""
                         
         except Exception as e:
             logger.error(f"Error generating completion: {str(e)}")
@@ -91,30 +198,74 @@ class LLMService:
                 }
             }
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"{self.base_url}/api/chat",
-                    json=payload,
-                    timeout=aiohttp.ClientTimeout(total=120)
-                ) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        return data.get('message', {}).get('content', '')
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"LLM chat failed: {error_text}")
-                        return ""
+            status, data = await self._post("/api/chat", payload)
+            if status == 200:
+                return data.get('message', {}).get('content', '')
+            logger.error(f"LLM chat failed: {data}")
+            return ""
                         
         except Exception as e:
             logger.error(f"Error in chat completion: {str(e)}")
             return ""
     
-    async def fill_form_fields(self, 
-                              fields: Dict[str, str], 
-                              context: str,
-                              url: Optional[str] = None,
-                              title: Optional[str] = None) -> Dict[str, Any]:
-        """Use LLM to fill form fields based on user context"""
+    async def embed(self, texts: List[str], batch_size: int = 64) -> List[List[float]]:
+        """Embed texts with the Ollama embedding model
+        
+        Raises on failure so callers can fall back to keyword retrieval.
+        """
+        embeddings = []
+        for i in range(0, len(texts), batch_size):
+            payload = {
+                "model": self.embedding_model,
+                "input": texts[i:i + batch_size]
+            }
+            status, data = await self._post("/api/embed", payload)
+            if status != 200:
+                raise RuntimeError(f"Embedding request failed: {data}")
+            embeddings.extend(data.get('embeddings', []))
+        
+        if len(embeddings) != len(texts):
+            raise RuntimeError(f"Expected {len(texts)} embeddings, got {len(embeddings)}")
+        return embeddings
+    
+    async def stream_chat(self, messages: list) -> AsyncIterator[str]:
+        """Yield the content of a chat completion piece by piece as Ollama generates it
+        
+        Raises on connection or HTTP errors so callers can fall back.
+        """
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "stream": True,
+            "options": {
+                "temperature": self.temperature
+            }
+        }
+        
+        async with self._tracked():
+            async with self._session.post(f"{self.base_url}/api/chat", json=payload) as response:
+                if response.status != 200:
+                    raise RuntimeError(f"LLM chat stream failed: {await response.text()}")
+                # One JSON object per line, the last one with "done": true
+                async for line in response.content:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get('error'):
+                        raise RuntimeError(f"LLM chat stream failed: {chunk['error']}")
+                    content = chunk.get('message', {}).get('content', '')
+                    if content:
+                        yield content
+                    if chunk.get('done'):
+                        break
+    
+    def _form_messages(self,
+                       fields: Dict[str, str],
+                       context: str,
+                       url: Optional[str] = None,
+                       title: Optional[str] = None) -> List[Dict[str, str]]:
+        """Chat messages asking the LLM to fill the fields as a JSON object"""
         
         # Build the system prompt
         system_prompt = """You are an intelligent form-filling assistant. Your job is to analyze form fields and fill them with appropriate information from the user's context.
@@ -155,11 +306,20 @@ USER CONTEXT:
         
         user_prompt += "\n\nProvide the filled form as a JSON object with field names as keys."
         
-        # Generate completion
-        messages = [
+        return [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt}
         ]
+    
+    async def fill_form_fields(self, 
+                              fields: Dict[str, str], 
+                              context: str,
+                              url: Optional[str] = None,
+                              title: Optional[str] = None) -> Dict[str, Any]:
+        """Use LLM to fill form fields based on user context"""
+        
+        # Generate completion
+        messages = self._form_messages(fields, context, url, title)
         
         logger.info("Sending request to LLM...")
         response = await self.chat_completion(messages)
@@ -169,8 +329,54 @@ USER CONTEXT:
             return {}
         
         logger.debug(f"LLM Response: {response}")
+        return self._parse_form_response(response, fields)
+    
+    async def stream_form_fields(self,
+                                 fields: Dict[str, str],
+                                 context: str,
+                                 url: Optional[str] = None,
+                                 title: Optional[str] = None) -> AsyncIterator[Tuple[str, Any]]:
+        """Yield (field, value) pairs as soon as each value closes in the LLM's output
         
-        # Parse the JSON response
+        Same prompt as fill_form_fields, but the completion is streamed and
+        parsed incrementally. Keys that are not requested fields, and
+        repeats, are ignored. Requested fields the stream did not produce
+        are recovered from the full text if possible and yielded as ""
+        otherwise, so every field is yielded exactly once.
+        """
+        messages = self._form_messages(fields, context, url, title)
+        parser = JSONObjectStream()
+        pieces = []
+        emitted = set()
+        
+        logger.info("Streaming request to LLM...")
+        stream = self.stream_chat(messages)
+        try:
+            async for piece in stream:
+                pieces.append(piece)
+                for name, value in parser.feed(piece):
+                    if name in fields and name not in emitted:
+                        emitted.add(name)
+                        yield name, value
+                if parser.done:
+                    break
+        except Exception as e:
+            logger.error(f"Error in streamed form fill: {str(e)}")
+        finally:
+            # Release the connection now rather than when the generator is collected
+            await stream.aclose()
+        
+        missing = [name for name in fields if name not in emitted]
+        if not missing:
+            return
+        response = "".join(pieces)
+        recovered = self._parse_form_response(response, fields) if response.strip() else {}
+        logger.info(f"Streamed {len(emitted)} fields, {len(missing)} filled after the stream")
+        for name in missing:
+            yield name, recovered.get(name, "")
+    
+    def _parse_form_response(self, response: str, fields: Dict[str, str]) -> Dict[str, Any]:
+        """Parse the LLM's JSON answer into a value for every field ("" if missing)"""
         try:
             # Try to extract JSON from response
             response = response.strip()
@@ -208,4 +414,4 @@ USER CONTEXT:
             return {key: "" for key in fields.keys()}
         except Exception as e:
             logger.error(f"Error processing LLM response: {str(e)}")
-            return {key: "" for key in fields.keys()}
\ No newline at end of file
+            return {key: "" for key in fields.keys()}
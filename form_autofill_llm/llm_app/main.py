@@ -1,15 +1,24 @@
 # main.py - FastAPI application with optional FastMCP integration
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Dict, Optional, Any, List
+import asyncio
+import json
 import logging
+import os
+import time
 from pathlib import Path
 from contextlib import asynccontextmanager
 
 from rag_manager import RAGManager
 from llm_service import LLMService
 from form_processor import FormProcessor
+from reranker import create_reranker
+from profile_digest import ProfileDigest
+from fill_cache import FormFillCache
+from answer_memo import FieldAnswerMemo
 
 # Configure logging
 logging.basicConfig(
@@ -18,10 +27,29 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Retrieval is keyword (BM25) unless RAG_RETRIEVAL_MODE=embedding, which
+# also embeds chunks with the Ollama embedding model and falls back to
+# keyword retrieval (with a warning) when that is unavailable
+RETRIEVAL_MODE = os.environ.get("RAG_RETRIEVAL_MODE", "keyword")
+
+# Optional second stage: RAG_RERANKER=cross-encoder (needs
+# sentence-transformers) or ollama rescores ~50 first-stage candidates so
+# only the best few reach the prompt. Off by default
+RERANKER = os.environ.get("RAG_RERANKER") or None
+
 # Initialize services (will be initialized in lifespan)
-rag_manager = RAGManager(docs_path="./md_docs")
 llm_service = LLMService()
-form_processor = FormProcessor(llm_service, rag_manager)
+rag_manager = RAGManager(
+    docs_path="./md_docs",
+    retrieval_mode=RETRIEVAL_MODE,
+    embedder=llm_service.embed,
+    reranker=create_reranker(RERANKER, llm_service)
+)
+profile_digest = ProfileDigest(llm_service, rag_manager)
+form_fill_cache = FormFillCache("./.rag_index/form_fills.sqlite3")
+answer_memo = FieldAnswerMemo()
+form_processor = FormProcessor(llm_service, rag_manager, digest=profile_digest,
+                               fill_cache=form_fill_cache, answer_memo=answer_memo)
 
 
 class FormRequest(BaseModel):
@@ -42,6 +70,9 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting Universal Form Filler API...")
     
+    # Open the pooled Ollama session first - indexing embeds through it
+    await llm_service.start()
+    
     # Initialize RAG manager
     await rag_manager.initialize()
     logger.info("RAG manager initialized")
@@ -53,7 +84,16 @@ async def lifespan(app: FastAPI):
     else:
         logger.warning("LLM service failed to initialize - check Ollama connection")
     
-    # Start file watcher for markdown docs
+    # Drop cached form fills for documents changed while we were down, and
+    # on every reload from now on
+    form_fill_cache.invalidate(rag_manager.pin().corpus_hash())
+    rag_manager.add_publish_listener(form_fill_cache.on_publish)
+    rag_manager.add_publish_listener(answer_memo.on_publish)
+    
+    # Build the profile digest in the background (and after every reload)
+    await profile_digest.start()
+    
+    # Start file watcher for the docs folder
     await rag_manager.start_file_watcher()
     logger.info("File watcher started")
     
@@ -66,6 +106,14 @@ async def lifespan(app: FastAPI):
     
     # Stop file watcher
     await rag_manager.stop_file_watcher()
+    await profile_digest.stop()
+    # Finish journal writes and any scheduled snapshot base
+    await rag_manager.flush_snapshot()
+    
+    # Close pooled Ollama connections once nothing can issue requests
+    await llm_service.close()
+    # Waits for queued SQLite writes, so keep it off the event loop
+    await asyncio.get_running_loop().run_in_executor(None, form_fill_cache.close)
     
     logger.info("API shutdown complete")
 
@@ -97,6 +145,7 @@ async def root():
         "status": "running",
         "endpoints": {
             "fill_form": "/fill-form",
+            "fill_form_stream": "/fill-form/stream",
             "health": "/health",
             "docs_status": "/docs-status",
             "reload_docs": "/reload-docs"
@@ -112,6 +161,11 @@ async def health_check():
         "rag_initialized": rag_manager.is_initialized,
         "llm_initialized": llm_service.is_initialized,
         "docs_count": len(rag_manager.documents),
+        "retrieval_mode": "embedding" if rag_manager.embeddings is not None else "keyword",
+        "query_cache": rag_manager.query_cache.stats(),
+        "form_fill_cache": form_fill_cache.stats(),
+        "answer_memo": answer_memo.stats(),
+        "llm_pool": llm_service.pool_stats(),
         "ollama_model": llm_service.model
     }
 
@@ -164,9 +218,74 @@ async def fill_form(request: FormRequest):
         )
 
 
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    """One Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/fill-form/stream")
+async def fill_form_stream(request: FormRequest):
+    """
+    Streaming variant of /fill-form (Server-Sent Events)
+    
+    Sends a "field" event ({"field", "value", "source"}) as soon as each
+    value is known, then a "done" event with the same metadata as
+    /fill-form, or an "error" event if processing fails midway.
+    """
+    logger.info(f"Received streaming form fill request for {request.url}")
+    logger.info(f"Number of fields: {len(request.fields)}")
+    
+    if not rag_manager.is_initialized:
+        raise HTTPException(
+            status_code=503,
+            detail="RAG manager not initialized"
+        )
+    
+    if not llm_service.is_initialized:
+        raise HTTPException(
+            status_code=503,
+            detail="LLM service not available - check Ollama connection"
+        )
+    
+    async def events():
+        started = time.perf_counter()
+        first_field_ms = None
+        count = 0
+        try:
+            async for update in form_processor.stream_form(
+                    fields=request.fields,
+                    url=request.url,
+                    title=request.title):
+                if first_field_ms is None:
+                    first_field_ms = round((time.perf_counter() - started) * 1000, 1)
+                count += 1
+                yield _sse("field", update)
+            
+            logger.info(f"Streamed {count} fields (first after {first_field_ms} ms)")
+            yield _sse("done", {
+                "processed_at": request.timestamp,
+                "url": request.url,
+                "title": request.title,
+                "model_used": llm_service.model,
+                "fields": count,
+                "first_field_ms": first_field_ms,
+                "total_ms": round((time.perf_counter() - started) * 1000, 1)
+            })
+        except Exception as e:
+            logger.error(f"Error streaming form: {str(e)}", exc_info=True)
+            yield _sse("error", {"detail": f"Error processing form: {str(e)}"})
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Keep proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.post("/reload-docs")
 async def reload_docs():
-    """Manually trigger reload of markdown documents"""
+    """Manually trigger reload of the documents folder"""
     try:
         await rag_manager.reload_documents()
         return {
@@ -184,30 +303,41 @@ async def reload_docs():
 
 @app.get("/docs-status")
 async def get_docs_status():
-    """Get status of loaded markdown documents"""
+    """Get status of loaded documents"""
+    generation = rag_manager.pin()
     return {
-        "documents_loaded": len(rag_manager.documents),
+        "documents_loaded": len(generation.documents),
+        "index_generation": generation.status(),
         "documents": [
             {
-                "filename": doc["filename"],
-                "size": len(doc["content"]),
-                "chunks": len(doc["chunks"]),
-                "last_modified": doc.get("last_modified", "unknown")
+                "filename": doc.filename,
+                "size": len(doc.content),
+                "chunks": doc.chunk_count,
+                "category": doc.category,
+                "tags": list(doc.tags),
+                "last_modified": doc.last_modified or "unknown"
             }
-            for doc in rag_manager.documents
+            for doc in generation.documents
         ],
+        "ingest_progress": rag_manager.ingest_progress,
+        "profile_digest": profile_digest.status(),
         "rag_initialized": rag_manager.is_initialized
     }
 
 
 @app.get("/query-context")
-async def query_context(q: str, top_k: int = 5):
-    """Query user context from documents"""
+async def query_context(q: str,
+                        top_k: int = 5,
+                        category: Optional[str] = None,
+                        tags: Optional[str] = None):
+    """Query user context from documents, optionally scoped by category/tags (comma-separated)"""
     try:
-        context = rag_manager.get_relevant_context(q, top_k=top_k)
+        filters = {"category": category, "tags": tags} if category or tags else None
+        context = await rag_manager.get_relevant_context(q, top_k=top_k, filters=filters)
         return {
             "success": True,
             "query": q,
+            "filters": filters,
             "context": context,
             "docs_used": len(rag_manager.documents)
         }
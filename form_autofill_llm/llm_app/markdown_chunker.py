@@ -0,0 +1,174 @@
+# markdown_chunker.py - Splits markdown into heading-aware, token-budgeted chunks
+import re
+from typing import Any, Dict, List, Tuple
+
+from text_utils import estimate_tokens
+
+HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.*?)[\s#]*$")
+LIST_ITEM_PATTERN = re.compile(r"^\s*(?:[-*+]|\d+[.)])\s+")
+FENCE_PATTERN = re.compile(r"^\s*(```|~~~)")
+
+
+def _parse_blocks(content: str) -> List[Tuple[str, int, int, Tuple[str, ...]]]:
+    """Split markdown into (kind, start, end, heading path) blocks
+
+    Kinds are heading, list, paragraph and code. Lists keep their items and
+    indented continuation lines together; code fences are never split.
+    """
+    blocks = []
+    headings: List[Tuple[int, str]] = []
+    kind = None
+    block_start = 0
+    block_end = 0
+    fence = None
+    offset = 0
+
+    def close():
+        nonlocal kind
+        if kind is not None:
+            blocks.append((kind, block_start, block_end, tuple(title for _, title in headings)))
+        kind = None
+
+    for line in content.splitlines(keepends=True):
+        line_start = offset
+        offset += len(line)
+        stripped = line.strip()
+
+        if fence is not None:
+            block_end = offset
+            if stripped.startswith(fence):
+                fence = None
+                close()
+            continue
+
+        fence_match = FENCE_PATTERN.match(line)
+        if fence_match:
+            close()
+            kind, block_start, block_end = 'code', line_start, offset
+            fence = fence_match.group(1)
+            continue
+
+        if not stripped:
+            close()
+            continue
+
+        heading_match = HEADING_PATTERN.match(line)
+        if heading_match:
+            close()
+            level = len(heading_match.group(1))
+            while headings and headings[-1][0] >= level:
+                headings.pop()
+            headings.append((level, heading_match.group(2).strip()))
+            kind, block_start, block_end = 'heading', line_start, offset
+            close()
+            continue
+
+        if LIST_ITEM_PATTERN.match(line):
+            if kind != 'list':
+                close()
+                kind, block_start = 'list', line_start
+            block_end = offset
+            continue
+
+        if kind == 'list' and line[:1].isspace():
+            # Indented continuation of the current list item
+            block_end = offset
+            continue
+
+        if kind != 'paragraph':
+            close()
+            kind, block_start = 'paragraph', line_start
+        block_end = offset
+
+    close()
+    return blocks
+
+
+def _split_oversized(content: str, start: int, end: int, max_tokens: int) -> List[Tuple[int, int]]:
+    """Break a single block that exceeds the budget at line, then character, boundaries"""
+    pieces = []
+    piece_start = start
+    piece_end = start
+    offset = start
+    for line in content[start:end].splitlines(keepends=True):
+        line_start = offset
+        offset += len(line)
+        if estimate_tokens(content[piece_start:offset]) <= max_tokens:
+            piece_end = offset
+            continue
+        if piece_end > piece_start:
+            pieces.append((piece_start, piece_end))
+        piece_start = line_start
+        # A single line longer than the budget is cut at a fixed width
+        max_chars = max_tokens * 4
+        while offset - piece_start > max_chars:
+            pieces.append((piece_start, piece_start + max_chars))
+            piece_start += max_chars
+        piece_end = offset
+    if piece_end > piece_start:
+        pieces.append((piece_start, piece_end))
+    return pieces
+
+
+def chunk_markdown(content: str, max_tokens: int = 256) -> List[Dict[str, Any]]:
+    """Group markdown blocks into chunks that respect headings and lists
+
+    Each chunk is a dict with the chunk text, its heading path (for example
+    "User Information > Work Experience > Current Position") and the
+    (start, end) character span it covers in the source. Chunks never cross
+    a heading and never overlap.
+    """
+    spans: List[Tuple[int, int, Tuple[str, ...]]] = []
+    current = None  # [start, end, path]
+    carry_start = None  # heading lines waiting for the body that follows
+
+    def flush():
+        nonlocal current
+        if current is not None:
+            spans.append(tuple(current))
+        current = None
+
+    for kind, start, end, path in _parse_blocks(content):
+        if kind == 'heading':
+            flush()
+            if carry_start is None:
+                carry_start = start
+            continue
+
+        block_start = carry_start if carry_start is not None else start
+        carry_start = None
+
+        if current is not None and current[2] == path and \
+                estimate_tokens(content[current[0]:end]) <= max_tokens:
+            current[1] = end
+            continue
+
+        flush()
+        if estimate_tokens(content[block_start:end]) <= max_tokens:
+            current = [block_start, end, path]
+            continue
+
+        for piece_start, piece_end in _split_oversized(content, block_start, end, max_tokens):
+            flush()
+            current = [piece_start, piece_end, path]
+    flush()
+
+    # A document made only of headings still gets a chunk
+    if carry_start is not None and not spans:
+        spans.append((carry_start, len(content), ()))
+
+    chunks = []
+    for start, end, path in spans:
+        text = content[start:end]
+        # Tighten the span so text == content[start:end]
+        start += len(text) - len(text.lstrip())
+        end -= len(text) - len(text.rstrip())
+        if end <= start:
+            continue
+        chunks.append({
+            'text': content[start:end],
+            'heading_path': " > ".join(path),
+            'start': start,
+            'end': end
+        })
+    return chunks
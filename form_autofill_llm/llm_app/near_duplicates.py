@@ -0,0 +1,239 @@
+# near_duplicates.py - MinHash signatures and LSH clustering of near-duplicate chunks
+import random
+import zlib
+from array import array
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from cow_dict import CowDict
+
+try:
+    import numpy as np
+except ImportError:  # Signatures are computed in pure Python instead
+    np = None
+
+SHINGLE_WORDS = 3
+MIN_WORDS = 12  # chunks with fewer index terms are never treated as duplicates
+NUM_HASHES = 32
+BANDS = 8
+ROWS = NUM_HASHES // BANDS
+
+# Multiply-shift hash family: h(x) = ((a * x + b) mod 2^64) >> 32, a odd
+_rng = random.Random(0x5EED)
+_A = [_rng.getrandbits(64) | 1 for _ in range(NUM_HASHES)]
+_B = [_rng.getrandbits(64) for _ in range(NUM_HASHES)]
+_MASK64 = (1 << 64) - 1
+# Combines three word hashes into one shingle value
+_C1 = _rng.getrandbits(64) | 1
+_C2 = _rng.getrandbits(64) | 1
+
+# (doc_id, chunk position)
+ChunkRef = Tuple[str, int]
+
+
+def _word_hashes(token_lists: Iterable[List[str]]) -> List[List[int]]:
+    """crc32 of every token per chunk (stable across processes, unlike hash())"""
+    cache: Dict[str, int] = {}
+    result = []
+    for tokens in token_lists:
+        hashes = []
+        for word in tokens:
+            value = cache.get(word)
+            if value is None:
+                value = cache[word] = zlib.crc32(word.encode())
+            hashes.append(value)
+        result.append(hashes if len(hashes) >= MIN_WORDS else [])
+    return result
+
+
+def minhash_signatures(token_lists: Iterable[List[str]]) -> List[Optional[bytes]]:
+    """NUM_HASHES-value MinHash signature per tokenized chunk (None if too short)
+
+    Takes the chunks' index terms (text_utils.tokenize), so the tokens the
+    BM25 index needs anyway are reused. Shingles are 3-grams combined from
+    per-token hashes. Signatures are packed uint32 arrays, so they pickle
+    compactly, and two signatures agree in position i with probability
+    equal to the Jaccard similarity of the chunks' shingle sets.
+    """
+    words = _word_hashes(token_lists)
+    if np is not None:
+        return _signatures_numpy(words)
+    signatures = []
+    for hashes in words:
+        if not hashes:
+            signatures.append(None)
+            continue
+        shingles = [(x * _C1 + y * _C2 + z) & _MASK64 for x, y, z in zip(hashes, hashes[1:], hashes[2:])]
+        mins = array('I', (min(((a * x + b) & _MASK64) >> 32 for x in shingles) for a, b in zip(_A, _B)))
+        signatures.append(mins.tobytes())
+    return signatures
+
+
+def _signatures_numpy(words: List[List[int]]) -> List[Optional[bytes]]:
+    """Shingle and hash every chunk of a document in one vectorized pass"""
+    signatures: List[Optional[bytes]] = [None] * len(words)
+    rows = [i for i, hashes in enumerate(words) if hashes]
+    if not rows:
+        return signatures
+
+    values = np.fromiter((x for i in rows for x in words[i]), dtype=np.uint64)
+    lengths = np.array([len(words[i]) for i in rows])
+    ends = np.cumsum(lengths)
+    # Shingle k covers words k..k+2; drop those that run into the next chunk
+    shingles = values[:-2] * np.uint64(_C1) + values[1:-1] * np.uint64(_C2) + values[2:]
+    valid = np.ones(len(shingles), dtype=bool)
+    valid[np.concatenate([ends[:-1] - 2, ends[:-1] - 1])] = False
+    shingles = shingles[valid]
+    starts = np.concatenate([[0], np.cumsum(lengths - 2)[:-1]])
+
+    a = np.array(_A, dtype=np.uint64)
+    b = np.array(_B, dtype=np.uint64)
+    hashed = (shingles[:, None] * a + b) >> np.uint64(32)  # wraps mod 2^64
+    mins = np.minimum.reduceat(hashed, starts, axis=0).astype(np.uint32)
+    for row, i in enumerate(rows):
+        signatures[i] = mins[row].tobytes()
+    return signatures
+
+
+def similarity(first: bytes, second: bytes) -> float:
+    """Estimated Jaccard similarity of two signatures"""
+    a = array('I', first)
+    b = array('I', second)
+    return sum(x == y for x, y in zip(a, b)) / NUM_HASHES
+
+
+_BAND_OFFSETS = [(band * ROWS * 4, (band + 1) * ROWS * 4) for band in range(BANDS)]
+
+
+def _band_keys(signature: bytes) -> List[bytes]:
+    # Keys of different bands share one dict; a cross-band collision only
+    # adds a candidate that the similarity check rejects
+    return [signature[start:end] for start, end in _BAND_OFFSETS]
+
+
+class DuplicateIndex:
+    """Clusters near-identical chunks so each cluster is returned only once
+
+    Chunks are bucketed by LSH bands of their MinHash signature; a chunk
+    whose estimated similarity to a cluster representative reaches the
+    threshold joins that cluster, otherwise it starts a new one. Only
+    representatives sit in the buckets. Every member keeps its own
+    (doc_id, position), so a collapsed hit can report where else the same
+    text appears, and removing a representative promotes another member.
+
+    Like the other indexes it is copied per generation: its tables are
+    CowDicts and their values (bucket and member tuples) are replaced,
+    never mutated, so a copy shares everything a change does not touch.
+    """
+
+    def __init__(self, threshold: float = 0.8):
+        self.threshold = threshold
+        self.doc_signatures: CowDict = CowDict()
+        self.buckets: CowDict = CowDict()
+        # duplicate -> its representative, and representative -> duplicates
+        self.rep_of: CowDict = CowDict()
+        self.members: CowDict = CowDict()
+
+    def __len__(self) -> int:
+        """Number of chunks collapsed into another chunk's cluster"""
+        return len(self.rep_of)
+
+    def copy(self) -> "DuplicateIndex":
+        clone = DuplicateIndex(self.threshold)
+        clone.doc_signatures = self.doc_signatures.copy()
+        clone.buckets = self.buckets.copy()
+        clone.rep_of = self.rep_of.copy()
+        clone.members = self.members.copy()
+        return clone
+
+    def _signature(self, ref: ChunkRef) -> Optional[bytes]:
+        signatures = self.doc_signatures.get(ref[0])
+        return signatures[ref[1]] if signatures and ref[1] < len(signatures) else None
+
+    def _register(self, ref: ChunkRef, keys: List[bytes]):
+        for key in keys:
+            self.buckets[key] = self.buckets.get(key, ()) + (ref,)
+
+    def _unregister(self, ref: ChunkRef, signature: bytes):
+        for key in _band_keys(signature):
+            remaining = tuple(other for other in self.buckets.get(key, ()) if other != ref)
+            if remaining:
+                self.buckets[key] = remaining
+            else:
+                self.buckets.pop(key, None)
+
+    def add_document(self, doc_id: str, signatures: List[Optional[bytes]]):
+        """Cluster a document's chunks, replacing any previous version"""
+        self.remove_document(doc_id)
+        self.doc_signatures[doc_id] = tuple(signatures)
+
+        for position, signature in enumerate(signatures):
+            if signature is None:
+                continue
+            ref = (doc_id, position)
+            keys = _band_keys(signature)
+            candidates: Set[ChunkRef] = set()
+            for key in keys:
+                candidates.update(self.buckets.get(key, ()))
+
+            best, best_score = None, self.threshold
+            for candidate in sorted(candidates):
+                score = similarity(signature, self._signature(candidate))
+                if score >= best_score:
+                    best, best_score = candidate, score
+            if best is None:
+                self._register(ref, keys)
+            else:
+                self.rep_of[ref] = best
+                self.members[best] = self.members.get(best, ()) + (ref,)
+
+    def remove_document(self, doc_id: str):
+        signatures = self.doc_signatures.pop(doc_id, None)
+        if signatures is None:
+            return
+        refs = {(doc_id, position) for position, signature in enumerate(signatures) if signature is not None}
+
+        representatives = []
+        for ref in refs:
+            rep = self.rep_of.pop(ref, None)
+            if rep is None:
+                representatives.append(ref)
+            elif rep not in refs:
+                remaining = tuple(member for member in self.members[rep] if member != ref)
+                if remaining:
+                    self.members[rep] = remaining
+                else:
+                    del self.members[rep]
+
+        for ref in representatives:
+            self._unregister(ref, signatures[ref[1]])
+            survivors = tuple(member for member in self.members.pop(ref, ()) if member not in refs)
+            if survivors:
+                # Promote the first surviving duplicate to representative
+                new_rep, rest = survivors[0], survivors[1:]
+                del self.rep_of[new_rep]
+                for member in rest:
+                    self.rep_of[member] = new_rep
+                if rest:
+                    self.members[new_rep] = rest
+                self._register(new_rep, _band_keys(self._signature(new_rep)))
+
+    def representative(self, ref: ChunkRef) -> ChunkRef:
+        return self.rep_of.get(ref, ref)
+
+    def cluster(self, ref: ChunkRef) -> Tuple[ChunkRef, ...]:
+        """Every chunk in ref's cluster, representative first"""
+        rep = self.rep_of.get(ref, ref)
+        return (rep,) + self.members.get(rep, ())
+
+    def collapse(self, ranked: List[Tuple[float, str, int]]) -> List[Tuple[float, str, int]]:
+        """Keep only the best-ranked chunk of each near-duplicate cluster"""
+        if not self.rep_of:
+            return ranked
+        seen = set()
+        collapsed = []
+        for score, doc_id, position in ranked:
+            rep = self.rep_of.get((doc_id, position), (doc_id, position))
+            if rep not in seen:
+                seen.add(rep)
+                collapsed.append((score, doc_id, position))
+        return collapsed
@@ -0,0 +1,249 @@
+# profile_digest.py - Background LLM digest of the whole document corpus
+import asyncio
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from index_generation import IndexGeneration
+from text_utils import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Categories whose documents matter most for forms, summarized first;
+# documents without front matter (None) may be either
+PRIORITY_CATEGORIES = ('profile', 'preferences', None)
+
+PROFILE_SYSTEM_PROMPT = """You condense a person's documents into a canonical profile for form filling.
+
+Return ONLY a valid JSON object. Use short snake_case keys (full_name, first_name, last_name, email, phone, address, city, state, zip_code, linkedin, education, work_authorization, requires_sponsorship, willing_to_relocate, salary_expectation, start_date, veteran_status, disability_status, ...).
+Values are short strings or lists of short strings. Copy facts exactly; never invent anything. Omit keys you have no information for."""
+
+SUMMARY_SYSTEM_PROMPT = "You summarize documents about a job applicant. Be factual and concise."
+
+
+class ProfileDigest:
+    """Keeps an LLM-written digest of the corpus in step with the index
+
+    Whenever RAGManager publishes a generation whose corpus hash differs
+    from the digest's, a background task summarizes long documents, asks
+    the model for a structured JSON profile and renders both into a compact
+    context. The finished digest replaces the old one with a single
+    assignment, and is cached on disk by corpus hash and model so restarts
+    do not pay for it again. A digest is only served for the corpus it was
+    built from.
+    """
+
+    def __init__(self,
+                 llm_service,
+                 rag_manager,
+                 cache_path: Optional[str] = "./.rag_index/digest.json",
+                 summary_threshold_tokens: int = 400,
+                 summary_words: int = 60,
+                 max_documents: int = 50,
+                 prompt_token_budget: int = 6000):
+        self.llm_service = llm_service
+        self.rag_manager = rag_manager
+        self.cache_path = Path(cache_path) if cache_path else None
+        self.summary_threshold_tokens = summary_threshold_tokens
+        self.summary_words = summary_words
+        self.max_documents = max_documents
+        self.prompt_token_budget = prompt_token_budget
+
+        self.current: Optional[Dict[str, Any]] = None
+        self._building_hash = None
+        self._task = None
+        self.last_error = None
+
+    async def start(self):
+        """Load the cached digest, then follow every published generation"""
+        if self.cache_path is not None:
+            loop = asyncio.get_running_loop()
+            self.current = await loop.run_in_executor(None, self._load_cache)
+        self.rag_manager.add_publish_listener(self.schedule)
+        self.schedule(self.rag_manager.pin())
+
+    async def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def digest_for(self, generation: IndexGeneration) -> Optional[Dict[str, Any]]:
+        """The digest for exactly this generation's documents, or None"""
+        digest = self.current
+        if digest is not None and digest['corpus_hash'] == generation.corpus_hash() \
+                and digest['model'] == self.llm_service.model:
+            return digest
+        return None
+
+    def schedule(self, generation: IndexGeneration):
+        """(Re)start the background build if the corpus changed; never blocks"""
+        corpus_hash = generation.corpus_hash()
+        if not generation.documents or self.digest_for(generation) is not None \
+                or corpus_hash == self._building_hash:
+            return
+        if self._task is not None and not self._task.done():
+            # A newer corpus supersedes the build in progress
+            self._task.cancel()
+        self._building_hash = corpus_hash
+        self._task = asyncio.create_task(self._build(generation, corpus_hash))
+
+    async def _build(self, generation: IndexGeneration, corpus_hash: str):
+        if not self.llm_service.is_initialized:
+            logger.info("LLM not available - profile digest postponed")
+            self._building_hash = None
+            return
+
+        started = time.perf_counter()
+        try:
+            documents = self._select_documents(generation)
+            summaries = {}
+            sections = []
+            for doc in documents:
+                summary = None
+                if estimate_tokens(doc.content) > self.summary_threshold_tokens:
+                    summary = summaries[doc.filename] = await self._summarize(doc)
+                # The JSON profile is extracted from full profile/preference text
+                if summary is None or doc.category in PRIORITY_CATEGORIES:
+                    sections.append(f"=== {doc.filename} ===\n{doc.content.strip()}")
+                else:
+                    sections.append(f"=== {doc.filename} (summary) ===\n{summary}")
+
+            profile = await self._extract_profile(self._fit_budget(sections))
+            facts = self._unanimous_facts(generation)
+            digest = {
+                'corpus_hash': corpus_hash,
+                'model': self.llm_service.model,
+                'generation': generation.number,
+                'built_at': time.time(),
+                'build_seconds': round(time.perf_counter() - started, 3),
+                'profile': profile,
+                'facts': facts,
+                'summaries': summaries
+            }
+            digest['text'] = self._render(digest)
+            digest['tokens'] = estimate_tokens(digest['text'])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.last_error = str(e)
+            logger.warning(f"Profile digest build failed: {str(e)}")
+            self._building_hash = None
+            return
+
+        # Publish atomically; readers see either the old digest or this one
+        self.current = digest
+        self._building_hash = None
+        self.last_error = None
+        logger.info(f"Profile digest ready for generation {generation.number}: "
+                    f"{digest['tokens']} tokens in {digest['build_seconds']}s")
+
+        if self.cache_path is not None:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self._save_cache, digest)
+
+    def _select_documents(self, generation: IndexGeneration) -> List:
+        """Profile and preference documents first, capped at max_documents"""
+        ranked = sorted(generation.documents,
+                        key=lambda doc: (doc.category not in PRIORITY_CATEGORIES, doc.filename))
+        if len(ranked) > self.max_documents:
+            logger.info(f"Profile digest covers {self.max_documents} of {len(ranked)} documents")
+        return ranked[:self.max_documents]
+
+    def _fit_budget(self, sections: List[str]) -> str:
+        """Sections in priority order; an oversize one is skipped, not the rest"""
+        parts, used = [], 0
+        for section in sections:
+            tokens = estimate_tokens(section)
+            if used + tokens > self.prompt_token_budget:
+                logger.info(f"Profile digest skips {section.splitlines()[0]} ({tokens} tokens over budget)")
+                continue
+            parts.append(section)
+            used += tokens
+        return "\n\n".join(parts)
+
+    async def _summarize(self, doc) -> str:
+        prompt = (f"Summarize the document below in at most {self.summary_words} words, keeping "
+                  f"names, dates, numbers and stated preferences.\n\n=== {doc.filename} ===\n"
+                  f"{doc.content[:self.prompt_token_budget * 4]}")
+        summary = await self.llm_service.generate_completion(prompt=prompt, system_prompt=SUMMARY_SYSTEM_PROMPT)
+        summary = " ".join(summary.split())
+        if not summary:
+            raise ValueError(f"Empty summary for {doc.filename}")
+        return summary
+
+    async def _extract_profile(self, corpus: str) -> Dict[str, Any]:
+        response = await self.llm_service.generate_completion(
+            prompt=f"DOCUMENTS:\n{corpus}\n\nReturn the canonical profile as a JSON object.",
+            system_prompt=PROFILE_SYSTEM_PROMPT
+        )
+        start = response.find('{')
+        end = response.rfind('}')
+        if start == -1 or end == -1:
+            raise ValueError("No JSON object in profile digest response")
+        profile = json.loads(response[start:end + 1])
+        if not isinstance(profile, dict):
+            raise ValueError("Profile digest is not a JSON object")
+        return profile
+
+    @staticmethod
+    def _unanimous_facts(generation: IndexGeneration) -> Dict[str, str]:
+        """Fact-table entries whose key maps to a single value"""
+        facts = {}
+        for candidates in generation.facts.by_key.values():
+            if len({fact['value'] for fact in candidates}) == 1:
+                facts[candidates[0]['key']] = candidates[0]['value']
+        return facts
+
+    @staticmethod
+    def _render(digest: Dict[str, Any]) -> str:
+        """Compact context text handed to the form-filling prompt"""
+        profile = json.dumps(digest['profile'], ensure_ascii=False, separators=(',', ':'))
+        parts = ["PROFILE (JSON):\n" + profile]
+        # Extracted facts the model left out of the profile
+        extra = {key: value for key, value in digest['facts'].items() if value not in profile}
+        if extra:
+            parts.append("FACTS:\n" + "\n".join(f"- {key}: {value}" for key, value in extra.items()))
+        if digest['summaries']:
+            parts.append("DOCUMENT SUMMARIES:\n" + "\n".join(
+                f"- {filename}: {summary}" for filename, summary in digest['summaries'].items()))
+        return "\n\n".join(parts)
+
+    def status(self) -> Dict[str, Any]:
+        digest = self.current
+        generation = self.rag_manager.pin()
+        return {
+            'ready': self.digest_for(generation) is not None,
+            'building': self._task is not None and not self._task.done(),
+            'corpus_hash': digest['corpus_hash'] if digest else None,
+            'generation': digest['generation'] if digest else None,
+            'tokens': digest['tokens'] if digest else 0,
+            'built_at': digest['built_at'] if digest else None,
+            'last_error': self.last_error
+        }
+
+    def _load_cache(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                digest = json.load(f)
+            return digest if isinstance(digest, dict) and 'corpus_hash' in digest else None
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable profile digest cache: {str(e)}")
+            return None
+
+    def _save_cache(self, digest: Dict[str, Any]):
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.cache_path.with_name(self.cache_path.name + ".tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(digest, f, ensure_ascii=False)
+            os.replace(tmp_path, self.cache_path)
+        except Exception as e:
+            logger.warning(f"Failed to save profile digest: {str(e)}")
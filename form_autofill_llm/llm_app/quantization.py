@@ -0,0 +1,110 @@
+# quantization.py - Compact codes for unit embedding vectors
+from typing import Optional, Tuple
+
+import numpy as np
+
+# Rows decoded at a time while scoring, bounding temporary memory
+SCORE_BLOCK = 8192
+
+# +-1 per bit (most significant first, as np.packbits orders them) of every byte value
+_BYTE_SIGNS = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).astype(np.float32) * 2 - 1
+
+# (codes, per-row scales or None)
+Codes = Tuple[np.ndarray, Optional[np.ndarray]]
+
+
+class Float32Quantizer:
+    """Identity encoding: vectors are kept and scored at full precision"""
+
+    name = "float32"
+    exact = True
+    rescore_factor = 1
+
+    def encode(self, vectors: np.ndarray) -> Codes:
+        return np.ascontiguousarray(vectors, dtype=np.float32), None
+
+    def scores(self, codes: np.ndarray, scales: Optional[np.ndarray], queries: np.ndarray) -> np.ndarray:
+        """(rows x queries) inner products"""
+        return codes @ queries.T
+
+
+class Int8Quantizer:
+    """One signed byte per dimension plus a float32 scale per vector (~4x smaller)
+
+    Each vector is scaled so its largest component maps to +-127; scores
+    are computed against the float query, so only the vector side is
+    rounded.
+    """
+
+    name = "int8"
+    exact = False
+    # Shortlist size per requested hit; rounding rarely reorders beyond that
+    rescore_factor = 4
+
+    def encode(self, vectors: np.ndarray) -> Codes:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        peaks = np.abs(vectors).max(axis=1) if len(vectors) else np.zeros(0, dtype=np.float32)
+        peaks = np.where(peaks == 0, 1, peaks).astype(np.float32)
+        codes = np.rint(vectors * (127 / peaks)[:, None]).astype(np.int8)
+        return codes, peaks / 127
+
+    def scores(self, codes: np.ndarray, scales: Optional[np.ndarray], queries: np.ndarray) -> np.ndarray:
+        scores = np.empty((len(codes), len(queries)), dtype=np.float32)
+        for start in range(0, len(codes), SCORE_BLOCK):
+            block = codes[start:start + SCORE_BLOCK].astype(np.float32)
+            scores[start:start + len(block)] = block @ queries.T
+        scores *= scales[:, None]
+        return scores
+
+
+class BinaryQuantizer:
+    """Sign bit per dimension, packed 8 to a byte (32x smaller than float32)
+
+    The float query is kept: a code scores sum(+-q_i) by its signs, read
+    from a 256-entry table per code byte. Plain Hamming distance between
+    sign patterns ranks badly for embeddings that are not zero-centred.
+    Scores only rank candidates roughly; callers rescore a shortlist
+    exactly.
+    """
+
+    name = "binary"
+    exact = False
+    rescore_factor = 16
+
+    def encode(self, vectors: np.ndarray) -> Codes:
+        return np.packbits(np.asarray(vectors) > 0, axis=1), None
+
+    def scores(self, codes: np.ndarray, scales: Optional[np.ndarray], queries: np.ndarray) -> np.ndarray:
+        """(rows x queries) inner products of the queries with the sign vectors"""
+        width = codes.shape[1]
+        padded = np.zeros((len(queries), width * 8), dtype=np.float32)
+        padded[:, :queries.shape[1]] = queries
+        # tables[q, j, v]: contribution of byte value v at byte position j
+        tables = (padded.reshape(len(queries), width, 8) @ _BYTE_SIGNS.T).reshape(len(queries), -1)
+        offsets = np.arange(width, dtype=np.intp) * 256
+        scores = np.empty((len(codes), len(queries)), dtype=np.float32)
+        for start in range(0, len(codes), SCORE_BLOCK):
+            # Flat table index of every code byte, shared by all queries
+            index = codes[start:start + SCORE_BLOCK] + offsets
+            for column, table in enumerate(tables):
+                scores[start:start + len(index), column] = np.take(table, index).sum(axis=1)
+        return scores
+
+
+QUANTIZERS = {
+    None: Float32Quantizer,
+    "float32": Float32Quantizer,
+    "int8": Int8Quantizer,
+    "binary": BinaryQuantizer,
+}
+
+
+def create_quantizer(kind: Optional[str]):
+    """Build a quantizer by name (None/"float32", "int8" or "binary")"""
+    if kind not in QUANTIZERS:
+        raise ValueError(f"Unknown quantization: {kind}")
+    return QUANTIZERS[kind]()
+
+
+def codes_nbytes(codes: np.ndarray, scales: Optional[np.ndarray]) -> int:
+    return codes.nbytes + (scales.nbytes if scales is not None else 0)
@@ -0,0 +1,69 @@
+# query_cache.py - LRU cache of ranked chunk references per index generation
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from text_utils import tokenize
+
+# (score, doc_id, chunk position), as returned by the indexes
+Ranked = List[Tuple[float, str, int]]
+
+
+def normalize_query(query: str) -> str:
+    """Cache key for a query: its index terms, so "Email:" and "email" share an entry"""
+    terms = tokenize(query)
+    return " ".join(terms) if terms else " ".join(query.lower().split())
+
+
+class QueryCache:
+    """Size-bounded LRU of normalized query -> ranked chunk references
+
+    Entries are only valid for the generation they were computed on, so the
+    key includes the generation number (plus the search scope) and
+    RAGManager clears the cache whenever it publishes a new one. Each entry
+    remembers the top_k it was ranked with and serves any request for that
+    many results or fewer.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[Tuple[int, str, Tuple], Tuple[int, Ranked]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, generation: int, query: str, top_k: int, scope: Tuple = ()) -> Optional[Ranked]:
+        key = (generation, normalize_query(query), scope)
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < top_k:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1][:top_k]
+
+    def put(self, generation: int, query: str, top_k: int, ranked: Ranked, scope: Tuple = ()):
+        if self.max_entries <= 0:
+            return
+        key = (generation, normalize_query(query), scope)
+        self.entries[key] = (top_k, list(ranked))
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+        }
@@ -1,143 +1,707 @@
 # rag_manager.py - Manages markdown documents and RAG functionality
 import os
 import asyncio
+import multiprocessing
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Awaitable, Callable, Optional, Set, Tuple
 import logging
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
-import hashlib
+
+from index_store import IndexStore
+from index_generation import IndexGeneration
+from markdown_chunker import chunk_markdown
+from context_packer import format_chunk
+from doc_loader import LoadItem, load_document_batch
+from document_record import DocumentRecord
+from extractors import ExtractionCache, default_extractors, missing_formats
+from front_matter import normalize_filters
+from query_cache import QueryCache
+
+try:
+    from embedding_index import EmbeddingIndex
+    from vector_store import VectorStore
+except ImportError:  # NumPy is only needed for embedding retrieval
+    EmbeddingIndex = None
 
 logger = logging.getLogger(__name__)
 
 
 class MarkdownFileHandler(FileSystemEventHandler):
-    """Watches for changes in markdown files"""
+    """Watches for changes in supported documents anywhere under the docs tree
     
-    def __init__(self, rag_manager):
+    Watchdog delivers events on its own thread, so every event is handed to
+    the server's event loop with call_soon_threadsafe and coalesced there.
+    Directory creations, deletions and moves are queued as well so whole
+    subtrees are picked up or dropped.
+    """
+    
+    def __init__(self, rag_manager, loop: asyncio.AbstractEventLoop):
         self.rag_manager = rag_manager
+        self.loop = loop
+        
+    def _queue(self, path: str):
+        self.loop.call_soon_threadsafe(self.rag_manager.schedule_reload, path)
+        
+    def _supported(self, path: str) -> bool:
+        return self.rag_manager.is_supported(path)
         
     def on_modified(self, event):
-        if event.is_directory or not event.src_path.endswith('.md'):
+        if event.is_directory or not self._supported(event.src_path):
             return
         logger.info(f"Detected change in: {event.src_path}")
-        asyncio.create_task(self.rag_manager.reload_documents())
+        self._queue(event.src_path)
         
     def on_created(self, event):
-        if event.is_directory or not event.src_path.endswith('.md'):
+        if not event.is_directory and not self._supported(event.src_path):
             return
-        logger.info(f"New markdown file detected: {event.src_path}")
-        asyncio.create_task(self.rag_manager.reload_documents())
+        logger.info(f"New document path detected: {event.src_path}")
+        self._queue(event.src_path)
         
     def on_deleted(self, event):
-        if event.is_directory or not event.src_path.endswith('.md'):
+        if not event.is_directory and not self._supported(event.src_path):
             return
-        logger.info(f"Markdown file deleted: {event.src_path}")
-        asyncio.create_task(self.rag_manager.reload_documents())
+        logger.info(f"Document path deleted: {event.src_path}")
+        self._queue(event.src_path)
+        
+    def on_moved(self, event):
+        if event.is_directory or self._supported(event.src_path):
+            self._queue(event.src_path)
+        if event.is_directory or self._supported(event.dest_path):
+            logger.info(f"Document path moved: {event.src_path} -> {event.dest_path}")
+            self._queue(event.dest_path)
 
 
 class RAGManager:
-    """Manages document loading, chunking, and retrieval"""
+    """Manages document loading, chunking, and retrieval
+    
+    All searchable state lives in an immutable IndexGeneration. Reloads build
+    the next generation on worker threads and publish it with a single
+    reference swap, so requests never wait on (or observe half of) a reload.
+    """
     
-    def __init__(self, docs_path: str = "./md_docs"):
+    def __init__(self,
+                 docs_path: str = "./md_docs",
+                 reload_debounce: float = 0.5,
+                 retrieval_mode: str = "keyword",
+                 embedder: Optional[Callable[[List[str]], Awaitable[List[List[float]]]]] = None,
+                 index_path: Optional[str] = "./.rag_index",
+                 chunk_tokens: int = 256,
+                 ingest_workers: Optional[int] = None,
+                 ingest_batch_size: int = 64,
+                 process_pool_threshold: int = 256,
+                 query_cache_size: int = 1024,
+                 reranker=None,
+                 rerank_candidates: int = 50,
+                 ann_threshold: Optional[int] = 50000,
+                 ann_nprobe: Optional[int] = None,
+                 ann_recall_tolerance: float = 0.05,
+                 quantization: Optional[str] = None,
+                 rescore_factor: Optional[int] = None,
+                 extractors: Optional[Dict[str, Callable[[bytes, str], str]]] = None,
+                 extraction_cache_size: int = 10000,
+                 snapshot_debounce: float = 10.0,
+                 journal_compact_ratio: float = 0.5):
         self.docs_path = Path(docs_path)
-        self.documents = []
-        self.doc_hashes = {}
+        self.chunk_tokens = chunk_tokens
+        
+        # File extension -> (extract function, cached); extra extractors must
+        # be module-level functions so worker processes can import them
+        self.extractors = default_extractors()
+        for extension, extract in (extractors or {}).items():
+            self.extractors[extension.lower()] = (extract, True)
+        
+        # Optional semantic retrieval ("keyword" or "embedding")
+        self.retrieval_mode = retrieval_mode
+        self.embedder = embedder
+        use_embeddings = False
+        if retrieval_mode == "embedding":
+            if EmbeddingIndex is None:
+                logger.warning("NumPy not installed - falling back to keyword retrieval")
+            elif embedder is None:
+                logger.warning("No embedder configured - falling back to keyword retrieval")
+            else:
+                use_embeddings = True
+        elif retrieval_mode != "keyword":
+            logger.warning(f"Unknown retrieval mode {retrieval_mode!r} - using keyword retrieval")
+        
+        # Corpora of ann_threshold chunks or more are searched with an IVF
+        # index (None: always exact). It scans ann_nprobe lists per query
+        # (default ~10% of them), raised at training time until recall is
+        # within ann_recall_tolerance of exact search, or search stays exact.
+        # quantization ("int8" or "binary") keeps compact codes in memory and
+        # rescores top_k * rescore_factor candidates at full precision, read
+        # back from the on-disk vector store
+        embeddings = None
+        if use_embeddings:
+            # Full-precision vectors live in a file next to the snapshot
+            embeddings = EmbeddingIndex(ann_threshold, ann_nprobe, quantization, rescore_factor,
+                                        store_path=index_path, recall_tolerance=ann_recall_tolerance)
+        self.generation = IndexGeneration(embeddings=embeddings)
         self.is_initialized = False
         self.observer = None
         
+        # Parallel ingestion: large batches go to a process pool
+        self.ingest_workers = ingest_workers or os.cpu_count() or 1
+        self.ingest_batch_size = ingest_batch_size
+        self.process_pool_threshold = process_pool_threshold
+        self.ingest_progress = {'total': 0, 'done': 0, 'changed': 0, 'errors': 0, 'running': False}
+        
+        # Optional second stage: rescore the first-stage candidates
+        # (see reranker.py) and keep only the best few
+        self.reranker = reranker
+        self.rerank_candidates = rerank_candidates
+        
+        # Ranked results for repeated field labels, valid for one generation
+        self.query_cache = QueryCache(query_cache_size)
+        
+        # On-disk snapshot so restarts skip re-reading unchanged files. Each
+        # publish appends its changes to a journal; a full base is rewritten
+        # snapshot_debounce seconds after the journal outgrows
+        # journal_compact_ratio of it. Both run on one background thread,
+        # in order, and never hold the reload lock
+        self.store = IndexStore(index_path) if index_path else None
+        self.snapshot_debounce = snapshot_debounce
+        self.journal_compact_ratio = journal_compact_ratio
+        self._snapshot_executor = ThreadPoolExecutor(max_workers=1) if self.store is not None else None
+        self._snapshot_lineage = uuid.uuid4().hex
+        # Generation of the base on disk (or queued), None until there is one
+        self._snapshot_base: Optional[int] = None
+        self._compaction_handle = None
+        self._snapshot_tasks: Set[asyncio.Task] = set()
+        # Extracted text of PDFs, JSON etc. by content hash, shared with workers
+        self.extraction_cache_path = str(Path(index_path) / "extracted") if index_path else None
+        self.extraction_cache_size = extraction_cache_size
+        
+        # Debounced reloads triggered by the file watcher
+        self.reload_debounce = reload_debounce
+        self._pending_paths = set()
+        self._reload_handle = None
+        self._reload_task = None
+        self._reload_lock = asyncio.Lock()
+        
+        # Called on the event loop with each newly published generation
+        self._publish_listeners: List[Callable[[IndexGeneration], None]] = []
+        
+    # Read-only views of the current generation
+    @property
+    def documents(self) -> List[DocumentRecord]:
+        return self.generation.documents
+    
+    @property
+    def doc_hashes(self) -> Dict[str, str]:
+        return self.generation.doc_hashes
+    
+    @property
+    def index(self):
+        return self.generation.index
+    
+    @property
+    def facts(self):
+        return self.generation.facts
+    
+    @property
+    def embeddings(self):
+        return self.generation.embeddings
+    
+    def add_publish_listener(self, callback: Callable[[IndexGeneration], None]):
+        """Call callback(generation) whenever a reload publishes a new generation"""
+        self._publish_listeners.append(callback)
+    
+    def pin(self) -> IndexGeneration:
+        """Return the current generation for a request to use throughout"""
+        return self.generation
+        
     async def initialize(self):
         """Initialize the RAG manager"""
         # Create docs directory if it doesn't exist
         self.docs_path.mkdir(parents=True, exist_ok=True)
         
-        # Load initial documents
+        # Start from the last snapshot, then reload only stale files
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._restore_snapshot)
         await self.reload_documents()
         
         self.is_initialized = True
         logger.info(f"RAG Manager initialized with {len(self.documents)} documents")
         
     async def reload_documents(self):
-        """Reload all markdown documents from the docs directory"""
-        logger.info("Reloading markdown documents...")
+        """Reload all supported documents under the docs directory (recursively)"""
+        logger.info("Reloading documents...")
+        
+        async with self._reload_lock:
+            loop = asyncio.get_running_loop()
+            
+            base = self.generation
+            
+            # Find all supported files
+            items = await loop.run_in_executor(None, self._scan, [self.docs_path], base)
+            
+            if not items:
+                logger.warning(f"No documents found in {self.docs_path}")
+                logger.info("Creating example documentation file...")
+                await loop.run_in_executor(None, self._create_example_doc)
+                items = await loop.run_in_executor(None, self._scan, [self.docs_path], base)
+            
+            # Drop documents that no longer exist
+            seen = {item[1] for item in items}
+            removed = [filename for filename in base.doc_map if filename not in seen]
+            
+            await self._rebuild(items, removed)
+            
+            if self.extraction_cache_path:
+                cache = ExtractionCache(self.extraction_cache_path)
+                pruned = await loop.run_in_executor(None, cache.prune, self.extraction_cache_size)
+                if pruned:
+                    logger.info(f"Pruned {pruned} extraction cache entries")
+        
+        logger.info(f"Reloaded {len(self.documents)} documents ({len(self.index)} chunks indexed)")
+        
+    async def reload_paths(self, paths):
+        """Re-read only the given files or directories, dropping deleted ones"""
+        async with self._reload_lock:
+            loop = asyncio.get_running_loop()
+            base = self.generation
+            existing = [Path(path) for path in paths if Path(path).exists()]
+            items = await loop.run_in_executor(None, self._scan, existing, base)
+            
+            removed = []
+            for path in paths:
+                path = Path(path)
+                if not path.exists():
+                    # Deleted file, or a deleted directory and everything below it
+                    key = self._doc_key(path)
+                    removed.extend(filename for filename in base.doc_map
+                                   if filename == key or filename.startswith(key + "/"))
+            
+            changed = await self._rebuild(items, removed)
+        
+        logger.info(f"Incremental reload: {changed} changed files applied from {len(paths)} paths")
         
-        new_documents = []
-        new_hashes = {}
+    async def _rebuild(self, items: List[LoadItem], removed: List[str]) -> int:
+        """Build the next generation off the event loop and publish it atomically
         
-        # Find all markdown files
-        md_files = list(self.docs_path.glob("*.md"))
+        Must be called with the reload lock held. Returns the number of
+        documents added, changed or removed.
+        """
+        started = time.perf_counter()
+        base = self.generation
+        results = await self._ingest_files(items)
         
-        if not md_files:
-            logger.warning(f"No markdown files found in {self.docs_path}")
-            logger.info("Creating example documentation file...")
-            self._create_example_doc()
-            md_files = list(self.docs_path.glob("*.md"))
+        loop = asyncio.get_running_loop()
+        generation, changed = await loop.run_in_executor(
+            None, self._build_generation, base, results, removed
+        )
+        await self._sync_embeddings(generation)
+        if not generation.changed:
+            return 0
         
-        for md_file in md_files:
+        await loop.run_in_executor(None, generation.finalize, started)
+        
+        # Publish: requests that already pinned the old generation keep it
+        self.generation = generation
+        self.query_cache.clear()
+        logger.info(f"Published index generation {generation.number} "
+                    f"in {generation.build_seconds}s ({changed} documents changed)")
+        for listener in self._publish_listeners:
             try:
-                with open(md_file, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                
-                # Calculate hash to detect changes
-                content_hash = hashlib.md5(content.encode()).hexdigest()
-                
-                # Check if document has changed
-                if md_file.name in self.doc_hashes:
-                    if self.doc_hashes[md_file.name] == content_hash:
-                        # No change, use existing document
-                        for doc in self.documents:
-                            if doc['filename'] == md_file.name:
-                                new_documents.append(doc)
-                                break
-                        new_hashes[md_file.name] = content_hash
-                        continue
-                
-                # New or changed document
-                doc = {
-                    'filename': md_file.name,
-                    'content': content,
-                    'chunks': self._chunk_document(content),
-                    'last_modified': md_file.stat().st_mtime
-                }
-                
-                new_documents.append(doc)
-                new_hashes[md_file.name] = content_hash
-                logger.info(f"Loaded: {md_file.name} ({len(doc['chunks'])} chunks)")
-                
+                listener(generation)
             except Exception as e:
-                logger.error(f"Error loading {md_file}: {str(e)}")
+                logger.warning(f"Publish listener failed: {str(e)}")
         
-        self.documents = new_documents
-        self.doc_hashes = new_hashes
-        logger.info(f"Reloaded {len(self.documents)} documents")
+        self._queue_snapshot(generation, results, removed)
+        return changed
         
-    def _chunk_document(self, content: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
-        """Split document into overlapping chunks"""
-        chunks = []
-        start = 0
+    @staticmethod
+    def _build_generation(base: IndexGeneration, results: List[Dict[str, Any]], removed: List[str]):
+        """Derive a new generation from base and apply loads and removals (worker thread)"""
+        generation = base.derive()
+        changed = 0
+        for filename in removed:
+            generation.remove_document(filename)
+            changed += 1
+        for result in results:
+            changed += generation.apply_loaded(result)
+        return generation, changed
         
-        while start < len(content):
-            end = start + chunk_size
-            chunk = content[start:end]
-            
-            # Try to break at sentence boundary
-            if end < len(content):
-                last_period = chunk.rfind('.')
-                last_newline = chunk.rfind('\n')
-                break_point = max(last_period, last_newline)
+    def schedule_reload(self, path: str):
+        """Queue a changed path and (re)start the debounce timer
+        
+        Must be called on the event loop thread.
+        """
+        self._pending_paths.add(path)
+        if self._reload_handle is not None:
+            self._reload_handle.cancel()
+        loop = asyncio.get_running_loop()
+        self._reload_handle = loop.call_later(self.reload_debounce, self._flush_pending_reloads)
+        
+    def _flush_pending_reloads(self):
+        """Reload every path collected during the debounce window"""
+        self._reload_handle = None
+        paths = sorted(self._pending_paths)
+        self._pending_paths.clear()
+        if paths:
+            self._reload_task = asyncio.create_task(self.reload_paths(paths))
+        
+    def is_supported(self, path: str) -> bool:
+        """True if an extractor is registered for the file's extension"""
+        return os.path.splitext(path)[1].lower() in self.extractors
+        
+    def _discover_files(self, root: Path) -> List[Path]:
+        """Recursively list supported documents under root, skipping hidden directories"""
+        files = []
+        missing = missing_formats(self.extractors)
+        skipped: Dict[str, List[str]] = {}
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [name for name in dirnames if not name.startswith('.')]
+            base = Path(dirpath)
+            for name in filenames:
+                if self.is_supported(name):
+                    files.append(base / name)
+                elif os.path.splitext(name)[1].lower() in missing:
+                    skipped.setdefault(os.path.splitext(name)[1].lower(), []).append(self._doc_key(base / name))
+        for extension, names in sorted(skipped.items()):
+            names.sort()
+            listed = ", ".join(names[:20]) + (f" and {len(names) - 20} more" if len(names) > 20 else "")
+            logger.warning(f"{missing[extension]} is not installed, skipping {len(names)} {extension} files: "
+                           f"{listed} (pip install {missing[extension]})")
+        files.sort()
+        return files
+        
+    def _doc_key(self, path: Path) -> str:
+        """Document id: the path relative to the docs directory"""
+        try:
+            return path.relative_to(self.docs_path).as_posix()
+        except ValueError:
+            pass
+        try:
+            return path.resolve().relative_to(self.docs_path.resolve()).as_posix()
+        except ValueError:
+            return path.name
+        
+    def _scan(self, roots: List[Path], base: IndexGeneration) -> List[LoadItem]:
+        """Expand files and directories into load items, with the stat and hash
+        each document had in base (runs on a worker thread)"""
+        items = []
+        for root in roots:
+            files = self._discover_files(root) if root.is_dir() else [root]
+            for path in files:
+                key = self._doc_key(path)
+                current = base.doc_map.get(key)
+                if current is not None:
+                    items.append((str(path), key, current.last_modified,
+                                  current.file_size, base.doc_hashes.get(key)))
+                else:
+                    items.append((str(path), key, None, None, None))
+        return items
+        
+    async def _ingest_files(self, items: List[LoadItem]) -> List[Dict[str, Any]]:
+        """Stat, read and chunk files on a worker pool
+        
+        Workers skip files whose mtime and size match the known version, so
+        a full reload of an unchanged tree only costs one stat per file.
+        """
+        if not items:
+            return []
+        
+        batches = [items[i:i + self.ingest_batch_size]
+                   for i in range(0, len(items), self.ingest_batch_size)]
+        
+        progress = self.ingest_progress = {
+            'total': len(items), 'done': 0, 'changed': 0, 'errors': 0, 'running': True
+        }
+        started = time.perf_counter()
+        
+        # Threads are enough for a handful of files; large trees use processes
+        executor = None
+        if len(items) >= self.process_pool_threshold and self.ingest_workers > 1:
+            executor = ProcessPoolExecutor(
+                max_workers=self.ingest_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        
+        loop = asyncio.get_running_loop()
+        futures = [loop.run_in_executor(executor, load_document_batch, batch, self.chunk_tokens,
+                                        self.extractors, self.extraction_cache_path)
+                   for batch in batches]
+        results = []
+        try:
+            next_log = 1000
+            for future in asyncio.as_completed(futures):
+                for result in await future:
+                    progress['done'] += 1
+                    if result['status'] == 'error':
+                        progress['errors'] += 1
+                        logger.error(f"Error loading {result['key']}: {result['error']}")
+                        continue
+                    if result['status'] == 'loaded':
+                        progress['changed'] += 1
+                    results.append(result)
                 
-                if break_point > chunk_size // 2:
-                    chunk = chunk[:break_point + 1]
-                    end = start + break_point + 1
-            
-            chunks.append(chunk.strip())
-            start = end - overlap
-            
-        return chunks
+                if progress['done'] >= next_log:
+                    logger.info(f"Ingest progress: {progress['done']}/{progress['total']} files")
+                    next_log += 1000
+        finally:
+            progress['running'] = False
+            if executor is not None:
+                executor.shutdown(wait=False)
+        
+        progress['seconds'] = round(time.perf_counter() - started, 3)
+        logger.info(f"Ingested {progress['total']} files in {progress['seconds']}s "
+                    f"({progress['changed']} changed, {progress['errors']} errors)")
+        return results
+        
+    def _restore_snapshot(self):
+        """Load documents and indexes from the on-disk snapshot and replay its journal, if valid"""
+        if self.store is None:
+            return
+        
+        state = self.store.load()
+        if state is not None and state.get('chunk_tokens') != self.chunk_tokens:
+            logger.info("Chunk budget changed since the last snapshot, rebuilding")
+            state = None
+        if state is None:
+            if self.generation.embeddings is not None:
+                VectorStore.remove_unused(self.store.path, set())
+            return
+        
+        started = time.perf_counter()
+        generation = IndexGeneration(state.get('generation', 0), embeddings=self.generation.embeddings)
+        for doc in state['documents']:
+            generation.add_record(doc, state['doc_hashes'][doc.filename])
+        generation.index = state['index']
+        generation.duplicates = state['duplicates']
+        
+        journal = state['journal']
+        embeddings = generation.embeddings
+        if embeddings is not None:
+            saved, journal = self._journaled_embeddings(state.get('embeddings'), journal)
+            if saved is not None:
+                embeddings.restore(saved)
+        for entry in journal:
+            self._replay(generation, entry)
+        if embeddings is not None:
+            # Anything the snapshot did not embed is picked up on reload
+            generation.embedding_pending = set(generation.doc_map) - set(embeddings.doc_hashes)
+            # Stores replaced by compaction before the last run exited
+            VectorStore.remove_unused(self.store.path, {embeddings.store.name} if embeddings.store else set())
+        
+        generation.finalize(started)
+        self.generation = generation
+        self.query_cache.clear()
+        if state['journal_complete'] and len(journal) == len(state['journal']):
+            self._snapshot_lineage = state['lineage']
+            self._snapshot_base = state['generation']
+        # Otherwise the next publish writes a new base instead of appending
+        # behind entries that were not replayed
+        logger.info(f"Restored index snapshot: {len(self.documents)} documents, {len(self.index)} chunks "
+                    f"({len(journal)} journal entries replayed)")
+    
+    @staticmethod
+    def _journaled_embeddings(saved: Optional[Dict[str, Any]],
+                              journal: List[Dict[str, Any]]) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]]]:
+        """The saved embedding table plus the store rows the journal added
+
+        Returns it with the journal entries that can be replayed on top of
+        it, which stop at the first one written against another store.
+        """
+        saved = dict(saved) if saved else {'vector_file': None, 'rows': {}, 'doc_hashes': {}, 'ann': None}
+        rows = dict(saved['rows'])
+        for count, entry in enumerate(journal):
+            if 'embeddings' not in entry:
+                continue
+            changes = entry['embeddings']
+            if changes is None or (saved['vector_file'] is not None and changes['rows']
+                                   and changes['vector_file'] != saved['vector_file']):
+                journal = journal[:count]
+                break
+            if changes['rows'] and saved['vector_file'] is None:
+                saved['vector_file'] = changes['vector_file']
+                saved['dimension'] = changes['dimension']
+            rows.update(changes['rows'])
+        if not rows:
+            return None, journal
+        saved['rows'] = rows
+        saved['vector_rows'] = max(rows.values()) + 1
+        return saved, journal
+    
+    @staticmethod
+    def _replay(generation: IndexGeneration, entry: Dict[str, Any]):
+        """Apply one journal entry to a generation being restored"""
+        for filename in entry['removed']:
+            generation.remove_document(filename)
+        for result in entry['results']:
+            generation.apply_loaded(result)
+        embeddings = generation.embeddings
+        changes = entry.get('embeddings')
+        if embeddings is not None and changes and embeddings.store is not None:
+            for name, hashes in changes['doc_hashes'].items():
+                if name in generation.doc_map and all(key in embeddings.rows for key in hashes):
+                    embeddings.set_document_hashes(name, hashes)
+        generation.number = entry['generation']
+    
+    def _queue_snapshot(self, generation: IndexGeneration, results: List[Dict[str, Any]], removed: List[str]):
+        """Journal a just published generation in the background, or schedule a new base"""
+        if self.store is None:
+            return
+        
+        entry = {
+            'lineage': self._snapshot_lineage,
+            'generation': generation.number,
+            'removed': list(removed),
+            'results': [result for result in results if result['status'] in ('loaded', 'touched')]
+        }
+        if generation.embeddings is not None:
+            entry['embeddings'] = generation.embeddings.changes()
+            if entry['embeddings'] is None:
+                # The vector store was compacted, so every row moved
+                self._snapshot_base = None
+        
+        if self._snapshot_base is None:
+            self._schedule_compaction(0)
+        else:
+            self._spawn_snapshot_task(self._append_journal(generation, entry))
+    
+    def _spawn_snapshot_task(self, coro):
+        task = asyncio.get_running_loop().create_task(coro)
+        self._snapshot_tasks.add(task)
+        task.add_done_callback(self._snapshot_tasks.discard)
+    
+    def _write_journal(self, generation: IndexGeneration, entry: Dict[str, Any]) -> Tuple[int, int]:
+        """Append an entry once the vectors it refers to are durable (snapshot thread)"""
+        if generation.embeddings is not None and generation.embeddings.store is not None:
+            generation.embeddings.store.flush()
+        journal_bytes = self.store.append(entry)
+        return self.store.sizes()[0], journal_bytes
+    
+    async def _append_journal(self, generation: IndexGeneration, entry: Dict[str, Any]):
+        loop = asyncio.get_running_loop()
+        try:
+            base_bytes, journal_bytes = await loop.run_in_executor(
+                self._snapshot_executor, self._write_journal, generation, entry
+            )
+        except Exception as e:
+            logger.warning(f"Failed to journal index generation {generation.number}: {str(e)}")
+            # Later entries would not continue the journal; start a new base
+            self._snapshot_lineage = uuid.uuid4().hex
+            self._snapshot_base = None
+            self._schedule_compaction(0)
+            return
+        
+        logger.debug(f"Journaled index generation {generation.number} ({journal_bytes} bytes of journal)")
+        if journal_bytes > self.journal_compact_ratio * base_bytes:
+            self._schedule_compaction(self.snapshot_debounce)
+    
+    def _schedule_compaction(self, delay: float):
+        """Write a new base after delay seconds, unless one is already due sooner"""
+        loop = asyncio.get_running_loop()
+        if self._compaction_handle is not None:
+            if self._compaction_handle.when() <= loop.time() + delay:
+                return
+            self._compaction_handle.cancel()
+        self._compaction_handle = loop.call_later(
+            delay, lambda: self._spawn_snapshot_task(self._compact_snapshot())
+        )
+    
+    def _write_base(self, generation: IndexGeneration):
+        """Pickle a published generation as the new base (snapshot thread)
+        
+        Published generations are immutable, so this is safe while the
+        next one is being built.
+        """
+        state = {
+            'documents': generation.documents,
+            'doc_hashes': generation.doc_hashes,
+            'index': generation.index,
+            'duplicates': generation.duplicates,
+            'generation': generation.number,
+            'lineage': self._snapshot_lineage,
+            'chunk_tokens': self.chunk_tokens
+        }
+        if generation.embeddings is not None:
+            # Vectors are already on disk; only their table is pickled
+            state['embeddings'] = generation.embeddings.export()
+        self.store.save(state)
+    
+    async def _compact_snapshot(self):
+        """Write the current generation as the new base and truncate the journal"""
+        self._compaction_handle = None
+        generation = self.generation
+        # Publishes from here on are journaled after this base
+        self._snapshot_base = generation.number
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            await loop.run_in_executor(self._snapshot_executor, self._write_base, generation)
+        except Exception as e:
+            logger.warning(f"Failed to save index snapshot: {str(e)}")
+            self._snapshot_lineage = uuid.uuid4().hex
+            self._snapshot_base = None
+            return
+        logger.info(f"Saved index snapshot of generation {generation.number} to {self.store.path} "
+                    f"({time.perf_counter() - started:.2f}s)")
+        
+        if generation.embeddings is not None:
+            # Stores replaced by compaction; holding the reload lock keeps
+            # the store of a generation that is still being built
+            async with self._reload_lock:
+                keep = {g.embeddings.store.name for g in (generation, self.generation)
+                        if g.embeddings.store is not None}
+                await loop.run_in_executor(self._snapshot_executor, VectorStore.remove_unused,
+                                           self.store.path, keep)
+    
+    async def flush_snapshot(self):
+        """Write pending journal entries and any scheduled base now, and wait for them"""
+        while True:
+            # A finished journal write may have scheduled a base
+            if self._compaction_handle is not None:
+                self._compaction_handle.cancel()
+                self._compaction_handle = None
+                self._spawn_snapshot_task(self._compact_snapshot())
+            if not self._snapshot_tasks:
+                break
+            await asyncio.gather(*list(self._snapshot_tasks), return_exceptions=True)
+        
+    async def _sync_embeddings(self, generation: IndexGeneration):
+        """Embed chunks of new or changed documents, once per content hash"""
+        if generation.embeddings is None or not generation.embedding_pending:
+            return
+        
+        missing = {}
+        for name in generation.embedding_pending:
+            doc = generation.doc_map.get(name)
+            if doc is not None:
+                missing.update(generation.embeddings.missing(doc.search_texts()))
+        
+        vectors = None
+        try:
+            if missing:
+                keys = list(missing)
+                vectors = dict(zip(keys, await self.embedder([missing[key] for key in keys])))
+        except Exception as e:
+            # Leave documents pending; keyword retrieval covers them meanwhile
+            logger.warning(f"Embedding failed, using keyword retrieval: {str(e)}")
+            return
+        
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, generation.attach_embeddings, vectors)
+        logger.info(f"Embedded {len(missing)} new chunks ({len(generation.embeddings)} total)")
+        
+    def _chunk_document(self, content: str) -> List[Dict[str, Any]]:
+        """Split document into heading-aware chunks within the token budget"""
+        return chunk_markdown(content, max_tokens=self.chunk_tokens)
     
     def _create_example_doc(self):
         """Create an example markdown documentation file"""
-        example_content = """# User Information
+        example_content = """---
+category: profile
+tags: [contact, experience]
+---
+
+# User Information
 
 ## Personal Details
 - **Full Name**: John Doe
@@ -184,67 +748,206 @@ University of Technology (2014 - 2018)
         
         logger.info(f"Created example documentation: {example_file}")
     
-    def get_relevant_context(self, query: str, top_k: int = 5) -> str:
-        """Retrieve relevant document chunks for a query"""
-        if not self.documents:
-            return ""
+    async def _search_many(self, queries: List[str], top_k: int, generation: IndexGeneration, scope=None):
+        """Rank chunks for each query, reranking the first-stage candidates if configured
         
-        # Simple keyword-based retrieval (can be enhanced with embeddings)
-        query_lower = query.lower()
-        query_words = set(query_lower.split())
+        Near-duplicate chunks are collapsed to the best-ranked one. Returns
+        (ranked, cacheable); results from a fallback after a failed
+        embedding or reranker call are not cacheable.
+        """
+        # Over-fetch when near-duplicates exist so collapsing still fills top_k
+        fetch = top_k * 2 if len(generation.duplicates) else top_k
+        if self.reranker is None:
+            ranked, cacheable = await self._first_stage(queries, fetch, generation, scope)
+            return [generation.duplicates.collapse(result)[:top_k] for result in ranked], cacheable
         
-        chunk_scores = []
+        # Slow rerankers (an LLM call per batch) grade fewer candidates
+        limit = self.rerank_candidates
+        if getattr(self.reranker, 'max_candidates', None):
+            limit = min(limit, self.reranker.max_candidates)
+        candidates, cacheable = await self._first_stage(queries, max(fetch, limit), generation, scope)
+        candidates = [generation.duplicates.collapse(result) for result in candidates]
+        requests = []
+        for query, ranked in zip(queries, candidates):
+            passages = []
+            for _, filename, position in ranked[:limit]:
+                doc = generation.doc_map[filename]
+                passages.append(f"{doc.heading_path(position)}\n{doc.chunk_text(position)}")
+            requests.append((query, passages))
         
-        for doc in self.documents:
-            for chunk in doc['chunks']:
-                chunk_lower = chunk.lower()
-                # Calculate simple relevance score
-                score = sum(1 for word in query_words if word in chunk_lower)
-                
-                if score > 0:
-                    chunk_scores.append((score, chunk, doc['filename']))
+        try:
+            started = time.perf_counter()
+            scores = await self.reranker.score_many(requests)
+            logger.debug(f"Reranked {sum(len(p) for _, p in requests)} candidates "
+                         f"in {time.perf_counter() - started:.3f}s")
+        except Exception as e:
+            logger.warning(f"Reranking failed, using first-stage order: {str(e)}")
+            return [ranked[:top_k] for ranked in candidates], False
+        
+        reranked = []
+        for ranked, ranked_scores in zip(candidates, scores):
+            if ranked_scores is None:
+                # This query's rerank failed; the others keep theirs
+                reranked.append(ranked[:top_k])
+                cacheable = False
+                continue
+            rescored = sorted(((score, filename, position)
+                               for score, (_, filename, position) in zip(ranked_scores, ranked)),
+                              key=lambda item: item[0], reverse=True)
+            # Candidates past the reranker's limit follow in first-stage order
+            reranked.append((rescored + ranked[len(ranked_scores):])[:top_k])
+        return reranked, cacheable
+    
+    async def _first_stage(self, queries: List[str], top_k: int, generation: IndexGeneration, scope=None):
+        """Rank chunks for each query with embeddings when available, otherwise BM25
+        
+        scope is a (doc ids, chunk ids) pair from IndexGeneration.scope, or
+        None to search every document.
+        """
+        doc_ids, chunk_ids = scope if scope is not None else (None, None)
+        embeddings = generation.embeddings
+        if embeddings is not None and not generation.embedding_pending and len(embeddings):
+            try:
+                query_vectors = await self.embedder(queries)
+                return embeddings.search_many(query_vectors, top_k=top_k, doc_ids=doc_ids), True
+            except Exception as e:
+                logger.warning(f"Embedding search failed, using keyword retrieval: {str(e)}")
+                return generation.index.search_many(queries, top_k=top_k, chunk_ids=chunk_ids), False
+        
+        # BM25 ranking over the inverted index built at load time
+        return generation.index.search_many(queries, top_k=top_k, chunk_ids=chunk_ids), True
+    
+    async def _ranked_many(self, queries: List[str], top_k: int, generation: IndexGeneration, scope_key=((), ())):
+        """Ranked chunk references per query, served from the query cache when possible"""
+        ranked = [self.query_cache.get(generation.number, query, top_k, scope_key) for query in queries]
+        missing = [i for i, cached in enumerate(ranked) if cached is None]
+        if missing:
+            scope = generation.scope(scope_key) if any(scope_key) else None
+            computed, cacheable = await self._search_many([queries[i] for i in missing], top_k,
+                                                          generation, scope)
+            for i, result in zip(missing, computed):
+                ranked[i] = result
+                if cacheable:
+                    self.query_cache.put(generation.number, queries[i], top_k, result, scope_key)
+        return ranked
+    
+    async def search_chunks(self,
+                            query: str,
+                            top_k: int = 5,
+                            generation: Optional[IndexGeneration] = None,
+                            filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Return ranked hits as dicts with score, filename and chunk"""
+        return (await self.search_many([query], top_k=top_k, generation=generation, filters=filters))[0]
+    
+    async def search_many(self,
+                          queries: List[str],
+                          top_k: int = 5,
+                          generation: Optional[IndexGeneration] = None,
+                          filters: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        """Rank chunks for several queries in a single batched pass
+        
+        filters restricts the search to documents matching front-matter
+        metadata, e.g. {'category': 'profile'} or {'tags': ['eeo']}.
+        """
+        if not queries:
+            return []
         
-        # Sort by score and get top chunks
-        chunk_scores.sort(reverse=True, key=lambda x: x[0])
-        top_chunks = chunk_scores[:top_k]
+        generation = generation or self.generation
+        results = []
+        for ranked in await self._ranked_many(queries, top_k, generation, normalize_filters(filters)):
+            hits = []
+            for score, filename, position in ranked:
+                doc = generation.doc_map.get(filename)
+                if doc is None:
+                    continue
+                hit = {'score': score, 'filename': filename, 'chunk': doc.chunk(position)}
+                # Provenance of near-duplicates collapsed into this hit
+                duplicates = [{'filename': other, 'heading_path': generation.doc_map[other].heading_path(pos)}
+                              for other, pos in generation.duplicates.cluster((filename, position))
+                              if (other, pos) != (filename, position) and other in generation.doc_map]
+                if duplicates:
+                    hit['duplicates'] = duplicates
+                hits.append(hit)
+            results.append(hits)
+        return results
+    
+    def lookup_fact(self, label: str, generation: Optional[IndexGeneration] = None) -> Optional[Dict[str, Any]]:
+        """Answer a form label straight from the extracted fact table, if possible"""
+        return (generation or self.generation).facts.lookup(label)
+    
+    async def get_relevant_context(self,
+                                   query: str,
+                                   top_k: int = 5,
+                                   generation: Optional[IndexGeneration] = None,
+                                   filters: Optional[Dict[str, Any]] = None) -> str:
+        """Retrieve relevant document chunks for a query, optionally within a scope"""
+        generation = generation or self.generation
+        if not generation.documents:
+            return ""
+        
+        top_chunks = [(hit['score'], hit['chunk'], hit['filename'])
+                      for hit in await self.search_chunks(query, top_k, generation=generation,
+                                                          filters=filters)]
         
         if not top_chunks:
             # Return some context from all documents if no matches
+            documents = generation.documents
+            scope_key = normalize_filters(filters)
+            if any(scope_key):
+                doc_ids = generation.scope(scope_key)[0]
+                documents = [doc for doc in documents if doc.filename in doc_ids]
             context_parts = []
-            for doc in self.documents[:2]:  # First 2 docs
-                if doc['chunks']:
-                    context_parts.append(f"From {doc['filename']}:\n{doc['chunks'][0]}")
+            for doc in documents[:2]:  # First 2 docs
+                if doc.chunk_count:
+                    context_parts.append(format_chunk(doc.filename, doc.chunk(0)))
             return "\n\n".join(context_parts)
         
         # Format context
         context_parts = []
         for score, chunk, filename in top_chunks:
-            context_parts.append(f"From {filename}:\n{chunk}")
+            context_parts.append(format_chunk(filename, chunk))
         
         return "\n\n".join(context_parts)
     
-    def get_all_context(self) -> str:
+    def get_all_context(self, generation: Optional[IndexGeneration] = None) -> str:
         """Get all document content as context"""
-        if not self.documents:
+        generation = generation or self.generation
+        if not generation.documents:
             return ""
         
         context_parts = []
-        for doc in self.documents:
-            context_parts.append(f"=== {doc['filename']} ===\n{doc['content']}")
+        for doc in generation.documents:
+            context_parts.append(f"=== {doc.filename} ===\n{doc.content}")
         
         return "\n\n".join(context_parts)
     
     async def start_file_watcher(self):
         """Start watching the docs directory for changes"""
-        event_handler = MarkdownFileHandler(self)
+        event_handler = MarkdownFileHandler(self, asyncio.get_running_loop())
         self.observer = Observer()
-        self.observer.schedule(event_handler, str(self.docs_path), recursive=False)
+        self.observer.schedule(event_handler, str(self.docs_path), recursive=True)
         self.observer.start()
         logger.info(f"Started file watcher on {self.docs_path}")
         
     async def stop_file_watcher(self):
-        """Stop the file watcher"""
+        """Stop the file watcher and wait for a reload that is already running
+        
+        Paths still in the debounce window are dropped; the next start finds
+        them by their file stats. Awaiting the running reload lets the caller
+        flush a snapshot that includes it.
+        """
         if self.observer:
             self.observer.stop()
             self.observer.join()
-            logger.info("Stopped file watcher")
\ No newline at end of file
+            logger.info("Stopped file watcher")
+        if self._reload_handle is not None:
+            self._reload_handle.cancel()
+            self._reload_handle = None
+        self._pending_paths.clear()
+        task = self._reload_task
+        if task is not None and not task.done():
+            logger.info("Waiting for the running reload to finish")
+            try:
+                await task
+            except Exception as e:
+                logger.warning(f"Reload failed during shutdown: {str(e)}")
\ No newline at end of file
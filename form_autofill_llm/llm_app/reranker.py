@@ -0,0 +1,135 @@
+# reranker.py - Second-stage rescoring of retrieval candidates
+import asyncio
+import json
+import logging
+import re
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    from sentence_transformers import CrossEncoder
+except ImportError:  # Optional: only needed for the local cross-encoder
+    CrossEncoder = None
+
+JSON_ARRAY_PATTERN = re.compile(r"\[[^\[\]]*\]", re.DOTALL)
+
+
+class CrossEncoderReranker:
+    """Scores (query, passage) pairs with a small local cross-encoder
+
+    The model is loaded lazily on first use and runs on a worker thread,
+    with all pairs of a request scored in fixed-size batches.
+    """
+
+    # Cheap enough to rescore every first-stage candidate
+    max_candidates: Optional[int] = None
+
+    def __init__(self,
+                 model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2",
+                 batch_size: int = 32,
+                 device: str = "cpu"):
+        if CrossEncoder is None:
+            raise ImportError("sentence-transformers is required for CrossEncoderReranker")
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.device = device
+        self._model = None
+
+    def _predict(self, pairs: List[Tuple[str, str]]) -> List[float]:
+        if self._model is None:
+            logger.info(f"Loading cross-encoder {self.model_name}")
+            self._model = CrossEncoder(self.model_name, device=self.device)
+        scores = self._model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+        return [float(score) for score in scores]
+
+    async def score_many(self, requests: List[Tuple[str, List[str]]]) -> List[Optional[List[float]]]:
+        """Score each query's candidate passages; one list of scores per query"""
+        pairs = [(query, passage) for query, passages in requests for passage in passages]
+        if not pairs:
+            return [[] for _ in requests]
+
+        loop = asyncio.get_running_loop()
+        flat = await loop.run_in_executor(None, self._predict, pairs)
+
+        scores, offset = [], 0
+        for _, passages in requests:
+            scores.append(flat[offset:offset + len(passages)])
+            offset += len(passages)
+        return scores
+
+
+class OllamaReranker:
+    """Asks the Ollama model to grade candidate passages, a batch per prompt
+
+    Slower than a cross-encoder but needs nothing beyond the model that is
+    already running. Passages are truncated to keep each prompt short, only
+    the best max_candidates first-stage hits per query are graded, and the
+    prompts of all queries run concurrently, at most max_concurrency at once.
+    """
+
+    def __init__(self, llm_service, batch_size: int = 10, max_chars: int = 600,
+                 max_candidates: int = 10, max_concurrency: int = 4):
+        self.llm_service = llm_service
+        self.batch_size = batch_size
+        self.max_chars = max_chars
+        self.max_candidates = max_candidates
+        self._slots = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def _score_batch(self, query: str, passages: List[str]) -> List[float]:
+        numbered = "\n\n".join(
+            f"[{i}] {' '.join(passage.split())[:self.max_chars]}" for i, passage in enumerate(passages)
+        )
+        prompt = f"""Rate how useful each passage is for answering the form field below.
+
+FORM FIELD: {query}
+
+PASSAGES:
+{numbered}
+
+Return ONLY a JSON array of {len(passages)} integers from 0 (irrelevant) to 10 (answers it), one per passage in order."""
+
+        async with self._slots:
+            response = await self.llm_service.generate_completion(
+                prompt=prompt,
+                system_prompt="You grade search results. Respond with a JSON array only."
+            )
+        match = JSON_ARRAY_PATTERN.search(response or "")
+        if not match:
+            raise ValueError("No JSON array in reranker response")
+        scores = json.loads(match.group(0))
+        if len(scores) != len(passages):
+            raise ValueError(f"Expected {len(passages)} scores, got {len(scores)}")
+        return [float(score) for score in scores]
+
+    async def score_many(self, requests: List[Tuple[str, List[str]]]) -> List[Optional[List[float]]]:
+        """Score each query's candidate passages; one list of scores per query
+
+        A query whose reply cannot be parsed gets None instead of scores,
+        so only that query falls back to its first-stage order.
+        """
+        async def score_query(query: str, passages: List[str]) -> Optional[List[float]]:
+            batches = [passages[i:i + self.batch_size] for i in range(0, len(passages), self.batch_size)]
+            try:
+                results = await asyncio.gather(*(self._score_batch(query, batch) for batch in batches))
+            except Exception as e:
+                logger.warning(f"Reranking {query!r} failed, keeping first-stage order: {str(e)}")
+                return None
+            return [score for scores in results for score in scores]
+
+        return list(await asyncio.gather(*(score_query(query, passages) for query, passages in requests)))
+
+
+def create_reranker(kind: Optional[str], llm_service=None):
+    """Build a reranker by name ("cross-encoder", "ollama", or None / "none" for no reranking)"""
+    if not kind or kind == "none":
+        return None
+    if kind == "cross-encoder":
+        if CrossEncoder is None:
+            logger.warning("sentence-transformers not installed - reranking disabled")
+            return None
+        return CrossEncoderReranker()
+    if kind == "ollama":
+        return OllamaReranker(llm_service)
+    logger.warning(f"Unknown reranker {kind!r} - reranking disabled")
+    return None
@@ -0,0 +1,5 @@
+# conftest.py - Makes the app modules importable from the tests directory
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
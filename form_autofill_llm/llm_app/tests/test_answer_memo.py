@@ -0,0 +1,68 @@
+# test_answer_memo.py - Confidence and staleness of memoized LLM answers
+from answer_memo import FieldAnswerMemo, is_grounded, memo_key
+
+
+class _Generation:
+    def __init__(self, corpus_hash: str):
+        self._corpus_hash = corpus_hash
+
+    def corpus_hash(self) -> str:
+        return self._corpus_hash
+
+
+def test_memo_key_keeps_negations_and_drops_markers():
+    assert memo_key("Do you require sponsorship? *") == memo_key("do you require  sponsorship:")
+    assert memo_key("Do you require sponsorship?") != memo_key("Do you not require sponsorship?")
+
+
+def test_grounding_ignores_case_and_punctuation():
+    context = "- **Phone**: (555) 010-0200\n- **City**: San Francisco"
+    assert is_grounded("555 010 0200", context)
+    assert is_grounded("san francisco", context)
+    assert not is_grounded("Yes", context)
+    assert not is_grounded("Francisco San", context)
+    assert not is_grounded("", context)
+
+
+def test_grounded_answer_is_served_at_once():
+    memo = FieldAnswerMemo()
+    memo.remember({"City": "San Francisco"}, "c1", "llama3", grounded=["City"])
+    assert memo.lookup(["City:"], "c1", "llama3") == {"City:": "San Francisco"}
+    assert memo.entries[memo_key("City")]['source'] == "llm"
+
+
+def test_inferred_answer_needs_an_independent_repeat():
+    memo = FieldAnswerMemo()
+    memo.remember({"Willing to relocate?": "Yes"}, "c1", "llama3")
+    assert memo.lookup(["Willing to relocate?"], "c1", "llama3") == {}
+    assert memo.stats()['unconfirmed_skips'] == 1
+
+    memo.remember({"Willing to relocate?": "Yes"}, "c1", "llama3")
+    assert memo.lookup(["Willing to relocate?"], "c1", "llama3") == {"Willing to relocate?": "Yes"}
+
+
+def test_contradicting_answer_starts_over():
+    memo = FieldAnswerMemo()
+    memo.remember({"Willing to relocate?": "Yes"}, "c1", "llama3")
+    memo.remember({"Willing to relocate?": "No"}, "c1", "llama3")
+    assert memo.lookup(["Willing to relocate?"], "c1", "llama3") == {}
+    memo.remember({"Willing to relocate?": "No"}, "c1", "llama3")
+    assert memo.lookup(["Willing to relocate?"], "c1", "llama3") == {"Willing to relocate?": "No"}
+
+
+def test_answers_are_stale_after_a_corpus_or_model_change():
+    memo = FieldAnswerMemo()
+    memo.remember({"City": "Oakland", "Email": "me@example.com"}, "c1", "llama3", grounded=["City", "Email"])
+    assert memo.lookup(["City"], "c2", "llama3") == {}
+    assert memo.lookup(["City"], "c1", "mistral") == {}
+
+    memo.on_publish(_Generation("c2"))
+    assert len(memo) == 0
+    assert memo.lookup(["City"], "c1", "llama3") == {}
+
+
+def test_empty_and_long_answers_are_not_memoized():
+    memo = FieldAnswerMemo(max_value_chars=20)
+    memo.remember({"Middle name": "", "Cover letter": "I build things " * 10}, "c1", "llama3",
+                  grounded=["Middle name", "Cover letter"])
+    assert len(memo) == 0
@@ -0,0 +1,37 @@
+# test_benchmark.py - Synthetic corpora and a small end-to-end benchmark run
+import asyncio
+
+from benchmark import generate_corpus, parse_args, percentile, run
+from markdown_chunker import chunk_markdown
+
+
+def test_corpus_has_one_chunk_per_section_and_planted_facts(tmp_path):
+    corpus = generate_corpus(tmp_path, 101, facts=7, seed=4)
+    assert len(corpus['planted']) == 7
+    chunks = sum(len(chunk_markdown(path.read_text(encoding="utf-8"))) for path in corpus['files'])
+    assert chunks == 100
+    text = "".join(path.read_text(encoding="utf-8") for path in corpus['files'])
+    assert all(f"**{fact['key']}**: {fact['value']}" in text for fact in corpus['planted'])
+    # Same seed, same corpus
+    again = generate_corpus(tmp_path / "again", 101, facts=7, seed=4)
+    assert again['planted'] == corpus['planted']
+
+
+def test_percentile_is_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50 and percentile(values, 99) == 99
+    assert percentile([], 50) == 0.0
+
+
+def test_small_run_reports_every_phase(tmp_path):
+    args = parse_args(["--sizes", "200", "--facts", "10", "--edit-files", "2", "--chunk-sample", "20",
+                       "--workdir", str(tmp_path)])
+    report = asyncio.run(run(args))
+    result = report['results'][0]
+    assert result['chunks'] == 200
+    assert result['recall']['fact_table_recall'] == 1.0
+    assert result['recall']['retrieval_recall'] >= 0.9
+    for key in ('index_seconds', 'noop_reload_seconds', 'incremental_reload', 'query_latency',
+                'warm_restart_seconds'):
+        assert key in result
+    assert not tmp_path.exists() or not any(tmp_path.iterdir())
@@ -0,0 +1,94 @@
+# test_bm25_index.py - BM25 scores, updates and scoped search
+import math
+import random
+from collections import Counter
+
+import pytest
+
+from bm25_index import BM25Index
+from text_utils import tokenize
+
+WORDS = "email phone address python resume salary relocate visa degree manager remote city".split()
+
+
+def _corpus(seed: int = 3):
+    rng = random.Random(seed)
+    return {f"doc{d}.md": [" ".join(rng.choices(WORDS, k=rng.randint(3, 12))) for _ in range(rng.randint(1, 6))]
+            for d in range(30)}
+
+
+def _brute_force(docs, query, k1=1.5, b=0.75):
+    chunks = [(doc_id, position, Counter(tokenize(text)))
+              for doc_id, texts in docs.items() for position, text in enumerate(texts)]
+    avg_length = sum(sum(counts.values()) for _, _, counts in chunks) / len(chunks)
+    scores = {}
+    for term in set(tokenize(query)):
+        df = sum(1 for _, _, counts in chunks if term in counts)
+        if not df:
+            continue
+        idf = math.log(1 + (len(chunks) - df + 0.5) / (df + 0.5))
+        for doc_id, position, counts in chunks:
+            tf = counts.get(term, 0)
+            if tf:
+                norm = k1 * (1 - b + b * sum(counts.values()) / avg_length)
+                scores[(doc_id, position)] = scores.get((doc_id, position), 0.0) + idf * tf * (k1 + 1) / (tf + norm)
+    return scores
+
+
+def _index(docs) -> BM25Index:
+    index = BM25Index()
+    for doc_id, texts in docs.items():
+        index.add_document(doc_id, texts)
+    return index
+
+
+@pytest.mark.parametrize("query", ["python resume", "visa relocate city", "the email"])
+def test_scores_match_the_bm25_formula(query):
+    docs = _corpus()
+    expected = _brute_force(docs, query)
+    results = _index(docs).search(query, top_k=5)
+    assert [score for score, _, _ in results] == pytest.approx(sorted(expected.values(), reverse=True)[:5])
+    for score, doc_id, position in results:
+        assert score == pytest.approx(expected[(doc_id, position)])
+
+
+def test_batched_queries_match_single_queries():
+    index = _index(_corpus())
+    queries = ["python resume", "salary", "remote manager degree", "nothing matches zzz"]
+    assert index.search_many(queries, top_k=4) == [index.search(query, top_k=4) for query in queries]
+    assert index.search("zzz") == []
+
+
+def test_replacing_and_removing_a_document_keeps_statistics_exact():
+    docs = _corpus()
+    index = _index(docs)
+    docs["doc0.md"] = ["python python python visa"]
+    index.add_document("doc0.md", docs["doc0.md"])
+    del docs["doc5.md"]
+    index.remove_document("doc5.md")
+
+    fresh = _index(docs)
+    assert len(index) == len(fresh) and index.total_length == fresh.total_length
+    assert index.search("python visa", top_k=10) == pytest.approx(fresh.search("python visa", top_k=10))
+    assert all(doc_id != "doc5.md" for _, doc_id, _ in index.search("email phone", top_k=100))
+
+
+def test_scope_limits_candidates_but_not_corpus_statistics():
+    index = _index(_corpus())
+    scope = set(index.doc_chunks["doc1.md"]) | set(index.doc_chunks["doc2.md"])
+    unscoped = {(doc_id, position): score for score, doc_id, position in index.search("email python", top_k=1000)}
+    scoped = index.search("email python", top_k=1000, chunk_ids=scope)
+    assert scoped and all(doc_id in ("doc1.md", "doc2.md") for _, doc_id, _ in scoped)
+    for score, doc_id, position in scoped:
+        assert score == pytest.approx(unscoped[(doc_id, position)])
+
+
+def test_copy_is_isolated_from_later_updates():
+    index = _index(_corpus())
+    before = index.search("python salary", top_k=10)
+    clone = index.copy()
+    clone.add_document("new.md", ["python salary python salary"])
+    clone.remove_document("doc3.md")
+    assert index.search("python salary", top_k=10) == before
+    assert "doc3.md" in index.doc_chunks and "new.md" not in index.doc_chunks
+    assert clone.search("python salary", top_k=1)[0][1] == "new.md"
@@ -0,0 +1,48 @@
+# test_context_packer.py - Token budget, dedup and per-field merging of context
+from context_packer import merge_field_hits, pack_context
+from text_utils import estimate_tokens
+
+
+def _hit(filename: str, text: str, start: int, score: float = 1.0, heading_path: str = "") -> dict:
+    return {'filename': filename, 'score': score,
+            'chunk': {'text': text, 'heading_path': heading_path, 'start': start, 'end': start + len(text)}}
+
+
+def test_context_never_exceeds_the_budget():
+    hits = [_hit(f"doc{i}.md", f"section {i} " + "words " * (i * 7), 0, score=10 - i) for i in range(10)]
+    for budget in (10, 50, 200, 1000):
+        context, report = pack_context(hits, budget)
+        assert report['tokens_used'] <= budget
+        assert estimate_tokens(context) <= budget
+        assert len(report['included']) + len(report['dropped']) == len(hits)
+
+
+def test_smaller_lower_ranked_chunks_fill_the_remaining_budget():
+    hits = [_hit("a.md", "big " * 200, 0, score=3), _hit("b.md", "Email: me@example.com", 0, score=2)]
+    context, report = pack_context(hits, 40)
+    assert "me@example.com" in context
+    assert [entry['reason'] for entry in report['dropped']] == ['budget']
+
+
+def test_duplicate_text_and_overlapping_spans_are_skipped():
+    hits = [
+        _hit("a.md", "Phone: 555-0100", 0, heading_path="Contact"),
+        _hit("b.md", "phone:   555-0100", 40),
+        _hit("a.md", "555-0100\nCity: Oakland", 7),
+        _hit("a.md", "City: Oakland", 100),
+    ]
+    context, report = pack_context(hits, 1000)
+    assert [entry['reason'] for entry in report['dropped']] == ['duplicate', 'overlap']
+    assert context.startswith("From a.md (Contact):\nPhone: 555-0100")
+    assert context.count("Oakland") == 1
+
+
+def test_merge_gives_every_field_its_best_hits_first():
+    crowded = [_hit("a.md", f"a{i}", i * 10, score=100 - i) for i in range(5)]
+    quiet = [_hit("b.md", "b0", 0, score=1.0), _hit("b.md", "b1", 10, score=0.5)]
+    shared = [crowded[0], _hit("c.md", "c0", 0, score=0.1)]
+    merged = merge_field_hits([crowded, quiet, shared], min_per_field=2)
+    texts = [hit['chunk']['text'] for hit in merged]
+    assert texts[:5] == ["a0", "b0", "a1", "b1", "c0"]
+    # The rest follow by score, and a chunk found by two fields appears once
+    assert texts[5:] == ["a2", "a3", "a4"]
@@ -0,0 +1,49 @@
+# test_cow_dict.py - Copy-on-write dict semantics
+import pickle
+
+from cow_dict import BUCKET_SIZE, CowDict
+
+
+def test_copy_is_isolated_both_ways():
+    parent = CowDict((i, str(i)) for i in range(1000))
+    child = parent.copy()
+    child[5] = "changed"
+    del child[6]
+    child[2000] = "new"
+    parent[7] = "parent only"
+
+    assert parent[5] == "5" and 6 in parent and 2000 not in parent
+    assert child[5] == "changed" and 6 not in child and child[2000] == "new"
+    assert child[7] == "7"
+    assert len(parent) == 1000 and len(child) == 1000
+
+
+def test_write_copies_only_its_bucket():
+    parent = CowDict((f"doc{i}", i) for i in range(50 * BUCKET_SIZE))
+    child = parent.copy()
+    child["doc3"] = -1
+
+    shared = sum(child._buckets[index] is bucket for index, bucket in parent._buckets.items())
+    assert shared == len(parent._buckets) - 1
+
+
+def test_block_mode_groups_consecutive_keys():
+    table = CowDict(((i, i) for i in range(1000)), block=128)
+    child = table.copy()
+    for key in range(1000, 1020):
+        child[key] = key
+    # Only the last block was touched
+    changed = [index for index, bucket in child._buckets.items() if table._buckets.get(index) is not bucket]
+    assert changed == [7]
+    assert sorted(child) == list(range(1020))
+
+
+def test_pop_get_and_pickle_round_trip():
+    table = CowDict({'a': 1, 'b': 2}.items())
+    assert table.pop('a') == 1 and table.pop('a', None) is None
+    assert table.get('b') == 2 and table.get('zzz', 3) == 3
+
+    restored = pickle.loads(pickle.dumps(table))
+    assert dict(restored.items()) == {'b': 2}
+    restored['c'] = 3
+    assert 'c' not in table
@@ -0,0 +1,63 @@
+# test_doc_loader.py - Worker-side loading and recursive, parallel ingestion
+import asyncio
+import os
+
+from doc_loader import load_document, load_document_batch
+from extractors import default_extractors
+from rag_manager import RAGManager
+
+
+def test_load_skips_unchanged_and_touched_files(tmp_path):
+    path = tmp_path / "me.md"
+    path.write_text("---\ncategory: profile\n---\n# Me\n- **Email**: me@example.com\n", encoding="utf-8")
+    extractors = default_extractors()
+
+    loaded = load_document((str(path), "me.md", None, None, None), 256, extractors)
+    doc = loaded['doc']
+    assert loaded['status'] == 'loaded' and doc.category == "profile"
+    # Chunk spans point into the full text, past the front matter
+    assert doc.chunk_text(0) == "# Me\n- **Email**: me@example.com"
+    assert doc.facts[0]['value'] == "me@example.com"
+    assert len(loaded['term_counts']) == len(loaded['signatures']) == doc.chunk_count
+
+    known = (str(path), "me.md", doc.last_modified, doc.file_size, loaded['hash'])
+    assert load_document(known, 256, extractors)['status'] == 'unchanged'
+    os.utime(path, (doc.last_modified + 10, doc.last_modified + 10))
+    assert load_document(known, 256, extractors)['status'] == 'touched'
+
+
+def test_batch_reports_errors_per_file(tmp_path):
+    good = tmp_path / "good.md"
+    good.write_text("# Good\n", encoding="utf-8")
+    items = [(str(tmp_path / "gone.md"), "gone.md", None, None, None), (str(good), "good.md", None, None, None)]
+    results = load_document_batch(items, 256, default_extractors())
+    assert [result['status'] for result in results] == ['error', 'loaded']
+    assert results[0]['key'] == "gone.md"
+
+
+def _tree(root):
+    for i in range(12):
+        folder = root / f"team{i % 3}" / f"year{i % 2}"
+        folder.mkdir(parents=True, exist_ok=True)
+        (folder / f"note{i}.md").write_text(f"# Note {i}\nproject number {i}\n", encoding="utf-8")
+    (root / ".git").mkdir()
+    (root / ".git" / "ignored.md").write_text("# Hidden\n", encoding="utf-8")
+    (root / "profile.md").write_text("# Profile\n- **Phone**: 555-0100\n", encoding="utf-8")
+
+
+def test_nested_tree_loads_the_same_on_threads_and_processes(tmp_path):
+    _tree(tmp_path)
+
+    async def load(**kwargs):
+        manager = RAGManager(docs_path=str(tmp_path), index_path=None, **kwargs)
+        await manager.initialize()
+        return manager.pin(), manager.ingest_progress
+
+    threaded, _ = asyncio.run(load())
+    pooled, progress = asyncio.run(load(process_pool_threshold=1, ingest_workers=2, ingest_batch_size=4))
+    assert sorted(threaded.doc_map) == sorted(pooled.doc_map)
+    assert "team1/year0/note4.md" in threaded.doc_map
+    assert not any(name.startswith(".git") for name in threaded.doc_map)
+    assert len(threaded.doc_map) == 13
+    assert threaded.corpus_hash() == pooled.corpus_hash()
+    assert progress['done'] == progress['total'] == 13 and progress['errors'] == 0
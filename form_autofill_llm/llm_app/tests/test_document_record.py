@@ -0,0 +1,28 @@
+# test_document_record.py - Offset-based chunk storage
+import pickle
+
+from document_record import DocumentRecord
+from markdown_chunker import chunk_markdown
+
+CONTENT = "# Me\n## Contact\n- **Email**: me@example.com\n\nSome words\n## Skills\nPython\n"
+
+
+def test_chunks_are_sliced_from_one_text():
+    chunks = chunk_markdown(CONTENT, max_tokens=8)
+    doc = DocumentRecord("me.md", CONTENT, chunks, category="profile", tags=["eeo"])
+    assert doc.chunk_count == len(chunks) > 2
+    assert [doc.chunk(i) for i in range(doc.chunk_count)] == chunks
+    # Repeated heading paths are stored once
+    assert len(doc.heading_paths) == len({chunk['heading_path'] for chunk in chunks})
+    assert doc.search_texts()[0] == f"{chunks[0]['heading_path']}\n{chunks[0]['text']}"
+    assert doc.tags == ("eeo",)
+
+
+def test_with_stat_shares_storage_and_pickle_round_trips():
+    doc = DocumentRecord("me.md", CONTENT, chunk_markdown(CONTENT), last_modified=1.0, file_size=10)
+    touched = doc.with_stat(2.0, 10)
+    assert touched.content is doc.content and touched.chunk_starts is doc.chunk_starts
+    assert (doc.last_modified, touched.last_modified) == (1.0, 2.0)
+
+    restored = pickle.loads(pickle.dumps(doc))
+    assert restored.chunk(0) == doc.chunk(0) and restored.category is None
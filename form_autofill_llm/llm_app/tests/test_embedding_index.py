@@ -0,0 +1,169 @@
+# test_embedding_index.py - Exact, quantized and IVF embedding search with on-disk vectors
+import numpy as np
+import pytest
+
+from ann_index import IVFIndex
+from embedding_index import EmbeddingIndex, chunk_hash, recall_at_k
+
+DIMENSION = 32
+
+
+def _vectors(count: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(20, DIMENSION))
+    vectors = centers[rng.integers(0, 20, count)] + 0.5 * rng.normal(size=(count, DIMENSION))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def _build(index: EmbeddingIndex, docs: int = 50, per_doc: int = 8, seed: int = 0):
+    vectors = _vectors(docs * per_doc, seed)
+    truth = {}
+    for doc in range(docs):
+        texts = [f"doc{doc} chunk{position}" for position in range(per_doc)]
+        index.add_vectors({chunk_hash(text): vectors[doc * per_doc + position]
+                           for position, text in enumerate(texts)})
+        assert index.set_document(f"doc{doc}", texts)
+        for position in range(per_doc):
+            truth[(f"doc{doc}", position)] = vectors[doc * per_doc + position]
+    index.prepare()
+    return truth
+
+
+def _brute_force(truth, query: np.ndarray, top_k: int):
+    scored = sorted(((float(vector @ query), ref) for ref, vector in truth.items()), reverse=True)
+    return [ref for _, ref in scored[:top_k]]
+
+
+@pytest.mark.parametrize("quantization", [None, "int8", "binary"])
+def test_search_matches_brute_force(quantization):
+    index = EmbeddingIndex(ann_threshold=None, quantization=quantization, rescore_factor=50)
+    truth = _build(index)
+    queries = _vectors(5, seed=9)
+    for query, hits in zip(queries, index.search_many(queries.tolist(), top_k=5)):
+        assert [(doc_id, position) for _, doc_id, position in hits] == _brute_force(truth, query, 5)
+        # Returned scores are full-precision cosine similarities
+        for score, doc_id, position in hits:
+            assert score == pytest.approx(float(truth[(doc_id, position)] @ query), abs=1e-5)
+
+
+def test_only_codes_stay_in_memory():
+    full = EmbeddingIndex(ann_threshold=None)
+    binary = EmbeddingIndex(ann_threshold=None, quantization="binary")
+    _build(full)
+    _build(binary)
+    chunks = len(full)
+    assert full.store_nbytes() == chunks * DIMENSION * 4
+    assert binary.store_nbytes() == chunks * DIMENSION * 4
+    # Codes (allocated with room to append) are all that binary keeps in RAM
+    assert binary.nbytes() <= full.nbytes() / 8
+    assert not hasattr(binary, 'vectors')
+
+
+def test_copies_are_isolated_and_updates_append():
+    parent = EmbeddingIndex(ann_threshold=None, quantization="int8")
+    truth = _build(parent)
+    query = truth[("doc3", 0)]
+
+    child = parent.copy()
+    child.remove_document("doc3")
+    child.add_vectors({chunk_hash("fresh"): query})
+    child.set_document("fresh", ["fresh"])
+    child.prepare()
+
+    assert child.search_many([query.tolist()], top_k=1)[0][0][1:] == ("fresh", 0)
+    assert all(doc_id != "doc3" for _, doc_id, _ in child.search_many([query.tolist()], top_k=400)[0])
+    # The published parent still sees its own rows only
+    assert parent.search_many([query.tolist()], top_k=1)[0][0][1:] == ("doc3", 0)
+    assert len(parent) == 400 and len(child) == 393
+
+
+def test_matrix_compacts_after_many_edits():
+    index = EmbeddingIndex(ann_threshold=None)
+    truth = _build(index, docs=20, per_doc=4)
+    texts = [f"doc0 chunk{position}" for position in range(4)]
+    for _ in range(2000):
+        # Re-setting a document marks its rows dead and appends new ones
+        index = index.copy()
+        assert index.set_document("doc0", texts)
+        index.prepare()
+    assert index._size <= 2 * len(index) + 4096
+    query = truth[("doc0", 2)]
+    assert index.search_many([query.tolist()], top_k=1)[0][0][1:] == ("doc0", 2)
+
+
+def test_unchanged_chunks_are_not_embedded_again():
+    index = EmbeddingIndex(ann_threshold=None)
+    _build(index, docs=2, per_doc=3)
+    index.remove_document("doc0")
+    texts = ["doc0 chunk0", "doc0 chunk1", "new text"]
+    assert set(index.missing(texts).values()) == {"new text"}
+
+
+def test_export_restore_round_trip(tmp_path):
+    index = EmbeddingIndex(ann_threshold=None, quantization="int8", store_path=str(tmp_path))
+    truth = _build(index)
+    state = index.export()
+
+    restored = EmbeddingIndex(ann_threshold=None, quantization="int8", store_path=str(tmp_path))
+    assert restored.restore(state)
+    queries = _vectors(3, seed=4).tolist()
+    assert restored.search_many(queries, top_k=5) == index.search_many(queries, top_k=5)
+    assert len(restored) == len(truth)
+
+    missing = EmbeddingIndex(ann_threshold=None, store_path=str(tmp_path / "elsewhere"))
+    assert not missing.restore(state)
+
+
+def test_ivf_mode_with_full_probe_is_exact():
+    index = EmbeddingIndex(ann_threshold=100, nprobe=4, recall_tolerance=1.0)
+    truth = _build(index, docs=60, per_doc=10)
+    assert index.ann is not None
+    queries = _vectors(5, seed=3)
+    lists = len(index.ann.centroids)
+    for query, hits in zip(queries, index.search_many(queries.tolist(), top_k=5, nprobe=lists)):
+        assert [(doc_id, position) for _, doc_id, position in hits] == _brute_force(truth, query, 5)
+
+
+def test_default_nprobe_is_a_tenth_of_the_lists():
+    ann = IVFIndex()
+    ann.train(_vectors(2000, seed=1), 2000)
+    assert len(ann.centroids) == 44
+    assert ann.probe_count() == 5
+    assert IVFIndex(nprobe=100).probe_count() == 1
+
+
+def test_ann_is_tuned_to_the_recall_target():
+    index = EmbeddingIndex(ann_threshold=100, recall_tolerance=0.05)
+    _build(index, docs=100, per_doc=10)
+    assert index.ann is not None
+    assert index.ann.recall >= 0.95
+    queries = _vectors(20, seed=5)
+    found = index.search_many(queries.tolist(), top_k=10)
+    assert recall_at_k(found, index.search_exact(queries, 10)) >= 0.9
+
+
+def test_ann_missing_the_recall_target_stays_exact():
+    # No cluster structure: probing half the lists cannot reach 0.99
+    index = EmbeddingIndex(ann_threshold=100, recall_tolerance=0.01)
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(1000, DIMENSION)).astype(np.float32)
+    for doc in range(100):
+        texts = [f"doc{doc} chunk{position}" for position in range(10)]
+        index.add_vectors({chunk_hash(text): vectors[doc * 10 + position] for position, text in enumerate(texts)})
+        index.set_document(f"doc{doc}", texts)
+    index.prepare()
+    assert index.ann is None
+    queries = rng.normal(size=(5, DIMENSION)).astype(np.float32)
+    assert index.search_many(queries.tolist(), top_k=5) == index.search_exact(queries, 5)
+
+    # Not retrained on every small change
+    child = index.copy()
+    child.remove_document("doc0")
+    child.prepare()
+    assert child.ann is None and child._ann_rejected == 1000
+
+
+def test_recall_counts_ties_as_found():
+    truth = [[(0.9, "a", 0), (0.5, "b", 0)]]
+    assert recall_at_k([[(0.9, "a", 0), (0.5, "c", 3)]], truth) == 1.0
+    assert recall_at_k([[(0.9, "a", 0), (0.4, "c", 3)]], truth) == 0.5
@@ -0,0 +1,92 @@
+# test_extractors.py - Source formats to markdown, the extraction cache and missing libraries
+import asyncio
+import io
+import json
+import logging
+import os
+import time
+
+import pytest
+
+from extractors import (ExtractionCache, default_extractors, extract_docx, extract_json, extract_pdf,
+                        extract_text, missing_formats)
+from rag_manager import RAGManager
+
+
+def test_text_is_decoded_with_universal_newlines():
+    assert extract_text("\ufeffa\r\nb\rc".encode('utf-8'), "x.txt") == "a\nb\nc"
+
+
+def test_json_objects_become_headings_and_facts():
+    data = {"formName": "Application", "Personal": {"First Name": "Ada", "Skills": ["Rust", "Go"]},
+            "fields": [{"label": "Remote", "value": True}]}
+    text = extract_json(json.dumps(data).encode(), "profile.json")
+    assert text.startswith("# Application")
+    assert "## Personal" in text
+    assert "- **First Name**: Ada" in text
+    assert "- **Skills**: Rust, Go" in text
+    assert "- **Remote**: Yes" in text
+
+
+def test_json_without_a_title_is_named_after_the_file():
+    assert extract_json(b'{"Email": "a@b.c"}', "docs/contact.json").startswith("# contact\n")
+
+
+def test_cache_round_trip_and_prune(tmp_path):
+    cache = ExtractionCache(str(tmp_path))
+    first = ExtractionCache.key("hash1", extract_json)
+    assert first != ExtractionCache.key("hash1", extract_text)
+    cache.put(first, "# one\n")
+    assert cache.get(first) == "# one\n"
+    assert cache.get(ExtractionCache.key("other", extract_json)) is None
+
+    second = ExtractionCache.key("hash2", extract_json)
+    cache.put(second, "# two\n")
+    past = time.time() - 100
+    os.utime(cache._file(first), (past, past))
+    assert cache.prune(1) == 1
+    assert cache.get(first) is None and cache.get(second) == "# two\n"
+
+
+def test_missing_optional_formats_are_reported():
+    assert missing_formats({}) == {'.pdf': 'pypdf', '.docx': 'python-docx'}
+    assert missing_formats(default_extractors()).keys() <= {'.pdf', '.docx'}
+
+
+def test_skipped_files_are_listed_in_a_warning(tmp_path, caplog):
+    docs = tmp_path / "docs"
+    (docs / "cv").mkdir(parents=True)
+    (docs / "a.md").write_text("# A\n", encoding="utf-8")
+    (docs / "cv" / "resume.pdf").write_bytes(b"%PDF-")
+    manager = RAGManager(docs_path=str(docs), index_path=None)
+    manager.extractors.pop('.pdf', None)
+
+    with caplog.at_level(logging.WARNING, logger="rag_manager"):
+        asyncio.run(manager.initialize())
+    assert [doc.filename for doc in manager.documents] == ["a.md"]
+    assert any("pypdf is not installed" in record.message and "cv/resume.pdf" in record.message
+               for record in caplog.records)
+
+
+def test_pdf_pages_are_joined():
+    pypdf = pytest.importorskip("pypdf")
+    writer = pypdf.PdfWriter()
+    writer.add_blank_page(width=72, height=72)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    assert extract_pdf(buffer.getvalue(), "blank.pdf") == "\n"
+
+
+def test_docx_styles_map_to_markdown():
+    docx = pytest.importorskip("docx")
+    document = docx.Document()
+    document.add_heading("Experience", level=1)
+    document.add_paragraph("Built things", style="List Bullet")
+    table = document.add_table(rows=1, cols=2)
+    table.rows[0].cells[0].text, table.rows[0].cells[1].text = "Email", "a@b.c"
+    buffer = io.BytesIO()
+    document.save(buffer)
+    text = extract_docx(buffer.getvalue(), "cv.docx")
+    assert "# Experience" in text
+    assert "- Built things" in text
+    assert "- **Email**: a@b.c" in text
@@ -0,0 +1,53 @@
+# test_fact_table.py - Fact extraction, label lookup and per-document updates
+from fact_table import ALIAS_CONFIDENCE, FactTable, extract_facts
+
+PROFILE = """# User Information
+## Contact
+- **Email**: me@example.com
+- **Phone:** 555-0100
+- **LinkedIn**: [profile](https://www.linkedin.com/in/me)
+## Personal
+- **Full Name**: Ada Byron Lovelace
+Some prose that is not a fact.
+"""
+
+
+def test_facts_are_extracted_with_their_heading():
+    facts = {fact['key']: fact for fact in extract_facts(PROFILE)}
+    assert facts['Email']['value'] == "me@example.com"
+    assert facts['Phone']['value'] == "555-0100"
+    assert facts['LinkedIn']['value'] == "https://www.linkedin.com/in/me"
+    assert facts['Email']['heading_path'] == "User Information > Contact"
+    assert (facts['First Name']['value'], facts['Last Name']['value']) == ("Ada", "Lovelace")
+
+
+def test_labels_match_keys_and_aliases():
+    table = FactTable()
+    table.add_document("profile.md", extract_facts(PROFILE))
+    assert table.lookup("What is your email?")['value'] == "me@example.com"
+    assert table.lookup("EMAIL *")['confidence'] == 1.0
+    alias = table.lookup("Mobile number")
+    assert alias['value'] == "555-0100" and alias['confidence'] == ALIAS_CONFIDENCE
+    assert alias['filename'] == "profile.md"
+    assert table.lookup("Email me updates about jobs") is None
+    assert table.lookup("Favourite colour") is None
+
+
+def test_conflicting_values_are_unknown_until_resolved():
+    table = FactTable()
+    table.add_document("a.md", [{'key': 'Phone', 'value': '555-0100', 'heading_path': ''}])
+    table.add_document("b.md", [{'key': 'Phone', 'value': '555-0199', 'heading_path': ''}])
+    assert table.lookup("Phone") is None
+    table.remove_document("b.md")
+    assert table.lookup("Phone")['value'] == "555-0100"
+    assert len(table) == 1
+
+
+def test_copy_is_isolated_from_later_updates():
+    table = FactTable()
+    table.add_document("profile.md", extract_facts(PROFILE))
+    clone = table.copy()
+    clone.add_document("profile.md", [{'key': 'Email', 'value': 'new@example.com', 'heading_path': ''}])
+    assert table.lookup("Email")['value'] == "me@example.com"
+    assert clone.lookup("Email")['value'] == "new@example.com"
+    assert clone.lookup("Phone") is None and table.lookup("Phone") is not None
@@ -0,0 +1,85 @@
+# test_fill_cache.py - Memory and SQLite tiers of the form fill cache
+import asyncio
+import threading
+
+from fill_cache import FormFillCache, fill_key
+
+
+class _Generation:
+    def __init__(self, corpus_hash: str):
+        self._corpus_hash = corpus_hash
+
+    def corpus_hash(self) -> str:
+        return self._corpus_hash
+
+
+def _key(corpus_hash: str) -> str:
+    return fill_key(["Email", "Phone"], corpus_hash, "llama3", 0.1)
+
+
+def test_memory_hit_does_not_touch_the_database(tmp_path, monkeypatch):
+    cache = FormFillCache(str(tmp_path / "fills.sqlite3"))
+    cache.put(_key("a"), "a", {"Email": "me@example.com", "Phone": "555-0100"})
+
+    def no_disk(key):
+        raise AssertionError("memory hit went to SQLite")
+
+    monkeypatch.setattr(cache, "_read", no_disk)
+    cached = asyncio.run(cache.get(_key("a"), [" email ", "PHONE"]))
+    assert cached == {" email ": "me@example.com", "PHONE": "555-0100"}
+    assert cache.stats()['memory_hits'] == 1
+    cache.close()
+
+
+def test_disk_hit_after_restart_is_read_off_the_event_loop(tmp_path, monkeypatch):
+    path = str(tmp_path / "fills.sqlite3")
+    first = FormFillCache(path)
+    first.put(_key("a"), "a", {"Email": "me@example.com", "Phone": "555-0100"})
+    first.close()
+
+    second = FormFillCache(path)
+    read = second._read
+    threads = []
+
+    def tracked(key):
+        threads.append(threading.get_ident())
+        return read(key)
+
+    monkeypatch.setattr(second, "_read", tracked)
+    cached = asyncio.run(second.get(_key("a"), ["Email", "Phone"]))
+    assert cached == {"Email": "me@example.com", "Phone": "555-0100"}
+    assert threads and threads[0] != threading.get_ident()
+    # Now served from memory
+    assert asyncio.run(second.get(_key("a"), ["Email", "Phone"])) == cached
+    stats = second.stats()
+    assert stats['disk_hits'] == 1 and stats['memory_hits'] == 1
+    second.close()
+
+
+def test_publish_drops_other_corpora_from_memory_and_disk(tmp_path):
+    path = str(tmp_path / "fills.sqlite3")
+    cache = FormFillCache(path)
+    cache.put(_key("old"), "old", {"Email": "old@example.com", "Phone": "1"})
+    cache.put(_key("new"), "new", {"Email": "new@example.com", "Phone": "2"})
+
+    cache.on_publish(_Generation("new"))
+    assert asyncio.run(cache.get(_key("old"), ["Email", "Phone"])) is None
+    cache.flush()
+    assert cache.stats()['disk_entries'] == 1
+    assert cache.stats()['invalidated'] == 1
+    cache.close()
+
+    reopened = FormFillCache(path)
+    assert asyncio.run(reopened.get(_key("old"), ["Email", "Phone"])) is None
+    assert asyncio.run(reopened.get(_key("new"), ["Email", "Phone"]))["Email"] == "new@example.com"
+    reopened.close()
+
+
+def test_memory_only_cache_is_bounded(tmp_path):
+    cache = FormFillCache(None, max_memory_entries=2)
+    for corpus_hash in ("a", "b", "c"):
+        cache.put(_key(corpus_hash), corpus_hash, {"Email": corpus_hash, "Phone": corpus_hash})
+    assert asyncio.run(cache.get(_key("a"), ["Email", "Phone"])) is None
+    assert asyncio.run(cache.get(_key("c"), ["Email", "Phone"]))["Email"] == "c"
+    assert cache.stats()['memory_entries'] == 2
+    cache.close()
@@ -0,0 +1,185 @@
+# test_form_processor.py - Retrieval, fact fast path and sharding of form fills
+import asyncio
+
+from form_processor import FormProcessor
+from rag_manager import RAGManager
+
+
+class FakeLLM:
+    model = "fake"
+    temperature = 0.1
+
+    def __init__(self):
+        self.calls = []
+
+    async def fill_form_fields(self, fields, context, url=None, title=None):
+        self.calls.append((dict(fields), context))
+        return {name: f"answer to {name}" for name in fields}
+
+
+def _write(root, name: str, text: str):
+    (root / name).write_text(text, encoding="utf-8")
+
+
+def test_each_field_gets_its_own_evidence_in_one_batched_search(tmp_path):
+    _write(tmp_path, "contact.md", "# Contact\n- **Phone**: 555-0100\n")
+    _write(tmp_path, "skills.md", "# Skills\nPython, SQL and Kubernetes\n")
+    for i in range(20):
+        _write(tmp_path, f"salary{i}.md", f"# Salary {i}\nsalary expectations salary range salary {i}\n")
+
+    async def run():
+        manager = RAGManager(docs_path=str(tmp_path), index_path=None)
+        await manager.initialize()
+        searches = []
+        search_many = manager.search_many
+
+        async def counted(queries, **kwargs):
+            searches.append(list(queries))
+            return await search_many(queries, **kwargs)
+
+        manager.search_many = counted
+        processor = FormProcessor(FakeLLM(), manager, per_field_top_k=2)
+        reports = []
+        context = await processor._get_context_for_fields(
+            {"Email": "", "EMAIL *": "", "Phone": "", "Python experience": "", "Desired salary": ""},
+            reports=reports)
+        return context, searches, reports
+
+    context, searches, (report,) = asyncio.run(run())
+    assert searches == [["Email", "Phone", "Python experience", "Desired salary"]]
+    assert "555-0100" in context and "Kubernetes" in context and "salary expectations" in context
+    assert report['tokens_used'] <= report['token_budget']
+
+
+def test_known_profile_fields_skip_the_llm(tmp_path):
+    _write(tmp_path, "profile.md", "# Me\n- **Email**: me@example.com\n- **Phone**: (555) 010-0200\n")
+
+    async def run():
+        manager = RAGManager(docs_path=str(tmp_path), index_path=None)
+        await manager.initialize()
+        llm = FakeLLM()
+        processor = FormProcessor(llm, manager)
+        known = await processor.process_form({"Email address": "", "Mobile phone": ""})
+        mixed = await processor.process_form({"Email": "", "Why us?": ""})
+        return llm.calls, known, mixed
+
+    calls, known, mixed = asyncio.run(run())
+    assert known == {"Email address": "me@example.com", "Mobile phone": "5550100200"}
+    assert mixed == {"Email": "me@example.com", "Why us?": "answer to Why us?"}
+    # Only the unknown field went to the LLM
+    assert [list(fields) for fields, _ in calls] == [["Why us?"]]
+
+
+class SlowLLM(FakeLLM):
+    def __init__(self, fail_on=None):
+        super().__init__()
+        self.fail_on = fail_on
+        self.running = 0
+        self.max_running = 0
+
+    async def fill_form_fields(self, fields, context, url=None, title=None):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await asyncio.sleep(0.01)
+            if self.fail_on in fields:
+                raise ConnectionError("shard failed")
+            return await super().fill_form_fields(fields, context, url, title)
+        finally:
+            self.running -= 1
+
+
+def test_shards_are_balanced_and_keep_routed_fields_together(tmp_path):
+    _write(tmp_path, "me.md", "---\ncategory: profile\n---\n# Me\n- **City**: Oakland\n")
+    _write(tmp_path, "prefs.md", "---\ncategory: preferences\n---\n# Prefs\n- **Relocate**: yes\n")
+
+    async def run():
+        manager = RAGManager(docs_path=str(tmp_path), index_path=None)
+        await manager.initialize()
+        processor = FormProcessor(FakeLLM(), manager, shard_size=4)
+        fields = {}
+        for i in range(5):
+            fields[f"Phone {i}"] = ""
+            fields[f"Desired salary {i}"] = ""
+            fields[f"Question {i}"] = ""
+        return processor._shard_fields(fields, manager.pin()), fields
+
+    shards, fields = asyncio.run(run())
+    assert sorted(name for shard in shards for name in shard) == sorted(fields)
+    assert len(shards) == 4 and {len(shard) for shard in shards} == {4, 3}
+    # Fields of one route are contiguous, so they share as few shards as possible
+    order = [name.rsplit(" ", 1)[0] for shard in shards for name in shard]
+    assert order == ["Phone"] * 5 + ["Desired salary"] * 5 + ["Question"] * 5
+
+
+def test_shards_run_under_the_concurrency_cap_and_fail_alone(tmp_path):
+    _write(tmp_path, "me.md", "# Me\nAnswers to every question\n")
+
+    async def run():
+        manager = RAGManager(docs_path=str(tmp_path), index_path=None)
+        await manager.initialize()
+        llm = SlowLLM(fail_on="Question 0")
+        processor = FormProcessor(llm, manager, shard_size=2, max_parallel_shards=2)
+        fields = {f"Question {i}": "" for i in range(12)}
+        return await processor.process_form(fields), llm, processor.last_context_report
+
+    filled, llm, report = asyncio.run(run())
+    assert len(llm.calls) == 5 and llm.max_running == 2
+    # Every shard's packing report is kept, not just the last one to finish
+    assert report['contexts'] == 6 and report['token_budget'] == 6 * 3000
+    failed = [name for name, value in filled.items() if not value]
+    assert "Question 0" in failed and len(failed) == 2
+    assert all(value == f"answer to {name}" for name, value in filled.items() if name not in failed)
+
+
+class StaticDigest:
+    text = "PROFILE (JSON):\n{\"full_name\":\"Ada Lovelace\",\"nickname\":\"Countess\"}"
+
+    def digest_for(self, generation):
+        return {'text': self.text, 'tokens': 2000, 'facts': {'city': "London"}}
+
+
+def test_digest_leads_the_context_and_retrieval_gets_the_rest(tmp_path):
+    _write(tmp_path, "essay.md", "# Why\nI want to work on analytical engines\n")
+    for i in range(20):
+        _write(tmp_path, f"filler{i}.md", f"# Filler {i}\nwork work analytical {'engines ' * 40}\n")
+
+    async def run():
+        manager = RAGManager(docs_path=str(tmp_path), index_path=None)
+        await manager.initialize()
+        processor = FormProcessor(FakeLLM(), manager, context_token_budget=2400, digest=StaticDigest())
+        reports = []
+        context, _ = await processor._context_for({"Why analytical engines?": ""}, manager.pin(), reports)
+        return context, reports
+
+    context, (report,) = asyncio.run(run())
+    assert context.startswith(StaticDigest.text)
+    assert "DOCUMENT EXCERPTS:" in context and "I want to work on analytical engines" in context
+    assert report['token_budget'] == 400 and report['tokens_used'] <= 400
+
+
+def test_answers_copied_from_the_digest_are_not_grounded(tmp_path):
+    _write(tmp_path, "me.md", "# Me\nI live in London and write about engines\n")
+
+    class DigestLLM(FakeLLM):
+        async def fill_form_fields(self, fields, context, url=None, title=None):
+            return {"Nickname": "Countess", "City": "London", "Hobby": "engines"}
+
+    class Memo:
+        def lookup(self, fields, corpus_hash, model):
+            return {}
+
+        def remember(self, answers, corpus_hash, model, grounded=None, source="llm"):
+            self.grounded = sorted(grounded)
+
+    async def run():
+        manager = RAGManager(docs_path=str(tmp_path), index_path=None)
+        await manager.initialize()
+        memo = Memo()
+        processor = FormProcessor(DigestLLM(), manager, digest=StaticDigest(), answer_memo=memo)
+        await processor.process_form({"Nickname": "", "City": "", "Hobby": ""})
+        return memo.grounded
+
+    # The city is a fact-table value and the hobby is in a retrieved chunk;
+    # the nickname only appears in the LLM-written profile
+    assert asyncio.run(run()) == ["City", "Hobby"]
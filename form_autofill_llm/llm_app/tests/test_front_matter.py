@@ -0,0 +1,55 @@
+# test_front_matter.py - Front matter parsing, retrieval scopes and field routing
+import asyncio
+
+from form_processor import FormProcessor
+from front_matter import document_scope, matches_scope, normalize_filters, parse_front_matter
+from rag_manager import RAGManager
+
+
+def test_front_matter_is_parsed_and_skipped():
+    content = "---\ncategory: Profile\ntags: [EEO, legal]\n---\n# Me\n"
+    metadata, start = parse_front_matter(content)
+    assert content[start:] == "# Me\n"
+    assert document_scope(metadata) == ("profile", ("eeo", "legal"))
+
+
+def test_missing_front_matter_means_no_scope():
+    metadata, start = parse_front_matter("# Me\n- **Phone**: 555\n")
+    assert (metadata, start) == ({}, 0)
+    category, tags = document_scope(metadata)
+    assert category is None and tags == ()
+    assert matches_scope(category, tags, normalize_filters({'category': 'preferences'}))
+    assert matches_scope(category, tags, normalize_filters({'tags': ['eeo']}))
+    assert not matches_scope("profile", (), normalize_filters({'category': 'preferences'}))
+
+
+def test_routes_prefer_the_most_specific_term():
+    processor = FormProcessor(llm_service=None, rag_manager=None)
+    categories = {'profile': 1, 'preferences': 1}
+    assert processor._field_scope("Contact phone number", categories) == "profile"
+    assert processor._field_scope("Preferred contact email", categories) == "profile"
+    assert processor._field_scope("May we contact you by text?", categories) == "preferences"
+    assert processor._field_scope("Are you authorized to work in this state?", categories) == "preferences"
+    assert processor._field_scope("Desired salary", categories) == "preferences"
+    assert processor._field_scope("Job title", categories) == "profile"
+    assert processor._field_scope("Favourite colour", categories) is None
+    # No document carries the category, so nothing is routed
+    assert processor._field_scope("Contact phone number", {'preferences': 1}) is None
+
+
+def test_uncategorized_documents_are_searched_in_every_scope(tmp_path):
+    (tmp_path / "profile.md").write_text("# Profile\n- **Phone**: 555-0100\n", encoding="utf-8")
+    (tmp_path / "prefs.md").write_text("---\ncategory: preferences\n---\n# Prefs\n- **Relocate**: yes\n",
+                                       encoding="utf-8")
+
+    async def run():
+        manager = RAGManager(docs_path=str(tmp_path), index_path=None)
+        await manager.initialize()
+        generation = manager.pin()
+        hits = await manager.search_many(["phone"], top_k=2, filters={'category': 'preferences'})
+        return generation, hits[0]
+
+    generation, hits = asyncio.run(run())
+    assert generation.doc_map["profile.md"].category is None
+    assert generation.category_counts == {'preferences': 1}
+    assert [hit['filename'] for hit in hits] == ["profile.md"]
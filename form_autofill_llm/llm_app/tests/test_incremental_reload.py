@@ -0,0 +1,90 @@
+# test_incremental_reload.py - One-file reloads cost the same on small and large corpora
+import asyncio
+import statistics
+import time
+
+from benchmark import generate_corpus
+from rag_manager import RAGManager
+
+
+async def _edit_seconds(root, chunks: int, edits: int = 5) -> float:
+    corpus = generate_corpus(root, chunks, facts=10)
+    manager = RAGManager(docs_path=str(root), index_path=None, process_pool_threshold=10 ** 9)
+    await manager.initialize()
+
+    times = []
+    for i in range(edits):
+        path = corpus['files'][i]
+        path.write_text(path.read_text() + f"\n## Extra {i}\nfreshly added words {i}\n", encoding="utf-8")
+        started = time.perf_counter()
+        await manager.reload_paths([str(path)])
+        times.append(time.perf_counter() - started)
+    assert len(manager.index) == chunks + edits
+    return statistics.median(times)
+
+
+def test_reload_time_is_flat_in_corpus_size(tmp_path):
+    small = asyncio.run(_edit_seconds(tmp_path / "small", 1000))
+    large = asyncio.run(_edit_seconds(tmp_path / "large", 16000))
+    # Copying per-corpus structures would make the large corpus ~16x slower
+    assert large < 4 * small + 0.005, (small, large)
+
+
+def test_derived_generation_shares_unchanged_tables(tmp_path):
+    async def run():
+        corpus = generate_corpus(tmp_path, 2000, facts=10)
+        manager = RAGManager(docs_path=str(tmp_path), index_path=None)
+        await manager.initialize()
+        parent = manager.pin()
+        path = corpus['files'][0]
+        path.write_text(path.read_text() + "\n## Extra\nnew words\n", encoding="utf-8")
+        await manager.reload_paths([str(path)])
+        return parent, manager.pin()
+
+    parent, child = asyncio.run(run())
+    assert child.number == parent.number + 1
+    postings_shared = sum(child.index.postings.get(term) is postings
+                          for term, postings in parent.index.postings.items())
+    # Only the terms of the edited document got private posting lists
+    assert postings_shared >= len(parent.index.postings) - 60
+    documents_shared = sum(child.doc_map._buckets.get(index) is bucket
+                           for index, bucket in parent.doc_map._buckets.items())
+    assert documents_shared >= len(parent.doc_map._buckets) - 1
+
+
+def test_published_generation_is_never_mutated(tmp_path):
+    def view(generation):
+        return {
+            'documents': sorted(generation.doc_map),
+            'hashes': dict(generation.doc_hashes.items()),
+            'categories': dict(generation.category_counts),
+            'corpus_hash': generation.corpus_hash(),
+            'chunks': len(generation.index),
+            'email': generation.facts.lookup("Email"),
+            'scope': generation.scope((('profile',), ())),
+        }
+
+    async def run():
+        corpus = generate_corpus(tmp_path, 500, facts=10)
+        manager = RAGManager(docs_path=str(tmp_path), index_path=None)
+        await manager.initialize()
+        parent = manager.pin()
+        before = view(parent)
+        hits = await manager.search_chunks("Document section", top_k=10, generation=parent)
+
+        edited, deleted = corpus['files'][0], corpus['files'][1]
+        edited.write_text(edited.read_text() + "\n## Extra\nDocument section added later\n", encoding="utf-8")
+        deleted.unlink()
+        (tmp_path / "profile.md").write_text("---\ncategory: profile\n---\n- **Email**: new@example.com\n",
+                                             encoding="utf-8")
+        await manager.reload_paths([str(edited), str(deleted), str(tmp_path / "profile.md")])
+        child = manager.pin()
+        return parent, before, hits, child, await manager.search_chunks("Document section", top_k=10,
+                                                                        generation=parent)
+
+    parent, before, hits, child, hits_after = asyncio.run(run())
+    assert view(parent) == before
+    assert hits_after == hits
+    assert child.corpus_hash() != before['corpus_hash']
+    assert child.facts.lookup("Email")['value'] == "new@example.com"
+    assert len(child.doc_map) == len(before['documents']) - 1
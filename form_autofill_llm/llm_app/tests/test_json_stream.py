@@ -0,0 +1,71 @@
+# test_json_stream.py - Incremental JSON member parsing and recovery from bad members
+import json
+import random
+
+import pytest
+
+from json_stream import JSONObjectStream
+
+DOCUMENT = json.dumps({
+    "First Name": "Ada",
+    "Quote": "she said \"hi\" {not a brace} \\ done",
+    "Years": 12,
+    "Score": -3.5e2,
+    "Remote": True,
+    "Middle name": None,
+    "Skills": ["Python", "SQL ]", {"level": "expert"}],
+    "Address": {"city": "Oakland", "zip": "94612"},
+    "Unicode": "café ☃",
+})
+
+
+def _feed(parser: JSONObjectStream, pieces):
+    members = []
+    for piece in pieces:
+        members.extend(parser.feed(piece))
+    return members
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_any_split_yields_every_member_in_order(seed):
+    rng = random.Random(seed)
+    text = "Sure! Here is the JSON:\n```json\n" + DOCUMENT + "\n```\nLet me know {if} you need more."
+    cuts = sorted(rng.sample(range(1, len(text)), rng.randint(1, 60)))
+    pieces = [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+    parser = JSONObjectStream()
+    assert _feed(parser, pieces) == list(json.loads(DOCUMENT).items())
+    assert parser.done
+
+
+def test_members_are_yielded_as_soon_as_they_close():
+    parser = JSONObjectStream()
+    assert parser.feed('{"a": "x') == []
+    assert parser.feed('y", "b": 4') == [("a", "xy")]
+    # A number only ends at a delimiter
+    assert parser.feed('2') == []
+    assert parser.feed(' , "c": [1') == [("b", 42)]
+    assert parser.feed(']') == [("c", [1])]
+    assert not parser.done
+    assert parser.feed('} trailing {"d": 1}') == []
+    assert parser.done
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"a": tru, "b": "ok"}', [("b", "ok")]),
+    ('{name: "x, y", "b": 1}', [("b", 1)]),
+    ('{"a" "missing colon", "b": 2}', [("b", 2)]),
+    ('{"a": "x" "y", "b": 3}', [("a", "x"), ("b", 3)]),
+    ('{"a": {"broken": }, "b": [4]}', [("b", [4])]),
+    ('{"a": 1,, "b": 5}', [("a", 1), ("b", 5)]),
+])
+def test_a_malformed_member_does_not_lose_the_rest(text, expected):
+    parser = JSONObjectStream()
+    assert parser.feed(text) == expected
+    assert parser.done
+
+
+def test_truncated_stream_keeps_completed_members():
+    parser = JSONObjectStream()
+    assert parser.feed('{"a": "done", "b": "cut off mid') == [("a", "done")]
+    assert not parser.done
+    assert JSONObjectStream().feed("no object at all") == []
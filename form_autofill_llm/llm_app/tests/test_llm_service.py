@@ -0,0 +1,90 @@
+# test_llm_service.py - Pooled session and streamed form fills against a local fake Ollama
+import asyncio
+import json
+
+from aiohttp import web
+
+from llm_service import LLMService
+
+
+async def _serve(answer: str, delay: float = 0.0, pieces: int = 1):
+    """Fake Ollama chat endpoint on a free port; returns (runner, base_url)"""
+    async def chat(request):
+        payload = await request.json()
+        await asyncio.sleep(delay)
+        if payload['model'] == "missing":
+            return web.Response(status=404, text="model not found")
+        if not payload['stream']:
+            return web.json_response({'message': {'content': answer}})
+        response = web.StreamResponse()
+        await response.prepare(request)
+        size = max(1, len(answer) // pieces)
+        for start in range(0, len(answer), size):
+            line = {'message': {'content': answer[start:start + size]}, 'done': False}
+            await response.write((json.dumps(line) + "\n").encode())
+        await response.write((json.dumps({'message': {'content': ''}, 'done': True}) + "\n").encode())
+        return response
+
+    app = web.Application()
+    app.router.add_post("/api/chat", chat)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+def test_concurrent_requests_share_a_bounded_pool():
+    async def run():
+        runner, url = await _serve('{"a": 1}', delay=0.02)
+        llm = LLMService(base_url=url, max_connections_per_host=2)
+        await llm.start()
+        answers = await asyncio.gather(*(llm.chat_completion([]) for _ in range(10)))
+        stats = llm.pool_stats()
+        await llm.close()
+        await llm.close()
+        closed = llm.pool_stats()['session_open']
+        # A request after close reopens the pool lazily
+        again = await llm.chat_completion([])
+        await llm.close()
+        await runner.cleanup()
+        return answers, stats, closed, again
+
+    answers, stats, closed, again = asyncio.run(run())
+    assert answers == ['{"a": 1}'] * 10 and again == '{"a": 1}'
+    assert stats['connections_created'] <= 2 and stats['pool_waits'] > 0
+    assert stats['max_in_flight'] == 10 and stats['in_flight'] == 0 and stats['errors'] == 0
+    assert not closed
+
+
+def test_http_errors_are_counted_and_return_empty():
+    async def run():
+        runner, url = await _serve("unused")
+        llm = LLMService(base_url=url, model="missing")
+        answer = await llm.chat_completion([])
+        stats = llm.pool_stats()
+        await llm.close()
+        await runner.cleanup()
+        return answer, stats
+
+    answer, stats = asyncio.run(run())
+    assert answer == "" and stats['errors'] == 1
+
+
+def test_streamed_fill_yields_every_field_once():
+    answer = '```json\n{"Email": "ada@example.com", "Phone": "555-0100", "Extra": "ignored", "Email": "again"}\n```'
+
+    async def run():
+        runner, url = await _serve(answer, pieces=17)
+        llm = LLMService(base_url=url)
+        fields = {"Email": "", "Phone": "", "City": ""}
+        items = [item async for item in llm.stream_form_fields(fields, context="")]
+        stats = llm.pool_stats()
+        await llm.close()
+        await runner.cleanup()
+        return items, stats
+
+    items, stats = asyncio.run(run())
+    assert items == [("Email", "ada@example.com"), ("Phone", "555-0100"), ("City", "")]
+    assert stats['in_flight'] == 0
@@ -0,0 +1,83 @@
+# test_markdown_chunker.py - Span invariants of heading-aware chunks
+import random
+
+import pytest
+
+from markdown_chunker import HEADING_PATTERN, chunk_markdown
+from text_utils import estimate_tokens
+
+WORDS = "email phone python resume salary relocate visa degree manager remote".split()
+
+
+def _document(rng: random.Random) -> str:
+    lines = []
+    for _ in range(rng.randint(1, 25)):
+        kind = rng.random()
+        if kind < 0.2:
+            lines.append("#" * rng.randint(1, 4) + " " + rng.choice(WORDS).title())
+        elif kind < 0.5:
+            lines.extend(f"- **{rng.choice(WORDS)}**: {rng.choice(WORDS)}" for _ in range(rng.randint(1, 8)))
+        elif kind < 0.6:
+            lines.extend(["```", *(rng.choice(WORDS) for _ in range(rng.randint(1, 6))), "```"])
+        elif kind < 0.7:
+            # One very long line, cut at a fixed width
+            lines.append(" ".join(rng.choices(WORDS, k=rng.randint(50, 400))))
+        else:
+            lines.append(" ".join(rng.choices(WORDS, k=rng.randint(3, 60))))
+        lines.extend([""] * rng.randint(0, 2))
+    return "\n".join(lines) + "\n"
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_chunks_are_exact_ordered_disjoint_spans(seed):
+    rng = random.Random(seed)
+    content = _document(rng)
+    max_tokens = rng.choice([16, 64, 256])
+    chunks = chunk_markdown(content, max_tokens=max_tokens)
+
+    previous_end = 0
+    for chunk in chunks:
+        assert chunk['text'] == content[chunk['start']:chunk['end']]
+        assert chunk['text'] == chunk['text'].strip() and chunk['text']
+        assert chunk['start'] >= previous_end
+        previous_end = chunk['end']
+        # Only the leading lines of a chunk may be headings (carried into their body)
+        lines = [line for line in chunk['text'].splitlines() if line.strip()]
+        body = [i for i, line in enumerate(lines) if not HEADING_PATTERN.match(line)]
+        assert not body or not any(HEADING_PATTERN.match(line) for line in lines[body[0]:])
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_every_body_line_is_covered_within_budget(seed):
+    rng = random.Random(seed)
+    content = _document(rng)
+    chunks = chunk_markdown(content, max_tokens=64)
+
+    covered = set()
+    for chunk in chunks:
+        covered.update(range(chunk['start'], chunk['end']))
+        if "```" not in chunk['text']:
+            headings = sum(len(line) + 1 for line in chunk['text'].splitlines() if HEADING_PATTERN.match(line))
+            assert estimate_tokens(chunk['text']) <= 64 + (headings + 3) // 4
+
+    offset = 0
+    for line in content.splitlines(keepends=True):
+        if line.strip() and not HEADING_PATTERN.match(line):
+            first = offset + len(line) - len(line.lstrip())
+            assert first in covered, line
+        offset += len(line)
+
+
+def test_heading_path_follows_nesting():
+    content = "# User\n## Work\n### Current\n- **Title**: Engineer\n## Skills\nPython and SQL\n"
+    chunks = chunk_markdown(content)
+    assert [chunk['heading_path'] for chunk in chunks] == ["User > Work > Current", "User > Skills"]
+    assert chunks[0]['text'].startswith("# User")
+    assert chunks[1]['text'] == "## Skills\nPython and SQL"
+
+
+def test_code_fence_is_never_split_at_a_blank_line():
+    content = "# Setup\n```\npip install\n\n# not a heading\n```\n"
+    chunks = chunk_markdown(content)
+    assert len(chunks) == 1
+    assert chunks[0]['heading_path'] == "Setup"
@@ -0,0 +1,97 @@
+# test_near_duplicates.py - MinHash signatures and near-duplicate clusters
+import asyncio
+import random
+
+import near_duplicates
+from near_duplicates import DuplicateIndex, minhash_signatures, similarity
+from rag_manager import RAGManager
+from text_utils import tokenize
+
+WORDS = [f"word{i}" for i in range(200)]
+
+
+def _text(rng: random.Random, length: int = 60) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(length))
+
+
+def _shingles(tokens):
+    return set(zip(tokens, tokens[1:], tokens[2:]))
+
+
+def test_numpy_and_pure_python_signatures_agree(monkeypatch):
+    rng = random.Random(1)
+    token_lists = [tokenize(_text(rng, rng.randint(5, 80))) for _ in range(20)]
+    vectorized = minhash_signatures(token_lists)
+    monkeypatch.setattr(near_duplicates, "np", None)
+    assert minhash_signatures(token_lists) == vectorized
+    # Chunks shorter than MIN_WORDS get no signature
+    assert [signature is None for signature in vectorized] == \
+        [len(tokens) < near_duplicates.MIN_WORDS for tokens in token_lists]
+
+
+def test_similarity_estimates_shingle_jaccard():
+    rng = random.Random(2)
+    errors = []
+    for _ in range(30):
+        base = tokenize(_text(rng, 80))
+        edited = list(base)
+        for i in rng.sample(range(len(edited)), rng.randint(0, 20)):
+            edited[i] = rng.choice(WORDS)
+        first, second = minhash_signatures([base, edited])
+        truth = len(_shingles(base) & _shingles(edited)) / len(_shingles(base) | _shingles(edited))
+        errors.append(abs(similarity(first, second) - truth))
+    assert sum(errors) / len(errors) < 0.1
+
+
+def _signatures(texts):
+    return minhash_signatures([tokenize(text) for text in texts])
+
+
+def test_near_duplicates_cluster_and_collapse():
+    rng = random.Random(3)
+    shared = _text(rng)
+    other = _text(rng)
+    index = DuplicateIndex()
+    index.add_document("a.md", _signatures([shared, other]))
+    index.add_document("b.md", _signatures([shared + " word1"]))
+    assert index.cluster(("b.md", 0)) == (("a.md", 0), ("b.md", 0))
+    assert index.representative(("a.md", 1)) == ("a.md", 1)
+    ranked = [(3.0, "b.md", 0), (2.0, "a.md", 1), (1.0, "a.md", 0)]
+    assert index.collapse(ranked) == [(3.0, "b.md", 0), (2.0, "a.md", 1)]
+
+
+def test_removing_the_representative_promotes_a_member():
+    rng = random.Random(4)
+    shared = _text(rng)
+    index = DuplicateIndex()
+    for name in ("a.md", "b.md", "c.md"):
+        index.add_document(name, _signatures([shared]))
+    clone = index.copy()
+    clone.remove_document("a.md")
+    assert clone.cluster(("c.md", 0)) == (("b.md", 0), ("c.md", 0))
+    # A new copy still finds the promoted representative through the buckets
+    clone.add_document("d.md", _signatures([shared]))
+    assert clone.representative(("d.md", 0)) == ("b.md", 0)
+    # The original is untouched
+    assert index.cluster(("c.md", 0)) == (("a.md", 0), ("b.md", 0), ("c.md", 0))
+    clone.remove_document("b.md")
+    clone.remove_document("c.md")
+    clone.remove_document("d.md")
+    assert len(clone) == 0 and not clone.buckets
+
+
+def test_search_returns_one_hit_per_cluster_with_provenance(tmp_path):
+    rng = random.Random(5)
+    boilerplate = "Equal opportunity statement " + _text(rng, 40)
+    for name in ("job1.md", "job2.md"):
+        (tmp_path / name).write_text(f"# {name}\n{boilerplate}\n", encoding="utf-8")
+
+    async def run():
+        manager = RAGManager(docs_path=str(tmp_path), index_path=None)
+        await manager.initialize()
+        return await manager.search_chunks("equal opportunity statement", top_k=5)
+
+    hits = asyncio.run(run())
+    assert len(hits) == 1
+    assert [duplicate['filename'] for duplicate in hits[0]['duplicates']] == \
+        [name for name in ("job1.md", "job2.md") if name != hits[0]['filename']]
@@ -0,0 +1,92 @@
+# test_profile_digest.py - Background digest build, staleness and disk cache
+import asyncio
+import json
+
+from profile_digest import ProfileDigest
+from rag_manager import RAGManager
+
+
+class FakeLLM:
+    model = "fake"
+    is_initialized = True
+
+    def __init__(self, profile=None):
+        self.profile = profile or {'full_name': "Ada Lovelace"}
+        self.prompts = []
+
+    async def generate_completion(self, prompt, system_prompt=None):
+        self.prompts.append(prompt)
+        if prompt.startswith("Summarize"):
+            return "A long essay about engines."
+        return "Here you go: " + json.dumps(self.profile)
+
+
+def _docs(root):
+    (root / "profile.md").write_text("---\ncategory: profile\n---\n# Me\n- **Email**: ada@example.com\n",
+                                     encoding="utf-8")
+    (root / "essay.md").write_text("# Essay\n" + "engines and numbers " * 200, encoding="utf-8")
+
+
+def test_digest_follows_the_corpus_and_is_cached(tmp_path):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    _docs(docs)
+    cache = tmp_path / "digest.json"
+
+    async def run():
+        manager = RAGManager(docs_path=str(docs), index_path=None)
+        await manager.initialize()
+        llm = FakeLLM()
+        digest = ProfileDigest(llm, manager, cache_path=str(cache), summary_threshold_tokens=100)
+        await digest.start()
+        await digest._task
+        built = digest.digest_for(manager.pin())
+
+        (docs / "profile.md").write_text("---\ncategory: profile\n---\n# Me\n- **Email**: new@example.com\n",
+                                         encoding="utf-8")
+        await manager.reload_paths([str(docs / "profile.md")])
+        stale = digest.digest_for(manager.pin())
+        await digest._task
+        rebuilt = digest.digest_for(manager.pin())
+        await digest.stop()
+
+        # A restart on the same corpus reuses the cached digest without the LLM
+        again_llm = FakeLLM()
+        again = ProfileDigest(again_llm, manager, cache_path=str(cache))
+        await again.start()
+        return built, stale, rebuilt, again.digest_for(manager.pin()), again_llm.prompts
+
+    built, stale, rebuilt, restored, prompts = asyncio.run(run())
+    assert built is not None and '"full_name":"Ada Lovelace"' in built['text']
+    assert "ada@example.com" in built['text']
+    assert list(built['summaries']) == ["essay.md"]
+    assert stale is None
+    assert "new@example.com" in rebuilt['text'] and rebuilt['corpus_hash'] != built['corpus_hash']
+    assert restored is not None and restored['corpus_hash'] == rebuilt['corpus_hash']
+    assert prompts == []
+
+
+def test_failed_build_serves_nothing_and_records_the_error(tmp_path):
+    _docs(tmp_path)
+
+    class Broken(FakeLLM):
+        async def generate_completion(self, prompt, system_prompt=None):
+            return "no json here"
+
+    async def run():
+        manager = RAGManager(docs_path=str(tmp_path), index_path=None)
+        await manager.initialize()
+        digest = ProfileDigest(Broken(), manager, cache_path=None, summary_threshold_tokens=10 ** 6)
+        await digest.start()
+        await digest._task
+        return digest.digest_for(manager.pin()), digest.status()
+
+    served, status = asyncio.run(run())
+    assert served is None
+    assert not status['ready'] and "No JSON object" in status['last_error']
+
+
+def test_an_oversize_section_is_skipped_not_the_rest(tmp_path):
+    digest = ProfileDigest(FakeLLM(), None, cache_path=None, prompt_token_budget=50)
+    sections = ["=== a.md ===\nshort", "=== big.md ===\n" + "word " * 400, "=== c.md ===\nalso short"]
+    assert digest._fit_budget(sections) == f"{sections[0]}\n\n{sections[2]}"
@@ -0,0 +1,59 @@
+# test_quantization.py - Code sizes and score accuracy of the embedding quantizers
+import numpy as np
+import pytest
+
+import quantization
+from quantization import BinaryQuantizer, Int8Quantizer, codes_nbytes, create_quantizer
+
+
+def _unit(count: int, dimension: int, seed: int = 0) -> np.ndarray:
+    vectors = np.random.default_rng(seed).normal(size=(count, dimension))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def test_float32_scores_are_exact():
+    vectors, queries = _unit(50, 24), _unit(3, 24, seed=1)
+    quantizer = create_quantizer(None)
+    codes, scales = quantizer.encode(vectors)
+    assert np.allclose(quantizer.scores(codes, scales, queries), vectors @ queries.T)
+    assert codes_nbytes(codes, scales) == 50 * 24 * 4
+
+
+def test_int8_error_is_within_half_a_step_per_dimension():
+    vectors, queries = _unit(300, 64), _unit(5, 64, seed=1)
+    quantizer = Int8Quantizer()
+    codes, scales = quantizer.encode(vectors)
+    assert codes.dtype == np.int8 and codes_nbytes(codes, scales) == 300 * 64 + 300 * 4
+    error = np.abs(quantizer.scores(codes, scales, queries) - vectors @ queries.T)
+    bound = scales[:, None] / 2 * np.abs(queries).sum(axis=1)[None, :]
+    assert np.all(error <= bound + 1e-5)
+
+
+def test_int8_keeps_zero_vectors_finite():
+    codes, scales = Int8Quantizer().encode(np.zeros((2, 8), dtype=np.float32))
+    assert not codes.any() and np.all(np.isfinite(scales))
+
+
+@pytest.mark.parametrize("dimension", [16, 13])
+def test_binary_scores_are_inner_products_with_the_signs(dimension):
+    vectors, queries = _unit(100, dimension), _unit(4, dimension, seed=1)
+    quantizer = BinaryQuantizer()
+    codes, scales = quantizer.encode(vectors)
+    assert codes.shape == (100, (dimension + 7) // 8)
+    signs = np.where(vectors > 0, 1.0, -1.0)
+    assert np.allclose(quantizer.scores(codes, scales, queries), signs @ queries.T, atol=1e-5)
+
+
+def test_blocked_scoring_matches_one_block(monkeypatch):
+    vectors, queries = _unit(100, 16), _unit(3, 16, seed=1)
+    for quantizer in (Int8Quantizer(), BinaryQuantizer()):
+        codes, scales = quantizer.encode(vectors)
+        whole = quantizer.scores(codes, scales, queries)
+        monkeypatch.setattr(quantization, "SCORE_BLOCK", 7)
+        assert np.allclose(quantizer.scores(codes, scales, queries), whole)
+        monkeypatch.undo()
+
+
+def test_unknown_quantization_is_rejected():
+    with pytest.raises(ValueError):
+        create_quantizer("int4")
@@ -0,0 +1,48 @@
+# test_query_cache.py - Ranked-result cache keyed by generation, query and scope
+import asyncio
+
+from query_cache import QueryCache, normalize_query
+from rag_manager import RAGManager
+
+RANKED = [(3.0, "a.md", 0), (2.0, "b.md", 1), (1.0, "c.md", 0)]
+
+
+def test_equivalent_queries_share_an_entry():
+    assert normalize_query("Email:") == normalize_query("  email ") == "email"
+    assert normalize_query("the") == "the"
+    cache = QueryCache()
+    cache.put(1, "Email:", 3, RANKED)
+    assert cache.get(1, "email", 2) == RANKED[:2]
+    # Asking for more results than were ranked is a miss
+    assert cache.get(1, "email", 5) is None
+    assert cache.get(2, "email", 2) is None
+    assert cache.get(1, "email", 2, scope=(("profile",), ())) is None
+    assert (cache.hits, cache.misses) == (1, 3)
+
+
+def test_lru_eviction():
+    cache = QueryCache(max_entries=2)
+    for query in ("phone", "email", "city"):
+        cache.put(1, query, 3, RANKED)
+    assert cache.get(1, "phone", 1) is None
+    assert cache.get(1, "city", 1) == RANKED[:1]
+    assert cache.stats()['evictions'] == 1
+
+
+def test_manager_serves_repeats_from_cache_and_clears_on_reload(tmp_path):
+    (tmp_path / "me.md").write_text("# Me\n- **Phone**: 555-0100\n", encoding="utf-8")
+
+    async def run():
+        manager = RAGManager(docs_path=str(tmp_path), index_path=None)
+        await manager.initialize()
+        first = await manager.search_chunks("Phone", top_k=3)
+        second = await manager.search_chunks("phone:", top_k=2)
+        hits = manager.query_cache.hits
+        (tmp_path / "me.md").write_text("# Me\n- **Phone**: 555-0199\n", encoding="utf-8")
+        await manager.reload_paths([str(tmp_path / "me.md")])
+        after = await manager.search_chunks("Phone", top_k=3)
+        return first, second, hits, after
+
+    first, second, hits, after = asyncio.run(run())
+    assert hits == 1 and second == first[:2]
+    assert "555-0199" in after[0]['chunk']['text']
@@ -0,0 +1,36 @@
+# test_rag_manager.py - RAGManager configuration and retrieval fallbacks
+import asyncio
+import logging
+
+from rag_manager import RAGManager
+
+
+def test_keyword_retrieval_is_the_default(tmp_path):
+    manager = RAGManager(docs_path=str(tmp_path), index_path=None)
+    assert manager.retrieval_mode == "keyword"
+    assert manager.embeddings is None
+
+
+def test_embedding_without_an_embedder_falls_back_to_keyword(tmp_path, caplog):
+    with caplog.at_level(logging.WARNING, logger="rag_manager"):
+        manager = RAGManager(docs_path=str(tmp_path), index_path=None, retrieval_mode="embedding")
+        unknown = RAGManager(docs_path=str(tmp_path), index_path=None, retrieval_mode="semantic")
+    assert manager.embeddings is None and unknown.embeddings is None
+    assert any("falling back to keyword" in record.message for record in caplog.records)
+    assert any("Unknown retrieval mode 'semantic'" in record.message for record in caplog.records)
+
+
+def test_failing_embedder_keeps_keyword_search_working(tmp_path):
+    (tmp_path / "profile.md").write_text("# Profile\n- **Phone**: 555-0100\n", encoding="utf-8")
+
+    async def embedder(texts):
+        raise ConnectionError("embedding model not pulled")
+
+    async def run():
+        manager = RAGManager(docs_path=str(tmp_path), index_path=None, retrieval_mode="embedding",
+                             embedder=embedder)
+        await manager.initialize()
+        return await manager.search_many(["phone"], top_k=1)
+
+    hits = asyncio.run(run())
+    assert hits[0][0]['filename'] == "profile.md"
@@ -0,0 +1,101 @@
+# test_reranker.py - Second-stage reranking is opt-in and reorders candidates
+import asyncio
+import logging
+
+from rag_manager import RAGManager
+from reranker import OllamaReranker, create_reranker
+
+
+class FakeLLM:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.prompts = []
+
+    async def generate_completion(self, prompt, system_prompt=None):
+        self.prompts.append(prompt)
+        return self.responses.pop(0)
+
+
+def test_reranking_is_off_unless_configured(caplog):
+    assert create_reranker(None) is None
+    assert create_reranker("none") is None
+    assert isinstance(create_reranker("ollama", FakeLLM([])), OllamaReranker)
+    with caplog.at_level(logging.WARNING, logger="reranker"):
+        assert create_reranker("bogus") is None
+    assert any("Unknown reranker 'bogus'" in record.message for record in caplog.records)
+
+
+def test_ollama_reranker_batches_and_parses_scores():
+    llm = FakeLLM(["Scores: [3, 9]", "[1]"])
+    reranker = OllamaReranker(llm, batch_size=2)
+    scores = asyncio.run(reranker.score_many([("phone", ["a", "b", "c"])]))
+    assert scores == [[3.0, 9.0, 1.0]]
+    assert len(llm.prompts) == 2 and "FORM FIELD: phone" in llm.prompts[0]
+
+
+def test_ollama_batches_run_concurrently_and_fail_per_query():
+    class SlowLLM:
+        running = 0
+        max_running = 0
+
+        async def generate_completion(self, prompt, system_prompt=None):
+            SlowLLM.running += 1
+            SlowLLM.max_running = max(SlowLLM.max_running, SlowLLM.running)
+            await asyncio.sleep(0.01)
+            SlowLLM.running -= 1
+            return "not json" if "FORM FIELD: broken" in prompt else "[5, 6]"
+
+    reranker = OllamaReranker(SlowLLM(), batch_size=2, max_concurrency=3)
+    requests = [(f"field {i}", ["a", "b", "c", "d"]) for i in range(4)] + [("broken", ["a", "b"])]
+    scores = asyncio.run(reranker.score_many(requests))
+    assert scores[:4] == [[5.0, 6.0, 5.0, 6.0]] * 4 and scores[4] is None
+    assert SlowLLM.max_running == 3
+
+
+def test_reranker_reorders_and_failure_keeps_first_stage(tmp_path):
+    (tmp_path / "a.md").write_text("# A\nphone number listed here phone\n", encoding="utf-8")
+    (tmp_path / "b.md").write_text("# B\nmy phone\n", encoding="utf-8")
+
+    class Reversed:
+        async def score_many(self, requests):
+            return [list(range(len(passages))) for _, passages in requests]
+
+    class Broken:
+        async def score_many(self, requests):
+            raise RuntimeError("model not loaded")
+
+    async def run(reranker):
+        manager = RAGManager(docs_path=str(tmp_path), index_path=None, reranker=reranker)
+        await manager.initialize()
+        return [hit['filename'] for hit in (await manager.search_many(["phone"], top_k=2))[0]]
+
+    first_stage = asyncio.run(run(None))
+    assert asyncio.run(run(Reversed())) == first_stage[::-1]
+    assert asyncio.run(run(Broken())) == first_stage
+
+
+def test_slow_reranker_grades_only_its_candidate_cap(tmp_path):
+    for i in range(6):
+        (tmp_path / f"doc{i}.md").write_text(f"# Doc {i}\nphone {'phone ' * i}\n", encoding="utf-8")
+
+    class Capped:
+        max_candidates = 2
+        seen = []
+
+        async def score_many(self, requests):
+            Capped.seen = [len(passages) for _, passages in requests]
+            return [[0.0, 1.0] if query == "phone" else None for query, _ in requests]
+
+    async def run(reranker):
+        manager = RAGManager(docs_path=str(tmp_path), index_path=None, reranker=reranker)
+        await manager.initialize()
+        results = await manager.search_many(["phone", "doc"], top_k=4)
+        return [[hit['filename'] for hit in hits] for hits in results]
+
+    first_stage = asyncio.run(run(None))
+    phone, doc = asyncio.run(run(Capped()))
+    assert Capped.seen == [2, 2]
+    # The two graded candidates swap; the rest keep their first-stage order
+    assert phone == [first_stage[0][1], first_stage[0][0]] + first_stage[0][2:4]
+    # A query whose rerank failed keeps its first-stage ranking
+    assert doc == first_stage[1]
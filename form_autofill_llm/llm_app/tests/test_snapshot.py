@@ -0,0 +1,168 @@
+# test_snapshot.py - Warm restarts from the on-disk index snapshot
+import asyncio
+
+from benchmark import generate_corpus
+from index_store import IndexStore
+from rag_manager import RAGManager
+
+
+def _manager(docs, index_path) -> RAGManager:
+    return RAGManager(docs_path=str(docs), index_path=str(index_path))
+
+
+def test_restart_restores_tables_and_totals(tmp_path):
+    docs = tmp_path / "docs"
+    generate_corpus(docs, 200, facts=5)
+    (docs / "profile.md").write_text("---\ncategory: profile\n---\n# Me\n- **Email**: me@example.com\n",
+                                     encoding="utf-8")
+
+    async def run():
+        first = _manager(docs, tmp_path / "index")
+        await first.initialize()
+        await first.flush_snapshot()
+        second = _manager(docs, tmp_path / "index")
+        await second.initialize()
+        return first.pin(), second.pin()
+
+    built, restored = asyncio.run(run())
+    assert restored.corpus_hash() == built.corpus_hash()
+    assert restored.category_counts == built.category_counts
+    assert restored.category_counts.get('profile') == 1
+    assert len(restored.index) == len(built.index)
+    assert restored.facts.lookup("Email")['value'] == "me@example.com"
+    # Restored tables are copy-on-write like freshly built ones
+    child = restored.derive()
+    child.remove_document("profile.md")
+    assert "profile.md" in restored.doc_map and "profile.md" not in child.doc_map
+
+
+def test_edit_is_journaled_and_replayed(tmp_path):
+    docs = tmp_path / "docs"
+    generate_corpus(docs, 200, facts=5)
+    index = tmp_path / "index"
+
+    async def run():
+        first = _manager(docs, index)
+        await first.initialize()
+        await first.flush_snapshot()
+        base = (index / "state.pkl").stat()
+        (docs / "profile.md").write_text("# Me\n- **Phone**: 555-0100\n", encoding="utf-8")
+        await first.reload_paths([str(docs / "profile.md")])
+        await first.flush_snapshot()
+        # The edit went to the journal; the base was not rewritten
+        assert (index / "state.pkl").stat().st_mtime_ns == base.st_mtime_ns
+        assert (index / "journal.pkl").stat().st_size > 0
+
+        second = _manager(docs, index)
+        await second.initialize()
+        return first.pin(), second.pin(), second.ingest_progress
+
+    edited, restored, progress = asyncio.run(run())
+    assert restored.number == edited.number
+    assert restored.corpus_hash() == edited.corpus_hash()
+    assert restored.facts.lookup("Phone")['value'] == "555-0100"
+    assert progress['changed'] == 0
+
+
+def test_shutdown_waits_for_a_running_reload_before_flushing(tmp_path):
+    docs = tmp_path / "docs"
+    generate_corpus(docs, 50, facts=5)
+    index = tmp_path / "index"
+
+    async def run():
+        first = RAGManager(docs_path=str(docs), index_path=str(index), reload_debounce=0)
+        await first.initialize()
+        reload_paths = first.reload_paths
+
+        async def slow_reload(paths):
+            await asyncio.sleep(0.05)
+            await reload_paths(paths)
+
+        first.reload_paths = slow_reload
+        (docs / "profile.md").write_text("# Me\n- **Phone**: 555-0100\n", encoding="utf-8")
+        first.schedule_reload(str(docs / "profile.md"))
+        while first._reload_task is None:
+            await asyncio.sleep(0)
+        await first.stop_file_watcher()
+        await first.flush_snapshot()
+
+        second = _manager(docs, index)
+        await second.initialize()
+        return first.pin(), second.pin(), second.ingest_progress
+
+    edited, restored, progress = asyncio.run(run())
+    assert edited.facts.lookup("Phone")['value'] == "555-0100"
+    # The reload made it into the snapshot, so the restart had nothing to re-read
+    assert restored.number == edited.number and progress['changed'] == 0
+
+
+def test_large_journal_is_compacted_into_the_base(tmp_path):
+    docs = tmp_path / "docs"
+    generate_corpus(docs, 50, facts=5)
+    index = tmp_path / "index"
+
+    async def run():
+        manager = RAGManager(docs_path=str(docs), index_path=str(index), snapshot_debounce=0,
+                             journal_compact_ratio=0)
+        await manager.initialize()
+        await manager.flush_snapshot()
+        (docs / "profile.md").write_text("# Me\n- **Phone**: 555-0100\n", encoding="utf-8")
+        await manager.reload_paths([str(docs / "profile.md")])
+        await manager.flush_snapshot()
+        return manager.pin()
+
+    generation = asyncio.run(run())
+    state = IndexStore(str(index)).load()
+    assert state['generation'] == generation.number
+    assert state['journal'] == []
+    assert (index / "journal.pkl").stat().st_size == 0
+
+
+def test_torn_journal_tail_is_ignored(tmp_path):
+    store = IndexStore(str(tmp_path))
+    store.save({'generation': 3, 'lineage': 'a'})
+    for number in (4, 5):
+        store.append({'generation': number, 'lineage': 'a'})
+    store.append({'generation': 6, 'lineage': 'other'})
+    with open(tmp_path / "journal.pkl", 'ab') as f:
+        f.write(b"\x80\x05partial")
+
+    state = store.load()
+    assert [entry['generation'] for entry in state['journal']] == [4, 5]
+    assert not state['journal_complete']
+    store.save({'generation': 4, 'lineage': 'a'})
+    assert [entry['generation'] for entry in store.load()['journal']] == [5]
+
+
+def test_embedding_edit_is_replayed_without_reembedding(tmp_path):
+    docs = tmp_path / "docs"
+    generate_corpus(docs, 40, facts=3)
+    index = tmp_path / "index"
+    embedded = []
+
+    async def embedder(texts):
+        embedded.extend(texts)
+        return [[float(len(text) % 7 + 1), float(sum(map(ord, text)) % 11 + 1), 1.0] for text in texts]
+
+    def manager():
+        return RAGManager(docs_path=str(docs), index_path=str(index), retrieval_mode="embedding",
+                          embedder=embedder, ann_threshold=None)
+
+    async def run():
+        first = manager()
+        await first.initialize()
+        await first.flush_snapshot()
+        (docs / "profile.md").write_text("# Me\n- **Phone**: 555-0100\n", encoding="utf-8")
+        await first.reload_paths([str(docs / "profile.md")])
+        await first.flush_snapshot()
+        embedded.clear()
+
+        second = manager()
+        await second.initialize()
+        return first.pin(), second.pin()
+
+    edited, restored = asyncio.run(run())
+    assert embedded == []
+    assert restored.embedding_pending == set()
+    assert dict(restored.embeddings.doc_hashes.items()) == dict(edited.embeddings.doc_hashes.items())
+    assert len(list(index.glob("vectors-*.f32"))) == 1
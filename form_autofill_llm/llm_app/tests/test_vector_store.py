@@ -0,0 +1,51 @@
+# test_vector_store.py - Append-only on-disk vector file
+import numpy as np
+import pytest
+
+from vector_store import VectorStore
+
+
+def _rows(count: int, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).normal(size=(count, 8)).astype(np.float32)
+
+
+def test_reads_any_rows_in_the_requested_order():
+    store = VectorStore(8)
+    data = _rows(20)
+    assert store.append(data[:12]) == 0
+    assert store.append(data[12:]) == 12
+    rows = [19, 3, 4, 5, 0, 4]
+    assert np.array_equal(store.read(rows), data[rows])
+    assert store.read([]).shape == (0, 8)
+    with pytest.raises(ValueError):
+        store.append(np.zeros((1, 4), dtype=np.float32))
+    store.close()
+
+
+def test_reopen_drops_rows_no_snapshot_refers_to(tmp_path):
+    store = VectorStore(8, directory=str(tmp_path))
+    data = _rows(10)
+    store.append(data)
+    store.flush()
+    store.close()
+
+    reopened = VectorStore(8, directory=str(tmp_path), name=store.name, rows=6)
+    assert len(reopened) == 6 and reopened.nbytes() == 6 * 8 * 4
+    assert reopened.append(data[:1]) == 6
+    assert np.array_equal(reopened.read([5, 6]), np.stack([data[5], data[0]]))
+    reopened.close()
+    with pytest.raises(ValueError):
+        VectorStore(8, directory=str(tmp_path), name=store.name, rows=100)
+
+
+def test_unused_store_files_are_removed(tmp_path):
+    kept = VectorStore(8, directory=str(tmp_path))
+    stale = VectorStore(8, directory=str(tmp_path))
+    stale.append(_rows(3))
+    (tmp_path / "state.pkl").write_bytes(b"")
+    assert VectorStore.remove_unused(str(tmp_path), {kept.name}) == 1
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted([kept.name, "state.pkl"])
+    # A generation still holding the deleted store keeps reading it
+    assert stale.read([2]).shape == (1, 8)
+    kept.close()
+    stale.close()
@@ -0,0 +1,30 @@
+# text_utils.py - Shared text normalization helpers for indexing and retrieval
+import re
+from typing import List
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Common English words that match almost every chunk and carry no signal
+STOPWORDS = frozenset("""
+a about above after again all am an and any are as at be because been before
+being below between both but by can could did do does doing down during each
+few for from further had has have having he her here hers him his how i if in
+into is it its itself just me more most my myself no nor not of off on once
+only or other our ours out over own please same she should so some such than
+that the their theirs them then there these they this those through to too
+under until up very was we were what when where which while who whom why will
+with would you your yours yourself
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase text and split it into index terms, dropping stopwords"""
+    return [
+        token for token in TOKEN_PATTERN.findall(text.lower())
+        if token not in STOPWORDS and (len(token) > 1 or token.isdigit())
+    ]
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough LLM token count (about four characters per token for English)"""
+    return (len(text) + 3) // 4
@@ -0,0 +1,131 @@
+# vector_store.py - Append-only file of full-precision embedding vectors
+import logging
+import os
+import tempfile
+import threading
+import uuid
+from pathlib import Path
+from typing import AbstractSet, Iterable, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class VectorStore:
+    """Unit float32 vectors in an append-only file, read back on demand
+
+    The search structures keep only compact codes in memory; the vectors
+    they were encoded from live here and are read with positioned reads
+    when a shortlist is rescored, a narrow scope is scanned exactly or the
+    ANN index is (re)built. Nothing is memory-mapped, so reading the store
+    does not grow the process's resident set.
+
+    Rows are only ever appended, so every index generation shares one
+    store and simply never looks at rows added after it was built. With
+    directory=None the file is an anonymous temporary file.
+    """
+
+    FILE_PREFIX = "vectors-"
+    FILE_SUFFIX = ".f32"
+
+    def __init__(self, dimension: int, directory: Optional[str] = None, name: Optional[str] = None,
+                 rows: Optional[int] = None):
+        self.dimension = dimension
+        self.row_bytes = dimension * 4
+        self._lock = threading.Lock()
+        if directory is None:
+            self.name = None
+            self.path = None
+            self._file = tempfile.TemporaryFile()
+            self.rows = 0
+            return
+
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        self.name = name or f"{self.FILE_PREFIX}{uuid.uuid4().hex[:12]}{self.FILE_SUFFIX}"
+        self.path = Path(directory) / self.name
+        if rows is None:
+            self._file = open(self.path, 'w+b')
+            self.rows = 0
+            return
+
+        # Reopen a saved store; rows past `rows` were never referenced by a snapshot
+        self._file = open(self.path, 'r+b')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < rows * self.row_bytes:
+            self._file.close()
+            raise ValueError(f"{self.path} holds {size // self.row_bytes} vectors, expected {rows}")
+        self._file.truncate(rows * self.row_bytes)
+        self.rows = rows
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def nbytes(self) -> int:
+        """Size of the file on disk"""
+        return self.rows * self.row_bytes
+
+    def append(self, vectors: np.ndarray) -> int:
+        """Write rows at the end of the file; returns the first new row number"""
+        data = np.ascontiguousarray(vectors, dtype=np.float32)
+        if data.ndim != 2 or data.shape[1] != self.dimension:
+            raise ValueError(f"Expected vectors of dimension {self.dimension}, got shape {data.shape}")
+        with self._lock:
+            start = self.rows
+            self._file.seek(start * self.row_bytes)
+            self._file.write(data.tobytes())
+            # Readers use positioned reads on the descriptor, past the buffer
+            self._file.flush()
+            self.rows += len(data)
+        return start
+
+    def _read_range(self, start: int, count: int) -> bytes:
+        offset, size = start * self.row_bytes, count * self.row_bytes
+        if hasattr(os, 'pread'):
+            return os.pread(self._file.fileno(), size, offset)
+        with self._lock:
+            self._file.seek(offset)
+            return self._file.read(size)
+
+    def read(self, rows: Iterable[int]) -> np.ndarray:
+        """Vectors of the given rows, in that order (runs of adjacent rows are read at once)"""
+        rows = np.fromiter(rows, dtype=np.int64) if not isinstance(rows, np.ndarray) else rows.astype(np.int64)
+        result = np.empty((len(rows), self.dimension), dtype=np.float32)
+        if not len(rows):
+            return result
+        order = np.argsort(rows, kind='stable')
+        ordered = rows[order]
+        breaks = np.flatnonzero(np.diff(ordered) > 1) + 1
+        for run in np.split(np.arange(len(ordered)), breaks):
+            first, last = int(ordered[run[0]]), int(ordered[run[-1]])
+            block = np.frombuffer(self._read_range(first, last - first + 1), dtype=np.float32)
+            block = block.reshape(-1, self.dimension)
+            result[order[run]] = block[ordered[run] - first]
+        return result
+
+    def flush(self):
+        """Make appended rows durable before a snapshot refers to them"""
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+    @classmethod
+    def remove_unused(cls, directory: str, keep: AbstractSet[str]) -> int:
+        """Delete store files in directory whose names are not in keep; returns how many
+
+        Generations still reading a deleted store keep working through
+        their open file handle.
+        """
+        removed = 0
+        for path in Path(directory).glob(f"{cls.FILE_PREFIX}*{cls.FILE_SUFFIX}"):
+            if path.name in keep:
+                continue
+            try:
+                path.unlink()
+                removed += 1
+            except OSError as e:
+                logger.warning(f"Could not remove unused vector store {path}: {str(e)}")
+        return removed